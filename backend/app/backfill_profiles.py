@@ -0,0 +1,54 @@
+from dotenv import load_dotenv
+
+from app.embedding import profile_vector
+from app.search import username_grams
+from app.storage.weaviate_store import connect_sync, ensure_schema_sync
+
+# Load environment variables
+load_dotenv()
+
+def backfill_profiles(force: bool = False):
+    """Fill in taste vectors and username search tokens on profiles stored before they existed.
+
+    Weaviate only: SQLite profiles are always written with their vector and search tokens.
+    """
+    client = connect_sync()
+    updated = 0
+    skipped = 0
+
+    try:
+        # Adds the usernameGrams property to collections created before it existed
+        ensure_schema_sync(client)
+        user_collection = client.collections.get("UserProfile")
+        for user in user_collection.iterator(include_vector=True):
+            username = user.properties.get("museUsername") or ""
+            changes = {}
+            vector = None
+
+            grams = username_grams(username)
+            if force or sorted(user.properties.get("usernameGrams") or []) != grams:
+                changes["usernameGrams"] = grams
+
+            if force or not user.vector:
+                vector = profile_vector(user.properties)
+                if vector is None:
+                    print(f"No taste data for @{username}, leaving it without a vector")
+
+            if not changes and vector is None:
+                skipped += 1
+                continue
+
+            try:
+                user_collection.data.update(uuid=user.uuid, properties=changes or None, vector=vector)
+                updated += 1
+            except Exception as e:
+                print(f"Error updating @{username}: {e}")
+    finally:
+        client.close()
+
+    print(f"Updated {updated} profiles, skipped {skipped}")
+
+if __name__ == "__main__":
+    # Run from backend/ with `python -m app.backfill_profiles`; pass force=True
+    # after changing app/embedding.py or app/search.py to rebuild every profile
+    backfill_profiles()
@@ -0,0 +1,127 @@
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# Artists and genres each make up half of the 0-100 compatibility score
+TASTE_FIELDS = ("topArtists", "topGenres")
+FIELD_POINTS = 50.0
+
+# uniform: every item in the user's list counts the same.
+# rank: an item at position r (from 0) weighs 1 / (r + 1), so sharing
+# someone's favourite artist counts for more than sharing their fifth.
+WEIGHTINGS = ("uniform", "rank")
+
+class Vocabulary:
+    """Integer ids for artist or genre names, assigned the first time a name is seen.
+
+    Ids are only meaningful within the process; the set of names grows
+    with the catalogue, not with the number of users.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def encode(self, items: Iterable[str]) -> np.ndarray:
+        """Ids of the distinct items, in the order they first appear"""
+        ids = self._ids
+        encoded = [ids.setdefault(item, len(ids)) for item in dict.fromkeys(items)]
+        return np.array(encoded, dtype=np.int64)
+
+VOCABULARIES = {field: Vocabulary() for field in TASTE_FIELDS}
+
+def item_weights(count: int, weighting: str = "uniform") -> np.ndarray:
+    """Weight of each position in a taste list of the given length"""
+    if weighting == "uniform":
+        return np.ones(count)
+    if weighting == "rank":
+        return 1.0 / np.arange(1, count + 1)
+    raise ValueError(f"Unknown weighting {weighting!r}, expected one of {WEIGHTINGS}")
+
+class _Rows:
+    """One taste field of many profiles as concatenated id arrays with row offsets (CSR layout)"""
+
+    def __init__(self, encoded: List[np.ndarray]):
+        self.counts = np.array([len(ids) for ids in encoded], dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])) if encoded else np.zeros(0, dtype=np.int64)
+        self.ids = np.concatenate(encoded) if encoded else np.zeros(0, dtype=np.int64)
+
+    def row_sums(self, values: np.ndarray) -> np.ndarray:
+        """Sum each row's entries of values along the last axis"""
+        # A zero column at the end keeps reduceat in bounds for a trailing empty row
+        padded = np.concatenate([values, np.zeros(values.shape[:-1] + (1,))], axis=-1)
+        sums = np.add.reduceat(padded, self.starts, axis=-1)
+        # reduceat returns the start element for empty rows instead of zero
+        return np.where(self.counts > 0, sums, 0.0)
+
+class TasteMatrix:
+    """Encoded artists and genres of many profiles, scored against users in one call.
+
+    Build it once for a set of candidates, then score one user against all
+    of them with ``score_one`` or many users with ``score_many``. Scores are
+    computed with gathers and segmented sums over integer ids rather than
+    per-pair set intersections.
+    """
+
+    def __init__(self, profiles: Sequence[dict]):
+        self.size = len(profiles)
+        self._rows = {
+            field: _Rows([VOCABULARIES[field].encode(profile.get(field) or []) for profile in profiles])
+            for field in TASTE_FIELDS
+        }
+
+    def _shared_fraction(self, field: str, users: Sequence[dict], weighting: str) -> np.ndarray:
+        """Weighted share of each user's items found in each profile, shape (users, profiles)"""
+        rows = self._rows[field]
+        lists = [user.get(field) or [] for user in users]
+        encoded = [VOCABULARIES[field].encode(items) for items in lists]
+        columns = np.unique(np.concatenate(encoded)) if encoded else np.zeros(0, dtype=np.int64)
+
+        # Dense weights over only the items these users listed; the extra
+        # last column stands for every item none of them listed
+        weights = np.zeros((len(users), len(columns) + 1))
+        totals = np.ones(len(users))
+        for index, (items, ids) in enumerate(zip(lists, encoded)):
+            if len(ids):
+                # A repeated item counts once, at its first position, but every
+                # entry counts towards the total, as in a plain list-length ratio
+                list_weights = item_weights(len(items), weighting)
+                first = {}
+                for position, item in enumerate(items):
+                    first.setdefault(item, position)
+                weights[index, np.searchsorted(columns, ids)] = list_weights[list(first.values())]
+                totals[index] = list_weights.sum()
+
+        positions = np.searchsorted(columns, rows.ids)
+        found = positions < len(columns)
+        found[found] = columns[positions[found]] == rows.ids[found]
+        positions[~found] = len(columns)
+
+        shared = rows.row_sums(weights[:, positions])
+        return shared / totals[:, None]
+
+    def score_many(self, users: Sequence[dict], weighting: str = "uniform") -> np.ndarray:
+        """Compatibility of every user with every profile, 0-100, shape (users, profiles)"""
+        if not users or not self.size:
+            return np.zeros((len(users), self.size))
+        total = sum(self._shared_fraction(field, users, weighting) for field in TASTE_FIELDS)
+        return np.round(total * FIELD_POINTS, 2)
+
+    def score_one(self, user: dict, weighting: str = "uniform") -> List[float]:
+        """Compatibility of one user with every profile, in profile order"""
+        return self.score_many([user], weighting)[0].tolist()
+
+def compatibility_score(user: dict, friend: dict, weighting: str = "uniform") -> float:
+    """Compatibility of user with friend, 0-100, from the share of user's artists and genres friend has.
+
+    The score is directional: it is measured against the user's lists, so
+    the two directions of a friendship can differ.
+    """
+    return TasteMatrix([friend]).score_one(user, weighting)[0]
+
+def shared_items(user_items: Sequence[str], friend_items: Sequence[str]) -> List[str]:
+    """Items of the user's list the friend also has, in the user's order"""
+    friend_set = set(friend_items or [])
+    return [item for item in dict.fromkeys(user_items or []) if item in friend_set]
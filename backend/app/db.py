@@ -0,0 +1,130 @@
+from fastapi import HTTPException
+import asyncio
+import os
+import logging
+import time
+from typing import Optional
+
+from app.storage.base import ProfileStore
+
+logger = logging.getLogger(__name__)
+
+# Process-wide profile store, chosen by MUSE_STORAGE and opened and closed
+# by the app lifespan in main.py
+_store: Optional[ProfileStore] = None
+
+def storage_backend() -> str:
+    """Name of the configured storage backend"""
+    return os.getenv("MUSE_STORAGE", "weaviate").lower()
+
+def get_store() -> ProfileStore:
+    """Return the configured profile store: Weaviate (default) or SQLite"""
+    global _store
+    if _store is None:
+        backend = storage_backend()
+        if backend == "weaviate":
+            from app.storage.weaviate_store import WeaviateStore
+            _store = WeaviateStore()
+        elif backend == "sqlite":
+            from app.storage.sqlite_store import SQLiteStore
+            _store = SQLiteStore(os.getenv("SQLITE_PATH", "muse.db"))
+        else:
+            raise ValueError(f"Unknown MUSE_STORAGE backend: {backend}")
+    return _store
+
+async def connect():
+    """Open the store's connections"""
+    await get_store().connect()
+
+async def close():
+    """Close the store if it was opened"""
+    global _store, _schema_ready
+    if _store is not None:
+        await _store.close()
+        _store = None
+    _schema_ready = False
+
+# Readiness latch: set once the schema has been verified, cleared when a
+# request runs into a schema error so the next request checks it again
+_schema_ready = False
+_schema_lock = asyncio.Lock()
+
+def schema_ready() -> bool:
+    return _schema_ready
+
+async def ensure_schema():
+    """Connect, then verify or create the storage schema, unless already done"""
+    global _schema_ready
+    if _schema_ready:
+        return
+
+    async with _schema_lock:
+        if _schema_ready:
+            return
+
+        # Connecting here rather than at import or startup keeps cold starts
+        # off the network; the first request or the warm-up task pays for it
+        store = get_store()
+        await store.connect()
+        await store.ensure_schema()
+        _schema_ready = True
+
+async def init_schema(max_retries: int = 3, retry_delay: float = 2):
+    """Startup step: verify the schema, retrying while the store warms up"""
+    for attempt in range(max_retries):
+        try:
+            await ensure_schema()
+            return
+        except Exception as e:
+            if attempt < max_retries - 1:
+                logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay} seconds...")
+                await asyncio.sleep(retry_delay)
+            else:
+                raise
+
+async def warm_up():
+    """Background startup step: connect and verify the schema before traffic needs it"""
+    try:
+        await init_schema()
+    except Exception as e:
+        logger.warning(f"Storage warm-up failed, requests will retry: {str(e)}")
+
+async def ping() -> float:
+    """Seconds one round trip to the store takes; raises if it is unreachable"""
+    await ensure_schema()
+    started = time.perf_counter()
+    await get_store().ping()
+    return time.perf_counter() - started
+
+def mark_schema_stale():
+    """Clear the readiness latch so the next request re-checks the schema"""
+    global _schema_ready
+    _schema_ready = False
+
+def is_schema_error(error: Exception) -> bool:
+    """Whether an error, or the error it was raised from, means the schema is missing"""
+    store = get_store()
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if store.is_schema_error(error):
+            return True
+        # Handlers re-raise storage errors as HTTPException, so follow the chain
+        error = error.__cause__ or error.__context__
+    return False
+
+async def require_schema():
+    """FastAPI dependency guarding routes that need the Muse schema"""
+    try:
+        await ensure_schema()
+    except Exception as e:
+        logger.error(f"Failed to create/verify schema: {str(e)}")
+        raise HTTPException(status_code=503, detail="Database not ready")
+
+    try:
+        yield
+    except Exception as e:
+        if is_schema_error(e):
+            logger.warning(f"Schema error seen, re-checking schema on next request: {str(e)}")
+            mark_schema_stale()
+        raise
@@ -1,43 +1,33 @@
-import weaviate
-from weaviate.classes.init import Auth
-from weaviate.classes.query import Filter
-import os
+import asyncio
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Weaviate client setup
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=os.getenv("WEAVIATE_URL"),
-    auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
-)
+from app import db
+from app.repository import delete_profile, fetch_profile
 
-def delete_user(spotify_id: str):
-    user_collection = client.collections.get("UserProfile")
-    
-    # Get the user
-    user_result = user_collection.query.fetch_objects(
-        filters=Filter.by_property("spotifyId").equal(spotify_id)
-    )
-    
-    if not user_result.objects:
-        print(f"User with Spotify ID {spotify_id} not found")
-        return
-    
-    user = user_result.objects[0]
-    print(f"Found user: {user.properties['displayName']} (@{user.properties['museUsername']})")
-    
+async def delete_user(spotify_id: str):
+    await db.connect()
     try:
-        # Delete the user using the UUID
-        user_collection.data.delete_by_id(user.uuid)
-        print(f"Successfully deleted user with Spotify ID {spotify_id}")
-    except Exception as e:
-        print(f"Error deleting user: {e}")
+        # Get the user
+        user = await fetch_profile(spotify_id)
+        if user is None:
+            print(f"User with Spotify ID {spotify_id} not found")
+            return
+        
+        print(f"Found user: {user.properties['displayName']} (@{user.properties['museUsername']})")
+        
+        try:
+            await delete_profile(spotify_id)
+            print(f"Successfully deleted user with Spotify ID {spotify_id}")
+        except Exception as e:
+            print(f"Error deleting user: {e}")
     finally:
-        client.close()
+        await db.close()
 
 if __name__ == "__main__":
+    # Run from backend/ with `python -m app.delete_user`; works with either MUSE_STORAGE backend
     spotify_id = "victoriaslo235"  # Your Spotify ID
-    delete_user(spotify_id)
-    print("\nYou can now log in again to recreate your profile with the correct schema.") 
\ No newline at end of file
+    asyncio.run(delete_user(spotify_id))
+    print("\nYou can now log in again to recreate your profile with the correct schema.")
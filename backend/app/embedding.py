@@ -0,0 +1,64 @@
+import hashlib
+import math
+from typing import Dict, Iterable, List, Optional
+
+# Size of the taste vectors stored on UserProfile objects. Changing it
+# requires re-embedding every profile (see backfill_profiles.py).
+DIMENSIONS = 256
+
+# How much each part of a profile contributes to the vector. Artists and
+# genres weigh the same, like in the compatibility score; recent tracks and
+# the words inside genre names ("stutter house" -> "house") add a softer
+# signal so near-misses still land close together.
+FIELD_WEIGHTS = {
+    "artist": 1.0,
+    "genre": 1.0,
+    "genre_word": 0.5,
+    "track": 0.35,
+}
+
+def _bucket(feature: str) -> tuple:
+    """Deterministically hash a feature to a vector index and sign"""
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "big")
+    return value % DIMENSIONS, 1.0 if (value >> 63) & 1 else -1.0
+
+def _add_field(vector: List[float], field: str, values: Iterable[str]):
+    """Add one normalized block of hashed features to the vector"""
+    block: Dict[int, float] = {}
+    for value in values:
+        index, sign = _bucket(f"{field}:{value.strip().lower()}")
+        block[index] = block.get(index, 0.0) + sign
+    norm = math.sqrt(sum(weight * weight for weight in block.values()))
+    if not norm:
+        return
+    scale = FIELD_WEIGHTS[field] / norm
+    for index, weight in block.items():
+        vector[index] += weight * scale
+
+def taste_vector(top_artists: List[str], top_genres: List[str],
+                 recent_tracks: Optional[List[str]] = None) -> Optional[List[float]]:
+    """Embed a user's taste as a unit vector using the hashing trick.
+
+    The embedding is local and deterministic: the same profile always maps
+    to the same vector, across processes and deployments. Returns None for
+    a profile with no taste data, which cannot be compared by cosine.
+    """
+    vector = [0.0] * DIMENSIONS
+    _add_field(vector, "artist", top_artists or [])
+    _add_field(vector, "genre", top_genres or [])
+    _add_field(vector, "genre_word", [word for genre in top_genres or [] for word in genre.split()])
+    _add_field(vector, "track", recent_tracks or [])
+
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        return None
+    return [value / norm for value in vector]
+
+def profile_vector(properties: Dict) -> Optional[List[float]]:
+    """Taste vector for a stored UserProfile's properties"""
+    return taste_vector(
+        properties.get("topArtists") or [],
+        properties.get("topGenres") or [],
+        properties.get("recentTracks") or [],
+    )
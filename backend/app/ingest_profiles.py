@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from app import db
+from app.embedding import profile_vector
+from app.repository import INGEST_BATCH_SIZE, IngestReport, ingest_profiles, profile_uuid, stored_properties
+from app.storage.weaviate_store import ensure_schema_sync, friendship_uuid
+from app.synthetic import generate_users
+
+def load_profiles(client, profiles: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+                  concurrent_requests: int = 2) -> IngestReport:
+    """Create or overwrite profiles through Weaviate's batch API.
+
+    Batches are sized dynamically unless ``batch_size`` is given. Profiles
+    already stored keep their object id; new ones get their deterministic
+    id, so loading the same data twice leaves one object per user. Friends
+    listed in a profile's ``friends`` are added as Friendship edges.
+    """
+    # Writing to a missing collection would let auto-schema create it
+    # without the configured tokenization and vector index
+    ensure_schema_sync(client)
+    user_collection = client.collections.get("UserProfile")
+    friendship_collection = client.collections.get("Friendship")
+    started = time.perf_counter()
+    report = IngestReport()
+
+    # One pass over the ids already stored, for profiles created before ids
+    # were deterministic and for resolving friends' usernames
+    existing = {}
+    spotify_ids = {}
+    for obj in user_collection.iterator(return_properties=["spotifyId", "museUsername"]):
+        existing[obj.properties["spotifyId"]] = obj.uuid
+        spotify_ids[obj.properties.get("museUsername")] = obj.properties["spotifyId"]
+    friend_lists = {}
+
+    if batch_size:
+        batching = user_collection.batch.fixed_size(batch_size=batch_size, concurrent_requests=concurrent_requests)
+    else:
+        batching = user_collection.batch.dynamic()
+    with batching as batch:
+        for profile in profiles:
+            report.received += 1
+            spotify_ids[profile["museUsername"]] = profile["spotifyId"]
+            if profile.get("friends"):
+                friend_lists[profile["spotifyId"]] = profile["friends"]
+            batch.add_object(
+                properties=stored_properties(profile),
+                uuid=existing.get(profile["spotifyId"]) or profile_uuid(profile["spotifyId"]),
+                vector=profile_vector(profile),
+            )
+
+    for failed in user_collection.batch.failed_objects:
+        report.add_error((failed.object_.properties or {}).get("spotifyId"), failed.message)
+    report.written = report.received - len(report.errors)
+
+    with friendship_collection.batch.dynamic() as batch:
+        for user_id, usernames in friend_lists.items():
+            for friend_id in {spotify_ids.get(username) for username in usernames} - {None, user_id}:
+                batch.add_object(
+                    properties={"userId": user_id, "friendId": friend_id},
+                    uuid=friendship_uuid(user_id, friend_id),
+                )
+    for failed in friendship_collection.batch.failed_objects:
+        report.add_error((failed.object_.properties or {}).get("userId"), f"Friendship not linked: {failed.message}")
+    report.seconds = time.perf_counter() - started
+    return report
+
+async def _ingest_with_store(profiles: List[Dict[str, Any]], batch_size: Optional[int]) -> IngestReport:
+    await db.connect()
+    try:
+        await db.ensure_schema()
+        return await ingest_profiles(profiles, batch_size=batch_size or INGEST_BATCH_SIZE)
+    finally:
+        await db.close()
+
+def ingest(profiles: Iterable[Dict[str, Any]], batch_size: Optional[int] = None,
+           concurrent_requests: int = 2) -> IngestReport:
+    """Load profiles into the configured store, through the batch API when it is Weaviate"""
+    if db.storage_backend() == "weaviate":
+        from app.storage.weaviate_store import connect_sync
+        client = connect_sync()
+        try:
+            return load_profiles(client, profiles, batch_size, concurrent_requests)
+        finally:
+            client.close()
+    return asyncio.run(_ingest_with_store(list(profiles), batch_size))
+
+def read_profiles(path: str) -> List[Dict[str, Any]]:
+    """Profiles from a JSON array file or a newline-delimited JSON file"""
+    with open(path) as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+def print_report(report: IngestReport):
+    summary = report.as_dict()
+    print(f"Wrote {summary['written']} of {summary['received']} profiles in {summary['seconds']}s "
+          f"({summary['objects_per_second']} objects/s), {summary['failed']} failed")
+    for error in report.errors[:20]:
+        print(f"  {error['spotifyId']}: {error['message']}")
+    if len(report.errors) > 20:
+        print(f"  ... and {len(report.errors) - 20} more")
+
+if __name__ == "__main__":
+    # Run from backend/, e.g. `python -m app.ingest_profiles users.jsonl`
+    # or `python -m app.ingest_profiles --synthetic 10000`
+    parser = argparse.ArgumentParser(description="Bulk load user profiles into the configured store")
+    parser.add_argument("path", nargs="?", help="JSON array or .jsonl file of profiles")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="generate N synthetic users instead")
+    parser.add_argument("--seed", type=int, default=0, help="seed for --synthetic")
+    parser.add_argument("--batch-size", type=int, help="fixed batch size (default: dynamic batching)")
+    parser.add_argument("--concurrent-requests", type=int, default=2, help="parallel batches with --batch-size")
+    args = parser.parse_args()
+    if not args.path and not args.synthetic:
+        parser.error("give a file of profiles or --synthetic N")
+
+    load_dotenv()
+    profiles = generate_users(args.synthetic, seed=args.seed) if args.synthetic else read_profiles(args.path)
+    print_report(ingest(profiles, args.batch_size, args.concurrent_requests))
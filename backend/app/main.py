@@ -1,16 +1,47 @@
 from fastapi import FastAPI
-from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import os
 
 # Load environment variables
 load_dotenv()
 
+from app import db, metrics, profiling, responses, spotify
+from app.token_cache import token_cache
+from app.profile_cache import profile_cache
+from app.search import search_cache
+from app.recommendations import recommendation_cache
+from app.taste_refresh import taste_refresher
+
+# Longest a readiness probe waits on each upstream before reporting it down
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background work without waiting on upstreams, and close every client on shutdown"""
+    # Clients are created on first use; the store connects and verifies its
+    # schema in the background so a slow upstream never delays startup, and
+    # requests that need storage wait for it through require_schema
+    warm_up = asyncio.create_task(db.warm_up())
+    taste_refresher.start()
+    yield
+    warm_up.cancel()
+    with suppress(asyncio.CancelledError):
+        await warm_up
+    await taste_refresher.stop()
+    await spotify.close()
+    auth.close()
+    await db.close()
+
 app = FastAPI(
     title="Muse API",
     description="API for Muse - Music Compatibility App",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=responses.APIResponse
 )
 
 # Configure CORS
@@ -22,6 +53,12 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
+# msgpack negotiation and gzip/brotli for large bodies
+responses.install(app)
+# Opt-in: only installed when PROFILING_TOKEN is set
+profiling.install(app)
+# Added last so it wraps every other middleware and times the whole request
+app.add_middleware(metrics.MetricsMiddleware)
 
 @app.get("/")
 async def root():
@@ -29,7 +66,50 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "token_cache": token_cache.stats(),
+        "profile_cache": profile_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "recommendation_cache": recommendation_cache.stats(),
+        "taste_refresh": taste_refresher.stats(),
+        "spotify": spotify.spotify_api.stats()
+    }
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is serving requests; touches no upstream"""
+    return {"status": "alive"}
+
+async def _check_upstream(ping) -> dict:
+    try:
+        latency = await asyncio.wait_for(ping, READINESS_TIMEOUT)
+        return {"status": "up", "latency_ms": round(latency * 1000, 1)}
+    except Exception as e:
+        return {"status": "down", "error": str(e) or type(e).__name__}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 200 once storage answers, with the round-trip latency of each upstream.
+
+    Only storage gates readiness. Spotify is reported but a Spotify outage
+    does not take instances out of rotation, since restarting them would
+    not help.
+    """
+    storage_status, spotify_status = await asyncio.gather(
+        _check_upstream(db.ping()),
+        _check_upstream(spotify.ping()),
+    )
+    ready = storage_status["status"] == "up"
+    return responses.APIResponse(
+        {"status": "ready" if ready else "not ready", "storage": storage_status, "spotify": spotify_status},
+        status_code=200 if ready else 503,
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Request and upstream call metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 # Import and include routers
 from app.routers import auth, users, music
@@ -0,0 +1,61 @@
+from dotenv import load_dotenv
+
+from app.storage.weaviate_store import connect_sync, ensure_schema_sync, friendship_uuid
+
+# Load environment variables
+load_dotenv()
+
+def migrate_friendships(clear: bool = False):
+    """Turn the friends arrays on UserProfile objects into Friendship edges.
+
+    Each listed friend becomes an edge from the profile's user to that
+    friend. Edges that already exist are left alone so their scores are
+    kept. With ``clear`` the migrated arrays are emptied afterwards.
+    Weaviate only: the SQLite store has always kept friendships as edges.
+    """
+    client = connect_sync()
+    created = 0
+
+    try:
+        # Edges written to a missing Friendship collection would let
+        # auto-schema create it without the configured properties
+        ensure_schema_sync(client)
+        user_collection = client.collections.get("UserProfile")
+        friendship_collection = client.collections.get("Friendship")
+        spotify_ids = {}
+        friend_lists = {}
+        for user in user_collection.iterator(return_properties=["spotifyId", "museUsername", "friends"]):
+            spotify_ids[user.properties.get("museUsername")] = user.properties["spotifyId"]
+            if user.properties.get("friends"):
+                friend_lists[user.uuid] = (user.properties["spotifyId"], user.properties["friends"])
+
+        existing = {str(edge.uuid) for edge in friendship_collection.iterator(return_properties=[])}
+        with friendship_collection.batch.dynamic() as batch:
+            for user_id, usernames in friend_lists.values():
+                for username in usernames:
+                    friend_id = spotify_ids.get(username)
+                    if friend_id is None:
+                        print(f"Friend @{username} of {user_id} not found, skipping")
+                        continue
+                    uuid = friendship_uuid(user_id, friend_id)
+                    if friend_id == user_id or uuid in existing:
+                        continue
+                    batch.add_object(properties={"userId": user_id, "friendId": friend_id}, uuid=uuid)
+                    existing.add(uuid)
+                    created += 1
+
+        failed = friendship_collection.batch.failed_objects
+        for error in failed:
+            print(f"Error creating edge {error.object_.properties}: {error.message}")
+        if clear and not failed:
+            for uuid in friend_lists:
+                user_collection.data.update(uuid=uuid, properties={"friends": []})
+    finally:
+        client.close()
+
+    print(f"Created {created - len(failed)} friendship edges from {len(friend_lists)} friend lists")
+
+if __name__ == "__main__":
+    # Run once from backend/ with `python -m app.migrate_friendships` after
+    # upgrading; pass clear=True to empty the old arrays once edges exist
+    migrate_friendships()
@@ -0,0 +1,162 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+@dataclass
+class StoredProfile:
+    """A UserProfile object as read from storage"""
+    uuid: UUID
+    properties: Dict[str, Any]
+
+    def copy(self) -> "StoredProfile":
+        # Handlers may edit list properties in place, so lists are copied too
+        return StoredProfile(
+            uuid=self.uuid,
+            properties={
+                key: list(value) if isinstance(value, list) else value
+                for key, value in self.properties.items()
+            },
+        )
+
+class ProfileCache:
+    """Bounded LRU/TTL cache of full UserProfile objects.
+
+    Entries are keyed by spotifyId with a secondary museUsername index.
+    Every write bumps a logical clock and records it against the
+    spotifyId; a reader that started before the latest write to a profile
+    is not allowed to fill the cache with what it read, so a rename or
+    taste update racing with a read can never leave a stale entry.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._usernames: Dict[str, str] = {}
+        self._clock = 0
+        self._last_write: "OrderedDict[str, int]" = OrderedDict()
+        self._last_write_floor = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def snapshot(self) -> int:
+        """Version to pass to put() for data read from storage after this call"""
+        return self._clock
+
+    def get(self, spotify_id: str) -> Optional[StoredProfile]:
+        entry = self._entries.get(spotify_id)
+        if entry is not None:
+            profile, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(spotify_id)
+                self.hits += 1
+                return profile.copy()
+            self._remove(spotify_id)
+        self.misses += 1
+        return None
+
+    def get_by_username(self, username: str) -> Optional[StoredProfile]:
+        spotify_id = self._usernames.get(username)
+        if spotify_id is None:
+            self.misses += 1
+            return None
+        return self.get(spotify_id)
+
+    def put(self, profile: StoredProfile, version: Optional[int] = None):
+        """Cache a profile read at ``version``, unless it was written since"""
+        if not self.enabled:
+            return
+        spotify_id = profile.properties["spotifyId"]
+        if version is not None and self._written_at(spotify_id) > version:
+            self.stale_fills += 1
+            return
+
+        self._remove(spotify_id)
+        self._entries[spotify_id] = (profile.copy(), time.monotonic() + self.ttl)
+        username = profile.properties.get("museUsername")
+        if username:
+            self._usernames[username] = spotify_id
+        while len(self._entries) > self.max_size:
+            evicted_id, (evicted, _) = self._entries.popitem(last=False)
+            self._drop_username(evicted_id, evicted)
+            self.evictions += 1
+
+    def write(self, profile: StoredProfile):
+        """Record a write and cache the written profile"""
+        self._record_write(profile.properties["spotifyId"])
+        self.put(profile)
+
+    def update(self, spotify_id: str, changes: Dict[str, Any]):
+        """Record a partial write and apply it to the cached profile in place"""
+        self._record_write(spotify_id)
+        entry = self._entries.get(spotify_id)
+        if entry is None:
+            return
+        cached, expires_at = entry
+        profile = cached.copy()
+        profile.properties.update(changes)
+        self._drop_username(spotify_id, cached)
+        self._entries[spotify_id] = (profile, expires_at)
+        username = profile.properties.get("museUsername")
+        if username:
+            self._usernames[username] = spotify_id
+
+    def invalidate(self, spotify_id: str):
+        """Record a write and drop the cached profile"""
+        self._record_write(spotify_id)
+        self._remove(spotify_id)
+
+    def clear(self):
+        self._clock += 1
+        self._last_write.clear()
+        self._last_write_floor = self._clock
+        self._entries.clear()
+        self._usernames.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "stale_fills": self.stale_fills,
+        }
+
+    def _record_write(self, spotify_id: str):
+        self._clock += 1
+        self._last_write[spotify_id] = self._clock
+        self._last_write.move_to_end(spotify_id)
+        # Forget the oldest versions but remember the newest one forgotten, so
+        # a forgotten key still counts as written no earlier than that
+        while len(self._last_write) > 2 * max(self.max_size, 1):
+            _, forgotten = self._last_write.popitem(last=False)
+            self._last_write_floor = max(self._last_write_floor, forgotten)
+
+    def _written_at(self, spotify_id: str) -> int:
+        return self._last_write.get(spotify_id, self._last_write_floor)
+
+    def _remove(self, spotify_id: str):
+        entry = self._entries.pop(spotify_id, None)
+        if entry is not None:
+            self._drop_username(spotify_id, entry[0])
+
+    def _drop_username(self, spotify_id: str, profile: StoredProfile):
+        username = profile.properties.get("museUsername")
+        if username and self._usernames.get(username) == spotify_id:
+            del self._usernames[username]
+
+profile_cache = ProfileCache(
+    max_size=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "60")),
+)
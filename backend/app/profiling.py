@@ -0,0 +1,84 @@
+import hmac
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Requests carrying this header with the admin token are profiled
+PROFILE_HEADER = b"x-muse-profile"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+def _profile_name(method: str) -> str:
+    # Paths can carry access tokens, so file names use only the time and method
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{os.urandom(3).hex()}-{method.lower()}.speedscope.json"
+
+class ProfilingMiddleware:
+    """ASGI middleware that runs a sampling profiler around requests that ask for it.
+
+    A request is profiled when it sends ``X-Muse-Profile: <PROFILING_TOKEN>``.
+    The profile is written to PROFILE_DIR in speedscope format (open it at
+    https://www.speedscope.app) and its file name is returned in the
+    ``X-Muse-Profile-File`` response header.
+    """
+
+    def __init__(self, app, token: str, directory: str = PROFILE_DIR, interval: float = PROFILE_INTERVAL):
+        # Imported here so the profiler is only loaded when profiling is configured
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        self.app = app
+        self.token = token.encode()
+        self.directory = directory
+        self.interval = interval
+        self._profiler_class = Profiler
+        self._renderer_class = SpeedscopeRenderer
+        os.makedirs(directory, exist_ok=True)
+
+    def _requested(self, scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, self.token)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = _profile_name(scope["method"])
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-muse-profile-file", name.encode())]
+            await send(message)
+
+        profiler = self._profiler_class(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            profiler.stop()
+            path = os.path.join(self.directory, name)
+            with open(path, "w") as f:
+                f.write(profiler.output(self._renderer_class()))
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            logger.warning(f"Profiled {scope['method']} {route} in {profiler.last_session.duration:.3f}s -> {path}")
+
+def install(app, token: Optional[str] = None):
+    """Add the profiling middleware when a profiling token is configured.
+
+    Without a token nothing is added, so requests pay no profiling cost at all.
+    """
+    token = PROFILING_TOKEN if token is None else token
+    if not token:
+        return
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        logger.warning("PROFILING_TOKEN is set but pyinstrument is not installed; request profiling is off")
+        return
+    app.add_middleware(ProfilingMiddleware, token=token)
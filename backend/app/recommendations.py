@@ -0,0 +1,105 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Friends whose own friends are read per traversal, and most candidates scored
+MAX_EXPANDED_FRIENDS = int(os.getenv("RECOMMEND_MAX_FRIENDS", "200"))
+MAX_SCORED_CANDIDATES = int(os.getenv("RECOMMEND_MAX_CANDIDATES", "300"))
+
+# Points each mutual friend adds to a candidate's 0-100 compatibility score
+MUTUAL_FRIEND_WEIGHT = 10.0
+
+def recommendation_score(mutual_friends: int, compatibility_score: float) -> float:
+    """Rank of a friends-of-friends candidate: shared friends plus taste compatibility"""
+    return round(compatibility_score + MUTUAL_FRIEND_WEIGHT * mutual_friends, 2)
+
+class RecommendationCache:
+    """Ranked friends-of-friends per user, dropped when the graph around them changes.
+
+    A user's recommendations depend on their own edges and their friends'
+    edges, so each entry remembers the friends it was computed from. When
+    the edge between A and B changes, A, B and every cached user with A or
+    B among their friends are dropped. Results computed while any edge
+    changed are not cached, since they may have read the graph half way
+    through the change.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # friend id -> cached users whose recommendations went through that friend
+        self._through: Dict[str, Set[str]] = {}
+        self._clock = 0
+
+    def snapshot(self) -> int:
+        """Version to pass to put() for a traversal started after this call"""
+        return self._clock
+
+    def get(self, spotify_id: str) -> Optional[List[Dict[str, Any]]]:
+        entry = self._entries.get(spotify_id)
+        if entry is not None:
+            results, _, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(spotify_id)
+                self.hits += 1
+                return results
+            self._remove(spotify_id)
+        self.misses += 1
+        return None
+
+    def put(self, spotify_id: str, friend_ids: Iterable[str], results: List[Dict[str, Any]], version: int):
+        if self.max_size <= 0 or version != self._clock:
+            return
+        self._remove(spotify_id)
+        friends = frozenset(friend_ids)
+        self._entries[spotify_id] = (results, friends, time.monotonic() + self.ttl)
+        for friend_id in friends:
+            self._through.setdefault(friend_id, set()).add(spotify_id)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_edge(self, user_id: str, friend_id: str):
+        """Drop every entry the friendship between user_id and friend_id could change"""
+        self._clock += 1
+        affected = {user_id, friend_id}
+        affected |= self._through.get(user_id, set()) | self._through.get(friend_id, set())
+        for spotify_id in affected:
+            if spotify_id in self._entries:
+                self._remove(spotify_id)
+                self.invalidations += 1
+
+    def clear(self):
+        self._clock += 1
+        self._entries.clear()
+        self._through.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, spotify_id: str):
+        entry = self._entries.pop(spotify_id, None)
+        if entry is None:
+            return
+        for friend_id in entry[1]:
+            users = self._through.get(friend_id)
+            if users is not None:
+                users.discard(spotify_id)
+                if not users:
+                    del self._through[friend_id]
+
+recommendation_cache = RecommendationCache(
+    max_size=int(os.getenv("RECOMMEND_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("RECOMMEND_CACHE_TTL", "300")),
+)
@@ -0,0 +1,331 @@
+from weaviate.util import generate_uuid5
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+import asyncio
+import hashlib
+import json
+import time
+
+from app.db import get_store
+from app.embedding import profile_vector
+from app.profile_cache import StoredProfile, profile_cache
+from app.recommendations import recommendation_cache
+from app.search import username_grams, search_cache
+from app.storage.base import LEGACY_PROPERTIES, ProfileExistsError, ProfileRecord
+
+# Keys resolved per query; larger key lists are split into pages fetched concurrently
+PAGE_SIZE = 100
+
+# Profiles per store write during bulk ingest, and how many writes run at once
+INGEST_BATCH_SIZE = 200
+INGEST_CONCURRENCY = 4
+
+@dataclass
+class IngestReport:
+    """Outcome of a bulk profile ingest"""
+    received: int = 0
+    written: int = 0
+    errors: List[Dict[str, str]] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def add_error(self, spotify_id: Optional[str], message: str):
+        self.errors.append({"spotifyId": spotify_id, "message": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "written": self.written,
+            "failed": len(self.errors),
+            "seconds": round(self.seconds, 3),
+            "objects_per_second": round(self.written / self.seconds, 1) if self.seconds else 0.0,
+            "errors": self.errors,
+        }
+
+@dataclass
+class ProfileLookup:
+    """Profiles resolved by one batched fetch, indexed by the key they were requested by"""
+    by_spotify_id: Dict[str, StoredProfile] = field(default_factory=dict)
+    by_username: Dict[str, StoredProfile] = field(default_factory=dict)
+
+def _unique(values: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(value for value in values if value))
+
+
+async def fetch_profiles(spotify_ids: Iterable[str] = (), usernames: Iterable[str] = (),
+                         properties: Optional[Sequence[str]] = None) -> ProfileLookup:
+    """Resolve many users by spotifyId and/or museUsername in as few queries as possible.
+
+    Profiles are served from the profile cache when present; the rest are
+    fetched in one query per page of keys. ``properties`` limits what is
+    read from storage when the cache is disabled; with the cache enabled
+    full profiles are read so they can be cached.
+    """
+    lookup = ProfileLookup()
+    keys = []
+    for spotify_id in _unique(spotify_ids):
+        cached = profile_cache.get(spotify_id)
+        if cached:
+            lookup.by_spotify_id[spotify_id] = cached
+        else:
+            keys.append(("spotifyId", spotify_id))
+    for username in _unique(usernames):
+        cached = profile_cache.get_by_username(username)
+        if cached:
+            lookup.by_username[username] = cached
+        else:
+            keys.append(("museUsername", username))
+    if not keys:
+        return lookup
+
+    return_properties = None
+    if properties is not None and not profile_cache.enabled:
+        return_properties = _unique(list(properties) + ["spotifyId", "museUsername"])
+
+    version = profile_cache.snapshot()
+    store = get_store()
+    pages = await asyncio.gather(*[
+        store.fetch_profiles(keys[start:start + PAGE_SIZE], return_properties)
+        for start in range(0, len(keys), PAGE_SIZE)
+    ])
+
+    wanted_ids = {value for name, value in keys if name == "spotifyId"}
+    wanted_usernames = {value for name, value in keys if name == "museUsername"}
+    for profiles in pages:
+        for profile in profiles:
+            spotify_id = profile.properties.get("spotifyId")
+            username = profile.properties.get("museUsername")
+            matched = False
+            if spotify_id in wanted_ids and spotify_id not in lookup.by_spotify_id:
+                lookup.by_spotify_id[spotify_id] = profile
+                matched = True
+            if username in wanted_usernames and username not in lookup.by_username:
+                lookup.by_username[username] = profile
+                matched = True
+            if matched:
+                profile_cache.put(profile, version)
+    return lookup
+
+async def fetch_profile(spotify_id: str, properties: Optional[Sequence[str]] = None) -> Optional[StoredProfile]:
+    """Resolve a single user by spotifyId"""
+    lookup = await fetch_profiles(spotify_ids=[spotify_id], properties=properties)
+    return lookup.by_spotify_id.get(spotify_id)
+
+def profile_uuid(spotify_id: str) -> str:
+    """Deterministic id of a user's profile, so repeated writes of one user land on one object"""
+    return generate_uuid5(spotify_id, "UserProfile")
+
+def stored_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Profile properties plus the derived ones that are only stored for indexing"""
+    stored = {key: value for key, value in properties.items() if key not in LEGACY_PROPERTIES}
+    stored["usernameGrams"] = username_grams(properties["museUsername"])
+    return stored
+
+async def insert_profile(properties: Dict[str, Any]) -> StoredProfile:
+    """Store a new profile with its taste vector and search tokens, and cache it.
+
+    If the user already has a profile, e.g. one a concurrent first login
+    just created, nothing is written and the stored profile is returned.
+    """
+    try:
+        uuid = await get_store().insert_profile(ProfileRecord(
+            uuid=profile_uuid(properties["spotifyId"]),
+            properties=stored_properties(properties),
+            vector=profile_vector(properties),
+        ))
+    except ProfileExistsError:
+        profile_cache.invalidate(properties["spotifyId"])
+        existing = await fetch_profile(properties["spotifyId"])
+        if existing is None:
+            raise
+        return existing
+    profile = StoredProfile(uuid=uuid, properties={
+        key: value for key, value in properties.items() if key not in LEGACY_PROPERTIES
+    })
+    profile_cache.write(profile)
+    search_cache.clear()
+    return profile
+
+async def _existing_uuids(spotify_ids: List[str]) -> Dict[str, UUID]:
+    """Ids of already stored profiles, which may predate deterministic ids"""
+    store = get_store()
+    pages = await asyncio.gather(*[
+        store.fetch_profiles([("spotifyId", spotify_id) for spotify_id in spotify_ids[start:start + PAGE_SIZE]], ["spotifyId"])
+        for start in range(0, len(spotify_ids), PAGE_SIZE)
+    ])
+    wanted = set(spotify_ids)
+    return {
+        profile.properties["spotifyId"]: profile.uuid
+        for profiles in pages for profile in profiles
+        if profile.properties.get("spotifyId") in wanted
+    }
+
+async def ingest_profiles(profiles: List[Dict[str, Any]], batch_size: int = INGEST_BATCH_SIZE,
+                          concurrency: int = INGEST_CONCURRENCY) -> IngestReport:
+    """Create or overwrite many profiles with batched inserts.
+
+    Each profile is written to its existing object or to its deterministic
+    id, so re-running an ingest overwrites instead of duplicating. When a
+    spotifyId appears more than once the last copy wins. Friends listed in
+    a profile's ``friends`` are added as friendship edges.
+    """
+    started = time.perf_counter()
+    report = IngestReport(received=len(profiles))
+    unique = list({profile["spotifyId"]: profile for profile in profiles}.values())
+    existing = await _existing_uuids([profile["spotifyId"] for profile in unique])
+    records = [
+        ProfileRecord(
+            uuid=existing.get(profile["spotifyId"]) or profile_uuid(profile["spotifyId"]),
+            properties=stored_properties(profile),
+            vector=profile_vector(profile),
+        )
+        for profile in unique
+    ]
+
+    store = get_store()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write_chunk(chunk: List[ProfileRecord]):
+        async with semaphore:
+            try:
+                errors = await store.upsert_profiles(chunk)
+            except Exception as e:
+                for record in chunk:
+                    report.add_error(record.properties["spotifyId"], str(e))
+                return
+        for index, message in errors.items():
+            report.add_error(chunk[index].properties["spotifyId"], message)
+        report.written += len(chunk) - len(errors)
+
+    await asyncio.gather(*[
+        write_chunk(records[start:start + batch_size])
+        for start in range(0, len(records), batch_size)
+    ])
+
+    for profile in unique:
+        profile_cache.invalidate(profile["spotifyId"])
+    search_cache.clear()
+
+    friend_lists = {profile["spotifyId"]: profile["friends"] for profile in unique if profile.get("friends")}
+    try:
+        await link_friends(friend_lists)
+    except Exception as e:
+        for spotify_id in friend_lists:
+            report.add_error(spotify_id, f"Profile written but friends not linked: {e}")
+    report.seconds = time.perf_counter() - started
+    return report
+
+async def update_profile(spotify_id: str, uuid: UUID, changes: Dict[str, Any],
+                         vector: Optional[List[float]] = None):
+    """Write changed properties of a profile, and its new taste vector if given, and apply them to the cached copy"""
+    properties = dict(changes)
+    if "museUsername" in changes:
+        properties["usernameGrams"] = username_grams(changes["museUsername"])
+        search_cache.clear()
+    try:
+        await get_store().update_profile(uuid, properties, vector)
+    except Exception:
+        # The write may or may not have landed, so stop serving the cached copy
+        profile_cache.invalidate(spotify_id)
+        raise
+    profile_cache.update(spotify_id, changes)
+
+async def delete_profile(spotify_id: str) -> bool:
+    """Remove a user's profile and friendships, returning whether a profile was found"""
+    profile = await fetch_profile(spotify_id, properties=["spotifyId"])
+    if profile is None:
+        return False
+    try:
+        await get_store().delete_profile(profile.uuid)
+    finally:
+        profile_cache.invalidate(spotify_id)
+        search_cache.clear()
+    friend_ids = await fetch_friendships(spotify_id)
+    await asyncio.gather(*[delete_friendship(spotify_id, friend_id) for friend_id in friend_ids])
+    return True
+
+async def find_similar_profiles(vector: List[float], exclude_spotify_id: Optional[str] = None,
+                                limit: int = 10) -> List[Tuple[StoredProfile, float]]:
+    """Nearest profiles to a taste vector by cosine distance, closest first"""
+    return await get_store().nearest_profiles(
+        vector, exclude_spotify_id, limit,
+        properties=["spotifyId", "displayName", "museUsername", "topArtists", "topGenres"],
+    )
+
+async def search_profiles(grams: List[str], limit: int) -> List[StoredProfile]:
+    """Profiles indexed under every one of the given username search tokens"""
+    return await get_store().search_usernames(grams, limit, properties=["spotifyId", "displayName", "museUsername"])
+
+def taste_fingerprint(properties: Dict[str, Any]) -> str:
+    """Short hash of the profile data compatibility scores are computed from"""
+    taste = [properties.get("topArtists") or [], properties.get("topGenres") or []]
+    return hashlib.blake2b(json.dumps(taste).encode("utf-8"), digest_size=8).hexdigest()
+
+async def fetch_friendship(user_id: str, friend_id: str) -> Optional[Dict[str, Any]]:
+    """Read one directed friendship edge"""
+    return await get_store().fetch_friendship(user_id, friend_id)
+
+async def fetch_friendships(user_id: str) -> Dict[str, Dict[str, Any]]:
+    """Read every edge starting at user_id, keyed by friendId"""
+    return await get_store().fetch_friendships(user_id)
+
+async def fetch_friendship_page(user_id: str, after: Optional[str] = None, limit: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    """Read the next limit edges starting at user_id, in friendId order after the cursor"""
+    return await get_store().fetch_friendship_page(user_id, after, limit)
+
+async def fetch_friend_ids(user_ids: List[str]) -> Dict[str, List[str]]:
+    """Friend ids of many users, keyed by userId, in one query per page of users"""
+    store = get_store()
+    pages = await asyncio.gather(*[
+        store.fetch_friend_ids(user_ids[start:start + PAGE_SIZE])
+        for start in range(0, len(user_ids), PAGE_SIZE)
+    ])
+    return {user_id: friend_ids for page in pages for user_id, friend_ids in page.items()}
+
+def _edges_changed(pairs: Iterable[Tuple[str, str]]):
+    for user_id, friend_id in pairs:
+        recommendation_cache.invalidate_edge(user_id, friend_id)
+
+async def save_friendships(edges: List[Dict[str, Any]]):
+    """Create or overwrite friendship edges in one batch"""
+    if not edges:
+        return
+    try:
+        await get_store().save_friendships(edges)
+    finally:
+        _edges_changed((edge["userId"], edge["friendId"]) for edge in edges)
+
+async def refresh_friendships(edges: List[Dict[str, Any]]):
+    """Store recomputed scores on edges that still exist, without recreating deleted ones"""
+    if edges:
+        await get_store().refresh_friendships(edges)
+
+async def delete_friendship(user_id: str, friend_id: str):
+    """End a friendship by removing the edges in both directions"""
+    store = get_store()
+    try:
+        await asyncio.gather(
+            store.delete_friendship(user_id, friend_id),
+            store.delete_friendship(friend_id, user_id),
+        )
+    finally:
+        _edges_changed([(user_id, friend_id)])
+
+async def link_friends(friend_lists: Dict[str, List[str]]) -> int:
+    """Add an edge from each user to every friend listed by museUsername, returning how many were written.
+
+    The edges carry no scores yet; reads compute and store them on first use.
+    """
+    lookup = await fetch_profiles(
+        usernames=[username for usernames in friend_lists.values() for username in usernames],
+        properties=["spotifyId"],
+    )
+    edges = []
+    for spotify_id, usernames in friend_lists.items():
+        for username in _unique(usernames):
+            friend = lookup.by_username.get(username)
+            if friend and friend.properties["spotifyId"] != spotify_id:
+                edges.append({"userId": spotify_id, "friendId": friend.properties["spotifyId"]})
+    for start in range(0, len(edges), INGEST_BATCH_SIZE):
+        await save_friendships(edges[start:start + INGEST_BATCH_SIZE])
+    return len(edges)
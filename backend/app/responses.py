@@ -0,0 +1,171 @@
+import gzip
+import os
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Mapping, Optional
+from uuid import UUID
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.datastructures import MutableHeaders
+
+# Optional: msgpack responses and brotli compression are offered only when installed
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", MSGPACK_MEDIA_TYPE, "application/x-ndjson", "text/")
+
+# Set per request by ResponseFormatMiddleware when the client accepts msgpack
+_use_msgpack: ContextVar[bool] = ContextVar("use_msgpack", default=False)
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Type is not msgpack serializable: {type(obj).__name__}")
+
+class APIResponse(JSONResponse):
+    """Default response class: orjson-encoded JSON, or msgpack when the client asks.
+
+    Endpoints on hot paths return this directly so FastAPI skips
+    jsonable_encoder and response_model validation; the content is encoded
+    in one pass. Pydantic models in the content are dumped without being
+    validated again, so build them with ``model_construct``.
+    """
+
+    def __init__(self, content: Any, status_code: int = 200, headers: Optional[Mapping[str, str]] = None,
+                 media_type: Optional[str] = None, background: Optional[BackgroundTask] = None):
+        negotiated = _use_msgpack.get()
+        if negotiated:
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code, headers, media_type, background)
+        if negotiated:
+            self.headers.add_vary_header("Accept")
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return msgpack.packb(content, default=_msgpack_default)
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+def dumps(content: Any) -> bytes:
+    """Encode one value as compact JSON, e.g. a line of an NDJSON stream"""
+    return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+class ResponseFormatMiddleware:
+    """ASGI middleware that lets internal consumers ask for msgpack with ``Accept: application/msgpack``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1")
+                break
+        token = _use_msgpack.set(MSGPACK_MEDIA_TYPE in accept)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _use_msgpack.reset(token)
+
+def _accepted_encoding(scope) -> Optional[str]:
+    """Best content coding the client accepts: br when available, then gzip"""
+    offered = set()
+    for name, value in scope["headers"]:
+        if name == b"accept-encoding":
+            for part in value.decode("latin-1").split(","):
+                coding, _, params = part.partition(";")
+                quality = params.strip()
+                try:
+                    accepted = not quality.startswith("q=") or float(quality[2:]) > 0
+                except ValueError:
+                    accepted = False
+                if accepted:
+                    offered.add(coding.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+class CompressionMiddleware:
+    """ASGI middleware compressing large responses with brotli or gzip.
+
+    Only complete bodies are compressed; streamed responses pass through
+    untouched so their first chunks are not held back.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        encoding = _accepted_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            # Everything after the first body chunk passes through as is
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            compress = (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if compress:
+                if encoding == "br":
+                    body = brotli.compress(body, quality=4)
+                else:
+                    body = gzip.compress(body, compresslevel=5)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+def install(app):
+    """Add content negotiation and compression to the app"""
+    app.add_middleware(CompressionMiddleware)
+    if msgpack is not None:
+        app.add_middleware(ResponseFormatMiddleware)
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, Request
-from fastapi.responses import RedirectResponse, JSONResponse
-import spotipy
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+import requests
 from spotipy.oauth2 import SpotifyOAuth
 import os
 from typing import Optional
 
+from app.token_cache import token_cache
+
 router = APIRouter()
 
 # Spotify OAuth configuration
@@ -12,27 +15,49 @@ SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 REDIRECT_URI = "http://localhost:3000/api/auth/callback"  # Frontend callback URL
 
-sp_oauth = SpotifyOAuth(
-    client_id=SPOTIFY_CLIENT_ID,
-    client_secret=SPOTIFY_CLIENT_SECRET,
-    redirect_uri=REDIRECT_URI,
-    scope="user-read-private user-read-email user-top-read user-read-recently-played"
-)
+# Built on first use and closed by the app lifespan, so importing the app does no I/O
+_sp_oauth: Optional[SpotifyOAuth] = None
+_session: Optional[requests.Session] = None
+
+def get_oauth() -> SpotifyOAuth:
+    """Return the shared Spotify OAuth helper, whose token requests reuse one pooled session"""
+    global _sp_oauth, _session
+    if _sp_oauth is None:
+        _session = requests.Session()
+        _sp_oauth = SpotifyOAuth(
+            client_id=SPOTIFY_CLIENT_ID,
+            client_secret=SPOTIFY_CLIENT_SECRET,
+            redirect_uri=REDIRECT_URI,
+            scope="user-read-private user-read-email user-top-read user-read-recently-played",
+            requests_session=_session
+        )
+    return _sp_oauth
+
+def close():
+    """Close the OAuth helper's HTTP session if it was opened"""
+    global _sp_oauth, _session
+    if _session is not None:
+        _session.close()
+    _sp_oauth = None
+    _session = None
 
 @router.get("/login")
 async def login():
     """Get Spotify login URL"""
-    auth_url = sp_oauth.get_authorize_url()
+    auth_url = get_oauth().get_authorize_url()
     return {"url": auth_url}
 
 @router.get("/callback")
 async def callback(code: str):
     """Handle Spotify OAuth callback"""
     try:
-        token_info = sp_oauth.get_access_token(code)
+        # spotipy blocks on the token request, so it runs off the event loop
+        token_info = await run_in_threadpool(get_oauth().get_access_token, code)
         if not token_info:
             raise HTTPException(status_code=400, detail="Failed to get access token")
         
+        token_cache.set_expiry(token_info["access_token"], token_info["expires_in"])
+        
         # Return JSON response with access token
         return JSONResponse({
             "access_token": token_info["access_token"],
@@ -46,7 +71,8 @@ async def callback(code: str):
 async def refresh_token(refresh_token: str):
     """Refresh Spotify access token"""
     try:
-        token_info = sp_oauth.refresh_access_token(refresh_token)
+        token_info = await run_in_threadpool(get_oauth().refresh_access_token, refresh_token)
+        token_cache.set_expiry(token_info["access_token"], token_info["expires_in"])
         return {"access_token": token_info["access_token"]}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
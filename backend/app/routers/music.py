@@ -1,27 +1,81 @@
-from fastapi import APIRouter, HTTPException
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from fastapi import APIRouter, HTTPException, Header, Response
+from fastapi.responses import JSONResponse
+import asyncio
+import hashlib
+import json
 import os
-from typing import List, Dict
-from collections import Counter
+import time
+from typing import Any, List, Dict, Optional
+from collections import Counter, OrderedDict
+
+from app.spotify import SpotifyError, SpotifySession, spotify_http_error
+from app.token_cache import token_cache
 
 router = APIRouter()
 
-# Spotify client setup
-sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-    client_id=os.getenv("SPOTIFY_CLIENT_ID"),
-    client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
-    redirect_uri="http://localhost:8000/api/auth/callback",
-    scope="user-read-private user-read-email user-top-read user-read-recently-played"
-))
+class VibeCache:
+    """Per-user vibe analysis results with their ETag, kept for ``ttl`` seconds"""
+
+    def __init__(self, ttl: float = 600, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[tuple]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        payload, etag, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return payload, etag
+
+    def put(self, user_id: str, payload: Dict[str, Any], etag: str):
+        self._entries[user_id] = (payload, etag, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+vibe_cache = VibeCache(ttl=float(os.getenv("VIBE_CACHE_TTL", "600")))
+
+def compute_etag(payload: Dict[str, Any]) -> str:
+    """Strong ETag from a hash of the analysis data"""
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+def format_artists(items: List[Dict]) -> List[Dict]:
+    """Reduce Spotify artist objects to name and id"""
+    return [{"name": artist["name"], "id": artist["id"]} for artist in items]
+
+def count_genres(items: List[Dict]) -> List[Dict]:
+    """Count genres across Spotify artist objects and return the 10 most common"""
+    genres = []
+    for artist in items:
+        genres.extend(artist["genres"])
+    
+    # Count and sort genres
+    genre_counts = Counter(genres)
+    return [{"genre": genre, "count": count} for genre, count in genre_counts.most_common(10)]
+
+def format_tracks(items: List[Dict]) -> List[Dict]:
+    """Reduce Spotify play history items to track name, first artist and id"""
+    return [{
+        "name": item["track"]["name"],
+        "artist": item["track"]["artists"][0]["name"],
+        "id": item["track"]["id"]
+    } for item in items]
 
 @router.get("/top-artists/{access_token}")
 async def get_top_artists(access_token: str):
     """Get user's top artists"""
     try:
-        sp.set_auth(access_token)
-        results = sp.current_user_top_artists(limit=20, time_range="medium_term")
-        return [{"name": artist["name"], "id": artist["id"]} for artist in results["items"]]
+        async with SpotifySession(access_token) as spotify:
+            results = await spotify.top_artists(limit=20, time_range="medium_term")
+        return format_artists(results["items"])
+    except SpotifyError as e:
+        raise spotify_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -29,15 +83,11 @@ async def get_top_artists(access_token: str):
 async def get_top_genres(access_token: str):
     """Get user's top genres"""
     try:
-        sp.set_auth(access_token)
-        results = sp.current_user_top_artists(limit=50, time_range="medium_term")
-        genres = []
-        for artist in results["items"]:
-            genres.extend(artist["genres"])
-        
-        # Count and sort genres
-        genre_counts = Counter(genres)
-        return [{"genre": genre, "count": count} for genre, count in genre_counts.most_common(10)]
+        async with SpotifySession(access_token) as spotify:
+            results = await spotify.top_artists(limit=50, time_range="medium_term")
+        return count_genres(results["items"])
+    except SpotifyError as e:
+        raise spotify_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -45,46 +95,68 @@ async def get_top_genres(access_token: str):
 async def get_recent_tracks(access_token: str):
     """Get user's recently played tracks"""
     try:
-        sp.set_auth(access_token)
-        results = sp.current_user_recently_played(limit=20)
-        return [{
-            "name": item["track"]["name"],
-            "artist": item["track"]["artists"][0]["name"],
-            "id": item["track"]["id"]
-        } for item in results["items"]]
+        async with SpotifySession(access_token) as spotify:
+            results = await spotify.recently_played(limit=20)
+        return format_tracks(results["items"])
+    except SpotifyError as e:
+        raise spotify_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/vibe-analysis/{access_token}")
-async def get_vibe_analysis(access_token: str):
-    """Get a summary of the user's music taste"""
+async def get_vibe_analysis(access_token: str, if_none_match: Optional[str] = Header(None)):
+    """Get a summary of the user's music taste, cached per user and served with an ETag"""
     try:
-        sp.set_auth(access_token)
-        
-        # Get top artists and genres
-        top_artists = await get_top_artists(access_token)
-        top_genres = await get_top_genres(access_token)
-        recent_tracks = await get_recent_tracks(access_token)
-        
-        # Analyze the data to create a "vibe" description
-        primary_genres = [genre["genre"] for genre in top_genres[:3]]
-        vibe_description = f"Your music taste leans towards {', '.join(primary_genres)}. "
+        # The analysis outlives the token cache entry, so resolve the user
+        # first (one /me call at most) and only fetch taste data on a real miss
+        async with SpotifySession(access_token) as spotify:
+            user = await token_cache.resolve(access_token, spotify.current_user)
+            cached = vibe_cache.get(user["id"])
+            if cached is None:
+                payload = await analyze_vibe(spotify)
+                cached = (payload, compute_etag(payload))
+                vibe_cache.put(user["id"], *cached)
         
-        # Add some personality based on the genres
-        if any(genre in ["indie", "alternative"] for genre in primary_genres):
-            vibe_description += "You have an eclectic and independent spirit."
-        elif any(genre in ["pop", "dance"] for genre in primary_genres):
-            vibe_description += "You're energetic and love to keep the party going."
-        elif any(genre in ["rock", "metal"] for genre in primary_genres):
-            vibe_description += "You have a strong and passionate personality."
-        else:
-            vibe_description += "You have a unique and diverse taste in music."
-        
-        return {
-            "vibe_description": vibe_description,
-            "top_artists": top_artists[:5],
-            "top_genres": top_genres[:5],
-            "recent_tracks": recent_tracks[:5]
-        }
+        payload, etag = cached
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(vibe_cache.ttl)}"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(payload, headers=headers)
+    except SpotifyError as e:
+        raise spotify_http_error(e)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def analyze_vibe(spotify: SpotifySession) -> dict:
+    """Build the vibe analysis from live Spotify data"""
+    # One 50-artist request covers both the top 20 artists and the genre count
+    artists_result, recent_result = await asyncio.gather(
+        spotify.top_artists(limit=50, time_range="medium_term"),
+        spotify.recently_played(limit=20),
+    )
+    
+    # Get top artists and genres
+    top_artists = format_artists(artists_result["items"][:20])
+    top_genres = count_genres(artists_result["items"])
+    recent_tracks = format_tracks(recent_result["items"])
+    
+    # Analyze the data to create a "vibe" description
+    primary_genres = [genre["genre"] for genre in top_genres[:3]]
+    vibe_description = f"Your music taste leans towards {', '.join(primary_genres)}. "
+    
+    # Add some personality based on the genres
+    if any(genre in ["indie", "alternative"] for genre in primary_genres):
+        vibe_description += "You have an eclectic and independent spirit."
+    elif any(genre in ["pop", "dance"] for genre in primary_genres):
+        vibe_description += "You're energetic and love to keep the party going."
+    elif any(genre in ["rock", "metal"] for genre in primary_genres):
+        vibe_description += "You have a strong and passionate personality."
+    else:
+        vibe_description += "You have a unique and diverse taste in music."
+    
+    return {
+        "vibe_description": vibe_description,
+        "top_artists": top_artists[:5],
+        "top_genres": top_genres[:5],
+        "recent_tracks": recent_tracks[:5]
+    }
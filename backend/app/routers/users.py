@@ -1,99 +1,37 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
-from typing import List, Optional
-import weaviate
-from weaviate.classes.init import Auth
-from weaviate.classes.query import Filter
-from weaviate.classes.config import Property, DataType
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Tuple
 from pydantic import BaseModel
+import base64
+import binascii
+import hmac
 import os
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-import time
+import asyncio
 import logging
+from collections import Counter
+
+from app.compatibility import TasteMatrix, compatibility_score, shared_items
+from app.db import require_schema
+from app.responses import APIResponse, dumps
+from app.repository import (
+    fetch_profiles, fetch_profile, insert_profile, update_profile, find_similar_profiles,
+    fetch_friendship, fetch_friendships, fetch_friendship_page, fetch_friend_ids,
+    save_friendships, refresh_friendships, delete_friendship, taste_fingerprint, search_profiles, ingest_profiles
+)
+from app.recommendations import (
+    MAX_EXPANDED_FRIENDS, MAX_SCORED_CANDIDATES, recommendation_cache, recommendation_score
+)
+from app.search import MAX_CANDIDATES, normalize_term, search_queries, matches, rank_key, search_cache
+from app.embedding import profile_vector
+from app.spotify import SpotifySession, SpotifyError, spotify_http_error, taste_properties
+from app.token_cache import token_cache, get_spotify_user
+from app.taste_refresh import taste_refresher
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
-
-# Weaviate client setup
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=os.getenv("WEAVIATE_URL"),
-    auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
-)
-
-def ensure_collection_exists():
-    """Ensure the UserProfile collection exists and is ready"""
-    max_retries = 3
-    retry_delay = 2  # seconds
-    
-    for attempt in range(max_retries):
-        try:
-            if not client.collections.exists("UserProfile"):
-                print("Creating UserProfile collection...")
-                client.collections.create(
-                    name="UserProfile",
-                    description="Collection storing user profiles for Muse app",
-                    properties=[
-                        Property(
-                            name="spotifyId",
-                            data_type=DataType.TEXT,
-                            description="Spotify user ID",
-                        ),
-                        Property(
-                            name="displayName",
-                            data_type=DataType.TEXT,
-                            description="User's display name from Spotify",
-                        ),
-                        Property(
-                            name="museUsername",
-                            data_type=DataType.TEXT,
-                            description="User's unique username in Muse",
-                        ),
-                        Property(
-                            name="topArtists",
-                            data_type=DataType.TEXT_ARRAY,
-                            description="User's top artists from Spotify",
-                        ),
-                        Property(
-                            name="topGenres",
-                            data_type=DataType.TEXT_ARRAY,
-                            description="User's top genres from Spotify",
-                        ),
-                        Property(
-                            name="recentTracks",
-                            data_type=DataType.TEXT_ARRAY,
-                            description="User's recently played tracks from Spotify",
-                        ),
-                        Property(
-                            name="friends",
-                            data_type=DataType.TEXT_ARRAY,
-                            description="List of friend's museUsernames",
-                        ),
-                    ],
-                )
-                print("UserProfile collection created successfully")
-                
-            # Verify the collection exists and is ready
-            collection = client.collections.get("UserProfile")
-            if collection is None:
-                raise Exception("Collection not ready")
-                
-            return True
-            
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                print(f"Failed to create/verify collection after {max_retries} attempts: {str(e)}")
-                raise
-
-# Try to ensure collection exists at startup
-try:
-    ensure_collection_exists()
-except Exception as e:
-    print(f"Warning: Failed to create/verify collection at startup: {str(e)}")
+# Every users route needs the UserProfile schema; the check is a no-op once verified
+router = APIRouter(dependencies=[Depends(require_schema)])
 
 class UserProfile(BaseModel):
     spotifyId: str
@@ -102,31 +40,76 @@ class UserProfile(BaseModel):
     topArtists: List[str]
     topGenres: List[str]
     recentTracks: List[str]
-    friends: List[str] = []  # List of friend's museUsernames
+    friends: List[str] = []  # Friends' museUsernames, stored as friendship edges
+
+class Friend(BaseModel):
+    displayName: str
+    museUsername: str
+    spotifyId: str
+    profileImageUrl: str = ""
+    compatibilityScore: float
 
 class UsernameUpdate(BaseModel):
     new_username: str
 
+class BulkProfiles(BaseModel):
+    profiles: List[UserProfile]
+
+class CompatibilityPair(BaseModel):
+    userId: str
+    friendId: str
+
+class CompatibilityBatch(BaseModel):
+    # One user against many friends, any number of explicit pairs, or both
+    userId: Optional[str] = None
+    friendIds: List[str] = []
+    pairs: List[CompatibilityPair] = []
+
+# Most profiles accepted by one bulk request; larger loads should use app/ingest_profiles.py
+MAX_BULK_PROFILES = int(os.getenv("MAX_BULK_PROFILES", "5000"))
+
+# Bulk writes can overwrite any user's profile, so the endpoint is off unless
+# INGEST_TOKEN is set, and then only serves requests sending it in X-Muse-Admin
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+
+# Most pairs scored by one compatibility batch request
+MAX_COMPATIBILITY_PAIRS = int(os.getenv("MAX_COMPATIBILITY_PAIRS", "1000"))
+
+# Friends per page of the friends list by default, and the most one page may hold
+FRIENDS_PAGE_SIZE = int(os.getenv("FRIENDS_PAGE_SIZE", "100"))
+MAX_FRIENDS_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Set on search results ranked from a capped candidate list, which may miss
+# lower-ranked matches
+SEARCH_TRUNCATED_HEADER = "X-Search-Truncated"
+
 @router.post("/profile")
 async def create_user_profile(profile: UserProfile):
     """Create or update user profile in Weaviate"""
     try:
-        ensure_collection_exists()
-        
-        # Create data object in Weaviate
-        data_object = {
-            "spotifyId": profile.spotifyId,
-            "displayName": profile.displayName,
-            "museUsername": profile.museUsername,
-            "topArtists": profile.topArtists,
-            "topGenres": profile.topGenres,
-            "recentTracks": profile.recentTracks,
-            "friends": profile.friends
-        }
-        
-        client.collections.get("UserProfile").data.insert(data_object)
-        
-        return {"message": "Profile created successfully"}
+        # Overwrites the user's stored profile if there is one, and links the listed friends
+        report = await ingest_profiles([profile.model_dump()])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if report.errors:
+        raise HTTPException(status_code=400, detail=report.errors[0]["message"])
+    return {"message": "Profile created successfully"}
+
+def require_ingest_token(admin_token: Optional[str] = Header(None, alias="X-Muse-Admin")):
+    """FastAPI dependency admitting only requests that carry the configured ingest token"""
+    if not INGEST_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_token or not hmac.compare_digest(admin_token.encode(), INGEST_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.post("/profiles/bulk", dependencies=[Depends(require_ingest_token)])
+async def bulk_create_profiles(payload: BulkProfiles):
+    """Create or overwrite many profiles in batched writes; safe to retry"""
+    if len(payload.profiles) > MAX_BULK_PROFILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_PROFILES} profiles per request")
+    try:
+        report = await ingest_profiles([profile.model_dump() for profile in payload.profiles])
+        return report.as_dict()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -137,61 +120,49 @@ async def get_user_profile(access_token: str = Header(..., alias="access-token")
         raise HTTPException(status_code=401, detail="No access token provided")
         
     try:
-        ensure_collection_exists()
-        
-        # Initialize Spotify client with access token
-        sp = spotipy.Spotify(auth=access_token)
-        
-        try:
-            # Test the access token by making a simple API call
-            sp.current_user()
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid access token")
-        
-        # Get user profile
-        user = sp.current_user()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Check if user already exists in Weaviate
-        user_collection = client.collections.get("UserProfile")
-        existing_user = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(user['id'])
-        )
-        
-        if existing_user.objects:
-            # User exists, return their profile
-            return existing_user.objects[0].properties
-        
-        # Get top artists
-        top_artists = sp.current_user_top_artists(limit=5, time_range='medium_term')
-        artist_names = [artist['name'] for artist in top_artists['items']]
-        
-        # Get top genres (from top artists)
-        genres = set()
-        for artist in top_artists['items']:
-            genres.update(artist['genres'])
-        top_genres = list(genres)[:5]  # Take top 5 genres
-        
-        # Get recent tracks
-        recent_tracks = sp.current_user_recently_played(limit=5)
-        track_names = [item['track']['name'] for item in recent_tracks['items']]
+        async with SpotifySession(access_token) as spotify:
+            user = token_cache.get(access_token)
+            if user is None:
+                try:
+                    # Test the access token and get the user profile
+                    user = await token_cache.fetch(access_token, spotify.current_user)
+                except SpotifyError as e:
+                    if e.status_code == 429:
+                        raise spotify_http_error(e)
+                    raise HTTPException(status_code=401, detail="Invalid access token")
+            
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            # Check if user already exists in Weaviate
+            existing_user = await fetch_profile(user['id'])
+            
+            if existing_user:
+                # User exists, return their profile
+                return APIResponse(existing_user.properties)
+
+            # Only new users need their taste data, fetched in one round trip
+            top_artists, recent_tracks = await asyncio.gather(
+                spotify.top_artists(limit=5, time_range='medium_term'),
+                spotify.recently_played(limit=5)
+            )
         
         # Create profile data with initial muse_username as Spotify ID
         profile_data = {
             "spotifyId": user['id'],
             "displayName": user['display_name'],
             "museUsername": user['id'],  # Initial username is Spotify ID
-            "topArtists": artist_names,
-            "topGenres": top_genres,
-            "recentTracks": track_names,
-            "friends": []
+            **taste_properties(top_artists, recent_tracks)
         }
         
-        # Store in Weaviate
-        user_collection.data.insert(profile_data)
+        # Store in Weaviate; a concurrent first login may have stored it already,
+        # in which case the stored profile comes back
+        profile = await insert_profile(profile_data)
+        taste_refresher.mark_fresh(user['id'])
         
-        return profile_data
+        return APIResponse(profile.properties)
+    except SpotifyError as e:
+        raise spotify_http_error(e)
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
@@ -204,45 +175,43 @@ async def update_username(spotify_id: str, username_update: UsernameUpdate):
         print(f"Received username update request for user {spotify_id}")
         print(f"New username: {username_update.new_username}")
         
-        ensure_collection_exists()
-        
         if not username_update.new_username:
             print("Error: Empty username provided")
             raise HTTPException(status_code=400, detail="Username cannot be empty")
         
-        # Check if the user exists
-        user_collection = client.collections.get("UserProfile")
+        # Fetch the user and whoever holds the requested username in one query
         print("Fetching user from database...")
-        user_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(spotify_id)
+        lookup = await fetch_profiles(
+            spotify_ids=[spotify_id],
+            usernames=[username_update.new_username],
+            properties=["displayName"]
         )
+        user = lookup.by_spotify_id.get(spotify_id)
         
-        if not user_result.objects:
+        if not user:
             print(f"Error: User {spotify_id} not found")
             raise HTTPException(status_code=404, detail="User not found")
         
-        print(f"Found user: {user_result.objects[0].properties['displayName']}")
+        print(f"Found user: {user.properties['displayName']}")
         
         # Get the user's UUID
-        user_uuid = user_result.objects[0].uuid
+        user_uuid = user.uuid
         print(f"User UUID: {user_uuid}")
         
         # Check if username is already taken by a different user
-        print("Checking if username is already taken...")
-        existing_user = user_collection.query.fetch_objects(
-            filters=Filter.by_property("museUsername").equal(username_update.new_username)
-        )
+        existing_user = lookup.by_username.get(username_update.new_username)
         
-        if existing_user.objects and existing_user.objects[0].properties["spotifyId"] != spotify_id:
+        if existing_user and existing_user.properties["spotifyId"] != spotify_id:
             print(f"Error: Username {username_update.new_username} already taken")
             raise HTTPException(status_code=400, detail="Username already taken")
         
         # Update username
         try:
             print("Updating username in database...")
-            user_collection.data.update(
-                uuid=user_uuid,
-                properties={
+            await update_profile(
+                spotify_id,
+                user_uuid,
+                {
                     "museUsername": username_update.new_username
                 }
             )
@@ -262,159 +231,217 @@ async def update_username(spotify_id: str, username_update: UsernameUpdate):
 async def get_compatibility(user1_id: str, user2_id: str):
     """Calculate compatibility between two users"""
     try:
-        ensure_collection_exists()
-        
-        user_collection = client.collections.get("UserProfile")
-        
         # Get both user profiles
-        user1_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(user1_id)
-        )
-        user2_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(user2_id)
+        lookup = await fetch_profiles(
+            spotify_ids=[user1_id, user2_id],
+            properties=["topArtists", "topGenres"]
         )
         
-        if not user1_result.objects or not user2_result.objects:
+        if user1_id not in lookup.by_spotify_id or user2_id not in lookup.by_spotify_id:
             raise HTTPException(status_code=404, detail="One or both users not found")
             
-        user1 = user1_result.objects[0].properties
-        user2 = user2_result.objects[0].properties
-        
-        # Simple compatibility calculation based on shared artists and genres
-        shared_artists = set(user1["topArtists"]) & set(user2["topArtists"])
-        shared_genres = set(user1["topGenres"]) & set(user2["topGenres"])
-        
-        # Calculate compatibility score (0-100)
-        artist_score = len(shared_artists) / max(len(user1["topArtists"]), len(user2["topArtists"])) * 50
-        genre_score = len(shared_genres) / max(len(user1["topGenres"]), len(user2["topGenres"])) * 50
-        
-        total_score = artist_score + genre_score
+        user1 = lookup.by_spotify_id[user1_id].properties
+        user2 = lookup.by_spotify_id[user2_id].properties
         
         return {
-            "compatibility_score": round(total_score, 2),
-            "shared_artists": list(shared_artists),
-            "shared_genres": list(shared_genres)
+            "compatibility_score": compatibility_score(user1, user2),
+            "shared_artists": shared_items(user1["topArtists"], user2["topArtists"]),
+            "shared_genres": shared_items(user1["topGenres"], user2["topGenres"])
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/friends/{spotify_id}")
-async def get_friends(spotify_id: str, access_token: str = Header(..., alias="access-token")):
-    """Get user's friends list"""
-    if not access_token:
-        raise HTTPException(status_code=401, detail="No access token provided")
+@router.post("/compatibility/batch")
+async def get_compatibility_batch(batch: CompatibilityBatch):
+    """Score many user/friend pairs from one profile fetch; unknown ids are listed in notFound"""
+    if batch.friendIds and not batch.userId:
+        raise HTTPException(status_code=400, detail="friendIds needs a userId")
+    pairs = [(batch.userId, friend_id) for friend_id in batch.friendIds]
+    pairs += [(pair.userId, pair.friendId) for pair in batch.pairs]
+    pairs = list(dict.fromkeys(pairs))
+    if len(pairs) > MAX_COMPATIBILITY_PAIRS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_COMPATIBILITY_PAIRS} pairs per request")
+    
+    try:
+        spotify_ids = list(dict.fromkeys(spotify_id for pair in pairs for spotify_id in pair))
+        lookup = await fetch_profiles(
+            spotify_ids=spotify_ids,
+            properties=["displayName", "museUsername", "topArtists", "topGenres"]
+        )
+        profiles = {spotify_id: profile.properties for spotify_id, profile in lookup.by_spotify_id.items()}
+        
+        # Each user is scored against all of their friends in one vectorized call
+        friends_by_user = {}
+        for user_id, friend_id in pairs:
+            if user_id in profiles and friend_id in profiles:
+                friends_by_user.setdefault(user_id, []).append(friend_id)
+        scores = {}
+        for user_id, friend_ids in friends_by_user.items():
+            user_scores = TasteMatrix([profiles[friend_id] for friend_id in friend_ids]).score_one(profiles[user_id])
+            scores.update(((user_id, friend_id), score) for friend_id, score in zip(friend_ids, user_scores))
+        
+        results = []
+        for user_id, friend_id in pairs:
+            if (user_id, friend_id) not in scores:
+                continue
+            user, friend = profiles[user_id], profiles[friend_id]
+            results.append({
+                "userId": user_id,
+                "friendId": friend_id,
+                "compatibilityScore": scores[user_id, friend_id],
+                "commonArtists": shared_items(user.get("topArtists"), friend.get("topArtists")),
+                "commonGenres": shared_items(user.get("topGenres"), friend.get("topGenres")),
+                "user1": {"displayName": user.get("displayName"), "museUsername": user.get("museUsername")},
+                "user2": {"displayName": friend.get("displayName"), "museUsername": friend.get("museUsername")}
+            })
+        
+        return APIResponse({
+            "results": results,
+            "notFound": [spotify_id for spotify_id in spotify_ids if spotify_id not in profiles]
+        })
+    except Exception as e:
+        logger.error(f"Error calculating compatibility batch: {e}")
+        raise HTTPException(status_code=500, detail="Failed to calculate compatibility")
 
+def encode_cursor(friend_id: str) -> str:
+    """Opaque page cursor for the friend a page ended at"""
+    return base64.urlsafe_b64encode(friend_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> str:
+    """Friend id a cursor from encode_cursor points at; anything else is a 400"""
     try:
-        print(f"Getting friends for user {spotify_id}")
-        # Initialize Spotify client with access token to validate it
-        sp = spotipy.Spotify(auth=access_token)
-        try:
-            # Test the access token
-            sp.current_user()
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid access token")
+        padded = cursor + "=" * (-len(cursor) % 4)
+        friend_id = base64.b64decode(padded, altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Rejects cursors that decode but were not produced by encode_cursor, e.g. "abc="
+    if not friend_id or encode_cursor(friend_id) != cursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return friend_id
 
-        ensure_collection_exists()
-        user_collection = client.collections.get("UserProfile")
-        
-        # Get the user
-        user_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(spotify_id)
+async def resolve_friends(user: dict, edges: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """Friend records for a page of edges, plus the edges whose stored scores are out of date"""
+    lookup = await fetch_profiles(
+        spotify_ids=[edge["friendId"] for edge in edges],
+        properties=["displayName", "museUsername", "topArtists", "topGenres"]
+    )
+    friends = []
+    stale_edges = []
+    for edge in edges:
+        friend = lookup.by_spotify_id.get(edge["friendId"])
+        if not friend:
+            print(f"Friend {edge['friendId']} not found in database")
+            continue
+        if not is_friendship_current(edge, user, friend.properties):
+            edge = build_friendship(user, friend.properties)
+            stale_edges.append(edge)
+        friends.append({
+            "displayName": friend.properties["displayName"],
+            "museUsername": friend.properties["museUsername"],
+            "spotifyId": friend.properties["spotifyId"],
+            "profileImageUrl": friend.properties.get("profileImageUrl", ""),
+            "compatibilityScore": edge["compatibilityScore"]
+        })
+    return friends, stale_edges
+
+@router.get("/friends/{spotify_id}", response_model=List[Friend])
+async def get_friends(
+    spotify_id: str,
+    limit: int = Query(FRIENDS_PAGE_SIZE, ge=1, le=MAX_FRIENDS_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    spotify_user: dict = Depends(get_spotify_user)
+):
+    """Get one page of the user's friends; X-Next-Cursor holds the cursor of the next page"""
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        print(f"Getting friends for user {spotify_id}")
+        # One extra edge tells whether another page follows
+        user, edges = await asyncio.gather(
+            fetch_profile(spotify_id, properties=["displayName", "topArtists", "topGenres"]),
+            fetch_friendship_page(spotify_id, after, limit + 1)
         )
         
-        if not user_result.objects:
+        if not user:
             print(f"User {spotify_id} not found")
             raise HTTPException(status_code=404, detail="User not found")
         
-        user = user_result.objects[0]
-        print(f"Found user: {user.properties['displayName']} with properties: {user.properties}")
+        has_more = len(edges) > limit
+        edges = edges[:limit]
+        friends, stale_edges = await resolve_friends(user.properties, edges)
         
-        # Ensure we have a list, even if empty
-        friends_usernames = user.properties.get("friends", []) or []
-        print(f"Friends usernames: {friends_usernames}")
-        
-        # Get all friends' profiles
-        friends = []
-        for friend_username in friends_usernames:
-            print(f"Looking up friend: {friend_username}")
-            friend_result = user_collection.query.fetch_objects(
-                filters=Filter.by_property("museUsername").equal(friend_username)
-            )
-            
-            if friend_result.objects:
-                friend = friend_result.objects[0]
-                print(f"Found friend: {friend.properties['displayName']}")
-                friends.append({
-                    "displayName": friend.properties["displayName"],
-                    "museUsername": friend.properties["museUsername"],
-                    "spotifyId": friend.properties["spotifyId"],
-                    "profileImageUrl": friend.properties.get("profileImageUrl", "")
-                })
-            else:
-                print(f"Friend {friend_username} not found in database")
+        # Store scores for edges that were missing or whose taste data changed
+        await store_friendships(stale_edges)
         
         print(f"Returning {len(friends)} friends")
-        return friends
+        headers = {NEXT_CURSOR_HEADER: encode_cursor(edges[-1]["friendId"])} if has_more else None
+        return APIResponse(friends, headers=headers)
     except Exception as e:
         print(f"Error in get_friends: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/friends/{spotify_id}/stream")
+async def stream_friends(spotify_id: str, spotify_user: dict = Depends(get_spotify_user)):
+    """Stream every friend as NDJSON, one line per friend, sent a page at a time as lookups finish"""
+    user = await fetch_profile(spotify_id, properties=["displayName", "topArtists", "topGenres"])
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return StreamingResponse(friend_lines(spotify_id, user.properties), media_type="application/x-ndjson")
+
+async def friend_lines(spotify_id: str, user: dict) -> AsyncIterator[bytes]:
+    """NDJSON friend records, page by page; the next page of edges is read while one resolves"""
+    next_page = asyncio.ensure_future(fetch_friendship_page(spotify_id, None, FRIENDS_PAGE_SIZE))
+    try:
+        while next_page is not None:
+            edges = await next_page
+            next_page = None
+            if len(edges) == FRIENDS_PAGE_SIZE:
+                next_page = asyncio.ensure_future(
+                    fetch_friendship_page(spotify_id, edges[-1]["friendId"], FRIENDS_PAGE_SIZE)
+                )
+            friends, stale_edges = await resolve_friends(user, edges)
+            if friends:
+                yield b"".join(dumps(friend) + b"\n" for friend in friends)
+            await store_friendships(stale_edges)
+    except Exception as e:
+        # The status line is already sent, so the failure is reported in-band
+        print(f"Error in stream_friends: {str(e)}")
+        yield dumps({"error": str(e)}) + b"\n"
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
 @router.post("/friends/{spotify_id}/{friend_username}")
 async def add_friend(spotify_id: str, friend_username: str):
-    ensure_collection_exists()
-    user_collection = client.collections.get("UserProfile")
-    
-    # Get the current user
-    user_result = user_collection.query.fetch_objects(
-        filters=Filter.by_property("spotifyId").equal(spotify_id)
+    # Get the current user and the friend in one query
+    lookup = await fetch_profiles(
+        spotify_ids=[spotify_id],
+        usernames=[friend_username],
+        properties=["displayName", "topArtists", "topGenres"]
     )
+    user = lookup.by_spotify_id.get(spotify_id)
+    friend = lookup.by_username.get(friend_username)
     
-    if not user_result.objects:
+    if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get the friend
-    friend_result = user_collection.query.fetch_objects(
-        filters=Filter.by_property("museUsername").equal(friend_username)
-    )
-    
-    if not friend_result.objects:
+    if not friend:
         raise HTTPException(status_code=404, detail="Friend not found")
     
-    user = user_result.objects[0]
-    friend = friend_result.objects[0]
+    if friend.properties["spotifyId"] == spotify_id:
+        raise HTTPException(status_code=400, detail="Cannot add yourself as a friend")
     
     # Check if they're already friends
-    current_friends = user.properties.get("friends", [])
-    if friend.properties["museUsername"] in current_friends:
+    if await fetch_friendship(spotify_id, friend.properties["spotifyId"]):
         raise HTTPException(status_code=400, detail="Already friends with this user")
     
-    # Calculate compatibility score
-    compatibility_score = calculate_compatibility(
-        user.properties["topArtists"],
-        user.properties["topGenres"],
-        friend.properties["topArtists"],
-        friend.properties["topGenres"]
-    )
-    
-    # Add friend to user's friends list
+    # Write both directions of the mutual friendship in one batch, with their
+    # scores so later reads don't recompute them. Edge ids are deterministic,
+    # so concurrent adds of the same pair write the same two edges
+    edge = build_friendship(user.properties, friend.properties)
     try:
-        user_collection.data.update(
-            uuid=user.uuid,
-            properties={
-                "friends": current_friends + [friend.properties["museUsername"]]
-            }
-        )
-        
-        # Add user to friend's friends list (mutual friendship)
-        friend_current_friends = friend.properties.get("friends", [])
-        user_collection.data.update(
-            uuid=friend.uuid,
-            properties={
-                "friends": friend_current_friends + [user.properties["museUsername"]]
-            }
-        )
+        await save_friendships([edge, build_friendship(friend.properties, user.properties)])
     except Exception as e:
         print(f"Error updating friends: {e}")
         raise HTTPException(status_code=500, detail="Failed to update friends")
@@ -424,81 +451,200 @@ async def add_friend(spotify_id: str, friend_username: str):
             "displayName": friend.properties["displayName"],
             "museUsername": friend.properties["museUsername"]
         },
-        "compatibility_score": compatibility_score
+        "compatibility_score": edge["compatibilityScore"]
     }
 
-def calculate_compatibility(user_artists: List[str], user_genres: List[str], 
-                          friend_artists: List[str], friend_genres: List[str]) -> int:
-    # Calculate artist overlap
-    common_artists = set(user_artists) & set(friend_artists)
-    artist_score = len(common_artists) / max(len(user_artists), 1) * 50
-    
-    # Calculate genre overlap
-    common_genres = set(user_genres) & set(friend_genres)
-    genre_score = len(common_genres) / max(len(user_genres), 1) * 50
+def search_candidate(properties: dict) -> dict:
+    return {
+        "displayName": properties.get("displayName"),
+        "museUsername": properties.get("museUsername"),
+        "spotifyId": properties.get("spotifyId"),
+        "profileImageUrl": properties.get("profileImageUrl")
+    }
+
+async def find_search_candidates(term: str, username: str) -> Tuple[List[dict], bool]:
+    """Users matching a term, and whether that is all of them.
+
+    Prefix matches are queried before matches anywhere in the name, so a
+    popular prefix cannot crowd the best-ranked users out of the capped
+    results; when even the prefix query is capped, the exact match is
+    looked up on its own.
+    """
+    queries = search_queries(term)
+    results = await asyncio.gather(*(search_profiles(grams, limit=MAX_CANDIDATES) for grams in queries))
+    complete = all(len(profiles) < MAX_CANDIDATES for profiles in results)
+    if len(results[0]) >= MAX_CANDIDATES:
+        exact = await fetch_profiles(usernames=[term, username.strip()], properties=["spotifyId", "displayName", "museUsername"])
+        results.insert(0, list(exact.by_username.values()))
     
-    # Total score is the sum of both scores
-    return round(artist_score + genre_score)
+    candidates = {}
+    for profiles in results:
+        for user in profiles:
+            spotify_id = user.properties.get("spotifyId")
+            if spotify_id not in candidates and matches(term, user.properties.get("museUsername") or ""):
+                candidates[spotify_id] = search_candidate(user.properties)
+    return list(candidates.values()), complete
 
 @router.get("/search")
-async def search_users(username: str):
+async def search_users(username: str, limit: int = Query(5, ge=1, le=50), offset: int = Query(0, ge=0)):
+    """Search users by username, ranked exact match first, then prefix matches"""
     try:
-        user_collection = client.collections.get("UserProfile")
+        term = normalize_term(username)
+        if not term:
+            return []
+        
+        # Debounced keystrokes usually extend a recent term, whose cached
+        # candidates answer the new term without another query
+        cached = search_cache.get(term)
+        if cached is None:
+            candidates, complete = await find_search_candidates(term, username)
+            search_cache.put(term, candidates, complete=complete)
+        else:
+            candidates, complete = cached
         
-        # Search for users with matching username
-        result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("museUsername").like(f"*{username}*"),
-            limit=5
+        # Ranking is only exact across every match when none were cut off
+        users = sorted(candidates, key=lambda user: rank_key(term, user["museUsername"]))
+        headers = None if complete else {SEARCH_TRUNCATED_HEADER: "true"}
+        return APIResponse(users[offset:offset + limit], headers=headers)
+    except Exception as e:
+        logger.error(f"Error searching users: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search users")
+
+@router.get("/discover/{spotify_id}")
+async def discover_users(spotify_id: str, limit: int = Query(10, ge=1, le=50)):
+    """Find the most compatible users who are not yet friends, by taste-vector similarity"""
+    try:
+        user, edges = await asyncio.gather(fetch_profile(spotify_id), fetch_friendships(spotify_id))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        vector = profile_vector(user.properties)
+        if vector is None:
+            return []
+        
+        # Over-fetch nearest neighbours from the HNSW index, then drop existing
+        # friends and re-rank the candidates by the exact compatibility score
+        friends = set(edges)
+        candidates = await find_similar_profiles(
+            vector,
+            exclude_spotify_id=spotify_id,
+            limit=limit * 3 + min(len(friends), 200)
         )
         
-        users = []
-        for user in result.objects:
-            users.append({
-                "displayName": user.properties.get("displayName"),
-                "museUsername": user.properties.get("museUsername"),
-                "spotifyId": user.properties.get("spotifyId"),
-                "profileImageUrl": user.properties.get("profileImageUrl")
+        candidates = [
+            (candidate, distance) for candidate, distance in candidates
+            if candidate.properties.get("spotifyId") not in friends
+        ]
+        scores = TasteMatrix([candidate.properties for candidate, _ in candidates]).score_one(user.properties)
+        results = []
+        for (candidate, distance), score in zip(candidates, scores):
+            results.append({
+                "displayName": candidate.properties.get("displayName"),
+                "museUsername": candidate.properties.get("museUsername"),
+                "spotifyId": candidate.properties.get("spotifyId"),
+                "compatibility_score": score,
+                "similarity": round(1 - distance, 4)
             })
         
-        return users
+        results.sort(key=lambda result: (result["compatibility_score"], result["similarity"]), reverse=True)
+        return APIResponse(results[:limit])
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error searching users: {e}")
-        raise HTTPException(status_code=500, detail="Failed to search users")
+        logger.error(f"Error discovering users: {e}")
+        raise HTTPException(status_code=500, detail="Failed to discover users")
 
-@router.get("/{spotify_id}/compatibility/{friend_spotify_id}")
-async def get_compatibility(spotify_id: str, friend_spotify_id: str):
+# Most recommendations one request can ask for, and how many are cached per user
+MAX_RECOMMENDATIONS = 50
+
+@router.get("/recommendations/{spotify_id}")
+async def recommend_friends(spotify_id: str, limit: int = Query(10, ge=1, le=MAX_RECOMMENDATIONS)):
+    """Suggest friends of friends, ranked by mutual friends and taste compatibility"""
     try:
-        user_collection = client.collections.get("UserProfile")
-        
-        # Get both users
-        user_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(spotify_id)
+        cached = recommendation_cache.get(spotify_id)
+        if cached is not None:
+            return APIResponse(cached[:limit])
+        
+        version = recommendation_cache.snapshot()
+        user, edges = await asyncio.gather(
+            fetch_profile(spotify_id, properties=["topArtists", "topGenres"]),
+            fetch_friendships(spotify_id)
         )
-        friend_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(friend_spotify_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Second hop: every expanded friend's friends in one batched read,
+        # counting how many of the user's friends each candidate shares
+        friend_ids = sorted(edges)[:MAX_EXPANDED_FRIENDS]
+        adjacency = await fetch_friend_ids(friend_ids)
+        mutual_friends = Counter(
+            candidate_id
+            for friend_id in friend_ids
+            for candidate_id in adjacency.get(friend_id, [])
+            if candidate_id != spotify_id and candidate_id not in edges
         )
         
-        if not user_result.objects or not friend_result.objects:
-            raise HTTPException(status_code=404, detail="User or friend not found")
+        # Score the best-connected candidates against the user's taste
+        candidate_ids = [candidate_id for candidate_id, _ in mutual_friends.most_common(MAX_SCORED_CANDIDATES)]
+        lookup = await fetch_profiles(
+            spotify_ids=candidate_ids,
+            properties=["displayName", "museUsername", "topArtists", "topGenres"]
+        )
+        found_ids = [candidate_id for candidate_id in candidate_ids if candidate_id in lookup.by_spotify_id]
+        scores = TasteMatrix(
+            [lookup.by_spotify_id[candidate_id].properties for candidate_id in found_ids]
+        ).score_one(user.properties)
+        results = []
+        for candidate_id, score in zip(found_ids, scores):
+            candidate = lookup.by_spotify_id[candidate_id]
+            results.append({
+                "displayName": candidate.properties.get("displayName"),
+                "museUsername": candidate.properties.get("museUsername"),
+                "spotifyId": candidate_id,
+                "mutual_friends": mutual_friends[candidate_id],
+                "compatibility_score": score,
+                "score": recommendation_score(mutual_friends[candidate_id], score)
+            })
         
-        user = user_result.objects[0]
-        friend = friend_result.objects[0]
+        results.sort(key=lambda result: (result["score"], result["mutual_friends"]), reverse=True)
+        results = results[:MAX_RECOMMENDATIONS]
+        recommendation_cache.put(spotify_id, friend_ids, results, version)
+        return APIResponse(results[:limit])
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error recommending friends: {e}")
+        raise HTTPException(status_code=500, detail="Failed to recommend friends")
+
+@router.get("/{spotify_id}/compatibility/{friend_spotify_id}")
+async def get_compatibility(spotify_id: str, friend_spotify_id: str):
+    try:
+        # Get both users and the precomputed scores on their friendship edge
+        lookup, edge = await asyncio.gather(
+            fetch_profiles(
+                spotify_ids=[spotify_id, friend_spotify_id],
+                properties=["displayName", "museUsername", "topArtists", "topGenres"]
+            ),
+            fetch_friendship(spotify_id, friend_spotify_id)
+        )
+        user = lookup.by_spotify_id.get(spotify_id)
+        friend = lookup.by_spotify_id.get(friend_spotify_id)
         
-        # Get top artists and genres for both users
-        user_artists = user.properties.get("topArtists", [])
-        user_genres = user.properties.get("topGenres", [])
-        friend_artists = friend.properties.get("topArtists", [])
-        friend_genres = friend.properties.get("topGenres", [])
+        if not user or not friend:
+            raise HTTPException(status_code=404, detail="User or friend not found")
         
-        # Calculate compatibility score
-        compatibility_score = calculate_compatibility_score(
-            user_artists, user_genres, friend_artists, friend_genres
-        )
+        # Recompute only if the edge is missing or either side's taste changed;
+        # store the result only when they are friends, i.e. the edge exists
+        if not is_friendship_current(edge, user.properties, friend.properties):
+            are_friends = edge is not None
+            edge = build_friendship(user.properties, friend.properties)
+            if are_friends:
+                await store_friendships([edge])
         
         return {
-            "compatibilityScore": compatibility_score,
-            "commonArtists": list(set(user_artists) & set(friend_artists)),
-            "commonGenres": list(set(user_genres) & set(friend_genres)),
+            "compatibilityScore": edge["compatibilityScore"],
+            "commonArtists": edge["sharedArtists"],
+            "commonGenres": edge["sharedGenres"],
             "user1": {
                 "displayName": user.properties.get("displayName"),
                 "museUsername": user.properties.get("museUsername")
@@ -515,53 +661,29 @@ async def get_compatibility(spotify_id: str, friend_spotify_id: str):
         raise HTTPException(status_code=500, detail="Failed to calculate compatibility")
 
 @router.delete("/friends/{spotify_id}/{friend_username}")
-async def delete_friend(spotify_id: str, friend_username: str, access_token: str = Header(..., alias="access-token")):
+async def delete_friend(spotify_id: str, friend_username: str, spotify_user: dict = Depends(get_spotify_user)):
     """Remove a friend from user's friends list"""
-    if not access_token:
-        raise HTTPException(status_code=401, detail="No access token provided")
-
     try:
         print(f"Removing friend {friend_username} from user {spotify_id}")
-        # Initialize Spotify client with access token to validate it
-        sp = spotipy.Spotify(auth=access_token)
-        try:
-            # Test the access token
-            sp.current_user()
-        except Exception as e:
-            raise HTTPException(status_code=401, detail="Invalid access token")
-
-        ensure_collection_exists()
-        user_collection = client.collections.get("UserProfile")
-        
-        # Get the user
-        user_result = user_collection.query.fetch_objects(
-            filters=Filter.by_property("spotifyId").equal(spotify_id)
+        # Get the user and the friend in one query
+        lookup = await fetch_profiles(
+            spotify_ids=[spotify_id],
+            usernames=[friend_username],
+            properties=["displayName"]
         )
+        user = lookup.by_spotify_id.get(spotify_id)
+        friend = lookup.by_username.get(friend_username)
         
-        if not user_result.objects:
+        if not user:
             print(f"User {spotify_id} not found")
             raise HTTPException(status_code=404, detail="User not found")
         
-        user = user_result.objects[0]
         print(f"Found user: {user.properties['displayName']}")
         
-        # Get current friends list
-        friends = user.properties.get("friends", []) or []
-        print(f"Current friends: {friends}")
-        
-        # Remove friend if exists
-        if friend_username in friends:
-            friends.remove(friend_username)
-            print(f"Removed {friend_username} from friends list")
-            
-            # Update user's friends list
-            user_collection.data.update(
-                uuid=user.uuid,
-                properties={
-                    "friends": friends
-                }
-            )
-            print("Friends list updated successfully")
+        # Remove the edges in both directions if they are friends
+        if friend and await fetch_friendship(spotify_id, friend.properties["spotifyId"]):
+            await delete_friendship(spotify_id, friend.properties["spotifyId"])
+            print(f"Removed {friend_username} from friends")
             return {"message": "Friend removed successfully"}
         else:
             print(f"Friend {friend_username} not found in friends list")
@@ -573,16 +695,24 @@ async def delete_friend(spotify_id: str, friend_username: str, access_token: str
             raise e
         raise HTTPException(status_code=500, detail=str(e))
 
-def calculate_compatibility_score(user_artists: List[str], user_genres: List[str], 
-                               friend_artists: List[str], friend_genres: List[str]) -> float:
-    """Calculate compatibility score between two users based on shared artists and genres"""
-    # Calculate artist overlap
-    common_artists = set(user_artists) & set(friend_artists)
-    artist_score = len(common_artists) / max(len(user_artists), 1) * 50
-    
-    # Calculate genre overlap
-    common_genres = set(user_genres) & set(friend_genres)
-    genre_score = len(common_genres) / max(len(user_genres), 1) * 50
-    
-    # Total score is the sum of both scores
-    return round(artist_score + genre_score, 2) 
\ No newline at end of file
+def build_friendship(user: dict, friend: dict) -> dict:
+    """Compute the friendship edge from user to friend, with its compatibility data"""
+    return {
+        "userId": user["spotifyId"],
+        "friendId": friend["spotifyId"],
+        "compatibilityScore": compatibility_score(user, friend),
+        "sharedArtists": shared_items(user.get("topArtists"), friend.get("topArtists")),
+        "sharedGenres": shared_items(user.get("topGenres"), friend.get("topGenres")),
+        "tasteKey": f"{taste_fingerprint(user)}:{taste_fingerprint(friend)}"
+    }
+
+def is_friendship_current(edge: Optional[dict], user: dict, friend: dict) -> bool:
+    """Whether a stored edge was computed from both users' current taste data"""
+    return bool(edge) and edge.get("tasteKey") == f"{taste_fingerprint(user)}:{taste_fingerprint(friend)}"
+
+async def store_friendships(edges: List[dict]):
+    """Save recomputed scores on existing edges; a failure only means they are recomputed next time"""
+    try:
+        await refresh_friendships(edges)
+    except Exception as e:
+        logger.warning(f"Failed to store friendship scores: {e}")
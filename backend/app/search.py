@@ -0,0 +1,131 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Search terms shorter than this match username/segment prefixes; longer
+# terms match anywhere in the username via trigrams
+TRIGRAM = 3
+# Longest prefix indexed per username or segment
+MAX_PREFIX = 32
+# Most rows one search query reads; a term with fewer matches is "complete"
+# and its results can answer any longer term typed after it
+MAX_CANDIDATES = 200
+
+_SEGMENT_SPLIT = re.compile(r"[^a-z0-9]+")
+
+def _segments(name: str) -> List[str]:
+    return [segment for segment in _SEGMENT_SPLIT.split(name) if segment]
+
+def username_grams(username: str) -> List[str]:
+    """Index tokens for a username: ^-marked prefixes of the name and its segments, plus trigrams"""
+    name = username.lower()
+    grams = set()
+    for part in [name] + _segments(name):
+        for length in range(1, min(len(part), MAX_PREFIX) + 1):
+            grams.add("^" + part[:length])
+    grams.update(name[start:start + TRIGRAM] for start in range(len(name) - TRIGRAM + 1))
+    return sorted(grams)
+
+def query_grams(term: str) -> List[str]:
+    """Tokens every username matching ``term`` is indexed under"""
+    if len(term) < TRIGRAM:
+        return ["^" + term]
+    return sorted({term[start:start + TRIGRAM] for start in range(len(term) - TRIGRAM + 1)})
+
+def search_queries(term: str) -> List[List[str]]:
+    """Gram queries that together find every match for ``term``, best-ranked matches first.
+
+    Each query returns a capped number of rows in no particular order, so
+    name and segment prefix matches are queried on their own before the
+    trigram query fills in matches anywhere in the name.
+    """
+    if len(term) < TRIGRAM or len(term) > MAX_PREFIX:
+        return [query_grams(term)]
+    return [["^" + term], query_grams(term)]
+
+def normalize_term(term: str) -> str:
+    return term.strip().lower()
+
+def matches(term: str, username: str) -> bool:
+    """Whether a username matches a normalized search term"""
+    name = username.lower()
+    if len(term) < TRIGRAM:
+        return name.startswith(term) or any(segment.startswith(term) for segment in _segments(name))
+    return term in name
+
+def rank_key(term: str, username: str) -> Tuple:
+    """Exact match first, then name prefix, then segment prefix, then anywhere; shorter names first"""
+    name = username.lower()
+    if name == term:
+        tier = 0
+    elif name.startswith(term):
+        tier = 1
+    elif any(segment.startswith(term) for segment in _segments(name)):
+        tier = 2
+    else:
+        tier = 3
+    return (tier, len(name), name)
+
+def _covers(prefix: str, term: str) -> bool:
+    """Whether every match for ``term`` is also a match for ``prefix``"""
+    return term.startswith(prefix) and (len(prefix) >= TRIGRAM or len(term) < TRIGRAM)
+
+class SearchCache:
+    """Recent search candidates by term, so keystroke-by-keystroke searches reuse earlier results.
+
+    A term with a complete candidate list answers every longer term typed
+    after it without another query. Entries expire after ``ttl`` seconds
+    and the whole cache is cleared when a username is created or changed.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, term: str) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """Candidates for a term and whether they are all of its matches, or None on a miss"""
+        now = time.monotonic()
+        for length in range(len(term), 0, -1):
+            prefix = term[:length]
+            entry = self._entries.get(prefix)
+            if entry is None:
+                continue
+            candidates, complete, expires_at = entry
+            if expires_at <= now:
+                del self._entries[prefix]
+                continue
+            if prefix == term:
+                self._entries.move_to_end(prefix)
+                self.hits += 1
+                return candidates, complete
+            if complete and _covers(prefix, term):
+                self._entries.move_to_end(prefix)
+                self.hits += 1
+                return [candidate for candidate in candidates if matches(term, candidate["museUsername"])], True
+        self.misses += 1
+        return None
+
+    def put(self, term: str, candidates: List[Dict[str, Any]], complete: bool):
+        self._entries[term] = (candidates, complete, time.monotonic() + self.ttl)
+        self._entries.move_to_end(term)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+search_cache = SearchCache(ttl=float(os.getenv("SEARCH_CACHE_TTL", "30")))
@@ -0,0 +1,257 @@
+import asyncio
+import httpx
+import os
+import re
+import time
+from collections import Counter
+from fastapi import HTTPException
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from app import metrics
+
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+
+# One pooled HTTP client shared by every request, closed by the app lifespan
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client used for Spotify Web API calls"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=SPOTIFY_API_URL,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return _http_client
+
+async def close():
+    """Close the shared HTTP client if it was opened"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def ping() -> float:
+    """Seconds one round trip to the Web API takes; any HTTP answer counts as reachable"""
+    started = time.perf_counter()
+    with metrics.track_upstream("spotify", "ping"):
+        # Unauthenticated, so Spotify answers 401 without touching our rate limit budget
+        await get_http_client().get("/")
+    return time.perf_counter() - started
+
+# Spotify ids are 22 base62 characters; they are folded out of metric labels
+_SPOTIFY_ID = re.compile(r"/[0-9A-Za-z]{22}(?=/|$)")
+_API_PATH = urlsplit(SPOTIFY_API_URL).path.rstrip("/")
+
+def endpoint_label(path: str) -> str:
+    """Metric label for a Spotify API path, e.g. /v1/artists/<id>/albums -> /artists/{id}/albums"""
+    if _API_PATH and path.startswith(_API_PATH):
+        path = path[len(_API_PATH):]
+    return _SPOTIFY_ID.sub("/{id}", path) or "/"
+
+class SpotifyError(Exception):
+    """Error response from the Spotify Web API"""
+
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        # Seconds Spotify asked us to wait, sent with 429 responses
+        self.retry_after = retry_after
+
+def spotify_http_error(error: SpotifyError) -> HTTPException:
+    """HTTP error to answer with when a Spotify call fails.
+
+    Rate limiting becomes a 429 carrying Retry-After, so clients back off
+    instead of treating a busy period as a bad request.
+    """
+    if error.status_code == 429:
+        retry_after = max(1, round(error.retry_after or 1))
+        return HTTPException(
+            status_code=429,
+            detail="Spotify is rate limiting requests, try again shortly",
+            headers={"Retry-After": str(retry_after)},
+        )
+    if error.status_code == 401:
+        return HTTPException(status_code=401, detail="Invalid access token")
+    return HTTPException(status_code=400, detail=str(error))
+
+class TokenBucket:
+    """Spreads Spotify calls so the app stays under its rate limit.
+
+    Callers reserve a token and sleep until it is theirs, so bursts queue
+    instead of failing. A 429 pauses every caller for the Retry-After period.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def reserve(self) -> float:
+        """Take a token, returning how long the caller has to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.paused_until - now)
+
+    def cancel(self):
+        """Give back a reserved token that will not be used"""
+        self.tokens += 1
+
+class SpotifyAPI:
+    """Process-wide access to the Spotify Web API.
+
+    Every call goes through one token bucket. A 429 is retried after its
+    Retry-After period when that is short, up to ``max_retries`` times; a
+    call that would wait longer than ``max_wait`` fails fast with a 429
+    SpotifyError instead of tying up the request. Identical calls made with
+    the same token while one is in flight share that one upstream request.
+    """
+
+    def __init__(self, rate: float = 10, burst: int = 20, max_wait: float = 5, max_retries: int = 2):
+        self.limiter = TokenBucket(rate, burst)
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.coalesced = 0
+        self._in_flight: Dict[Tuple, "asyncio.Task[Dict[str, Any]]"] = {}
+
+    async def get(self, access_token: str, path: str, params: Dict[str, Any],
+                  client: Optional[httpx.AsyncClient] = None) -> Dict[str, Any]:
+        key = (access_token, path, tuple(sorted(params.items())))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(client or get_http_client(), access_token, path, params))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # One caller giving up must not cancel the request for the others
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Tuple, task: "asyncio.Task[Dict[str, Any]]"):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def _request(self, client: httpx.AsyncClient, access_token: str, path: str,
+                       params: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            wait = self.limiter.reserve()
+            if wait > self.max_wait:
+                self.limiter.cancel()
+                raise SpotifyError(429, "Spotify rate limit reached", retry_after=wait)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await self._send(client, access_token, path, params)
+            except SpotifyError as e:
+                if e.status_code != 429:
+                    raise
+                retry_after = e.retry_after or 1.0
+                self.limiter.pause(retry_after)
+                if attempt == self.max_retries or retry_after > self.max_wait:
+                    raise
+
+    async def _send(self, client: httpx.AsyncClient, access_token: str, path: str,
+                    params: Dict[str, Any]) -> Dict[str, Any]:
+        with metrics.track_upstream("spotify", endpoint_label(path)):
+            response = await client.get(
+                path,
+                params=params,
+                headers={"Authorization": f"Bearer {access_token}"},
+            )
+            if response.status_code >= 400:
+                try:
+                    message = response.json()["error"]["message"]
+                except Exception:
+                    message = response.text or response.reason_phrase
+                retry_after = response.headers.get("Retry-After")
+                raise SpotifyError(
+                    response.status_code,
+                    message,
+                    retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+                )
+        return response.json()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced,
+            "paused_for": round(max(0.0, self.limiter.paused_until - time.monotonic()), 1),
+        }
+
+spotify_api = SpotifyAPI(
+    rate=float(os.getenv("SPOTIFY_RATE_LIMIT", "10")),
+    burst=int(os.getenv("SPOTIFY_BURST", "20")),
+    max_wait=float(os.getenv("SPOTIFY_MAX_WAIT", "5")),
+    max_retries=int(os.getenv("SPOTIFY_MAX_RETRIES", "2")),
+)
+
+def taste_properties(top_artists: Dict[str, Any], recent_tracks: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Profile taste fields from /me/top/artists and /me/player/recently-played responses"""
+    artist_names = [artist['name'] for artist in top_artists['items']]
+
+    # Top 5 genres across the top artists, most common first, so the same
+    # listening data always gives the same genres
+    genres = Counter(genre for artist in top_artists['items'] for genre in artist['genres'])
+    top_genres = [genre for genre, _ in genres.most_common(5)]
+
+    # Get recent tracks
+    track_names = [item['track']['name'] for item in recent_tracks['items']]
+
+    return {"topArtists": artist_names, "topGenres": top_genres, "recentTracks": track_names}
+
+class SpotifySession:
+    """Spotify calls made with one access token while serving one inbound request.
+
+    Each call starts its request immediately and returns an awaitable task, so
+    independent calls overlap when they are issued before being awaited.
+    Identical calls share one task, so a request is never sent twice; calls
+    go through spotify_api, so they are rate limited and coalesced with
+    identical calls from other requests as well.
+    """
+
+    def __init__(self, access_token: str, client: Optional[httpx.AsyncClient] = None):
+        self.access_token = access_token
+        self.client = client
+        self._requests: Dict[Tuple, "asyncio.Task[Dict[str, Any]]"] = {}
+
+    async def __aenter__(self) -> "SpotifySession":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Drop requests the handler started but no longer needs
+        for task in self._requests.values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+    def current_user(self) -> "asyncio.Task[Dict[str, Any]]":
+        return self._get("/me")
+
+    def top_artists(self, limit: int = 20, time_range: str = "medium_term") -> "asyncio.Task[Dict[str, Any]]":
+        return self._get("/me/top/artists", limit=limit, time_range=time_range)
+
+    def recently_played(self, limit: int = 20) -> "asyncio.Task[Dict[str, Any]]":
+        return self._get("/me/player/recently-played", limit=limit)
+
+    def _get(self, path: str, **params) -> "asyncio.Task[Dict[str, Any]]":
+        key = (path, tuple(sorted(params.items())))
+        task = self._requests.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(path, params))
+            self._requests[key] = task
+        return task
+
+    async def _fetch(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return await spotify_api.get(self.access_token, path, params, self.client)
@@ -0,0 +1,115 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from app.profile_cache import StoredProfile
+
+# Index-only properties that are never returned to callers
+DERIVED_PROPERTIES = ("usernameGrams",)
+
+# Properties older profiles still carry but nothing reads or writes any more:
+# friend lists now live in Friendship edges (see app/migrate_friendships.py)
+LEGACY_PROPERTIES = ("friends",)
+
+class ProfileExistsError(Exception):
+    """A profile being inserted already exists, under its id or its spotifyId"""
+
+@dataclass
+class ProfileRecord:
+    """A profile to write: its object id, stored properties and taste vector"""
+    uuid: Any
+    properties: Dict[str, Any]
+    vector: Optional[List[float]] = None
+
+class ProfileStore(ABC):
+    """Persistence for UserProfile objects and Friendship edges.
+
+    Implementations only store and index; caching, derived properties and
+    scoring stay in app/repository.py. Profiles are looked up by exact
+    spotifyId/museUsername keys, by username search tokens (usernameGrams)
+    and by taste vector.
+    """
+
+    name = "store"
+
+    async def connect(self):
+        """Open connections if they are not open yet; called before the first query"""
+
+    async def close(self):
+        """Release connections; called once on shutdown"""
+
+    @abstractmethod
+    async def ping(self):
+        """Make one cheap round trip, raising if the store cannot serve queries"""
+
+    @abstractmethod
+    async def ensure_schema(self):
+        """Create or migrate whatever the store needs; must be idempotent"""
+
+    def is_schema_error(self, error: Exception) -> bool:
+        """Whether an error means the schema is missing and ensure_schema should run again"""
+        return False
+
+    # Profiles
+
+    @abstractmethod
+    async def fetch_profiles(self, keys: List[Tuple[str, str]],
+                             properties: Optional[Sequence[str]] = None) -> List[StoredProfile]:
+        """Every profile matching any of the (property, value) keys"""
+
+    @abstractmethod
+    async def insert_profile(self, record: ProfileRecord) -> UUID:
+        """Store a new profile; raises ProfileExistsError if its id or spotifyId is already taken"""
+
+    @abstractmethod
+    async def upsert_profiles(self, records: List[ProfileRecord]) -> Dict[int, str]:
+        """Create or overwrite profiles, returning error messages by position in ``records``"""
+
+    @abstractmethod
+    async def update_profile(self, uuid: UUID, properties: Dict[str, Any], vector: Optional[List[float]] = None):
+        """Overwrite some properties of a stored profile, and its taste vector if one is given"""
+
+    @abstractmethod
+    async def delete_profile(self, uuid: UUID) -> bool:
+        """Remove a profile, returning whether it existed"""
+
+    @abstractmethod
+    async def nearest_profiles(self, vector: List[float], exclude_spotify_id: Optional[str], limit: int,
+                               properties: Sequence[str]) -> List[Tuple[StoredProfile, float]]:
+        """Closest profiles to a taste vector with their cosine distance, closest first"""
+
+    @abstractmethod
+    async def search_usernames(self, grams: List[str], limit: int, properties: Sequence[str]) -> List[StoredProfile]:
+        """Profiles indexed under every one of the given username search tokens"""
+
+    # Friendship edges, keyed by (userId, friendId). An edge existing is what
+    # makes two users friends; its score fields are a cache and may be missing
+
+    @abstractmethod
+    async def fetch_friendship(self, user_id: str, friend_id: str) -> Optional[Dict[str, Any]]:
+        """One directed edge, or None"""
+
+    @abstractmethod
+    async def fetch_friendships(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Every edge starting at user_id, keyed by friendId"""
+
+    @abstractmethod
+    async def fetch_friendship_page(self, user_id: str, after: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Up to limit edges starting at user_id in friendId order, after the given friendId"""
+
+    @abstractmethod
+    async def fetch_friend_ids(self, user_ids: List[str]) -> Dict[str, List[str]]:
+        """Friend ids of many users at once, keyed by userId; users without friends are left out"""
+
+    @abstractmethod
+    async def save_friendships(self, edges: List[Dict[str, Any]]):
+        """Create or overwrite edges; raises if any could not be written"""
+
+    @abstractmethod
+    async def refresh_friendships(self, edges: List[Dict[str, Any]]):
+        """Overwrite the scores on edges that still exist; deleted edges stay deleted"""
+
+    @abstractmethod
+    async def delete_friendship(self, user_id: str, friend_id: str):
+        """Remove one directed edge if it exists"""
@@ -0,0 +1,357 @@
+import asyncio
+import functools
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.profile_cache import StoredProfile
+from app.storage.base import ProfileExistsError, ProfileRecord, ProfileStore
+
+# Profile property -> profiles column. List properties are stored as JSON
+COLUMNS = {
+    "spotifyId": "spotify_id",
+    "displayName": "display_name",
+    "museUsername": "muse_username",
+    "topArtists": "top_artists",
+    "topGenres": "top_genres",
+    "recentTracks": "recent_tracks",
+}
+JSON_PROPERTIES = ("topArtists", "topGenres", "recentTracks")
+
+# Most bound parameters per statement, well under SQLite's limit
+CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    uuid TEXT PRIMARY KEY,
+    spotify_id TEXT NOT NULL UNIQUE,
+    display_name TEXT,
+    muse_username TEXT,
+    top_artists TEXT NOT NULL DEFAULT '[]',
+    top_genres TEXT NOT NULL DEFAULT '[]',
+    recent_tracks TEXT NOT NULL DEFAULT '[]',
+    vector BLOB
+);
+CREATE INDEX IF NOT EXISTS profiles_muse_username ON profiles (muse_username);
+
+CREATE TABLE IF NOT EXISTS username_grams (
+    gram TEXT NOT NULL,
+    spotify_id TEXT NOT NULL REFERENCES profiles (spotify_id) ON DELETE CASCADE,
+    PRIMARY KEY (gram, spotify_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS username_grams_spotify_id ON username_grams (spotify_id);
+
+CREATE TABLE IF NOT EXISTS friendships (
+    user_id TEXT NOT NULL,
+    friend_id TEXT NOT NULL,
+    compatibility_score REAL,
+    shared_artists TEXT NOT NULL DEFAULT '[]',
+    shared_genres TEXT NOT NULL DEFAULT '[]',
+    taste_key TEXT,
+    PRIMARY KEY (user_id, friend_id)
+) WITHOUT ROWID;
+"""
+
+def _chunks(values: List[Any]) -> Iterable[List[Any]]:
+    for start in range(0, len(values), CHUNK):
+        yield values[start:start + CHUNK]
+
+def _placeholders(values: Sequence[Any]) -> str:
+    return ",".join("?" * len(values))
+
+def _pack(vector: Optional[List[float]]) -> Optional[bytes]:
+    return np.asarray(vector, dtype=np.float32).tobytes() if vector else None
+
+def _off_loop(method: Callable) -> Callable:
+    """Turn a blocking store method into a coroutine run on the store's database thread"""
+    @functools.wraps(method)
+    async def run(self: "SQLiteStore", *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, self, *args, **kwargs))
+    return run
+
+def _edge(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "userId": row["user_id"],
+        "friendId": row["friend_id"],
+        "compatibilityScore": row["compatibility_score"],
+        "sharedArtists": json.loads(row["shared_artists"]),
+        "sharedGenres": json.loads(row["shared_genres"]),
+        "tasteKey": row["taste_key"],
+    }
+
+class SQLiteStore(ProfileStore):
+    """Profiles and edges in an embedded SQLite database.
+
+    Exact-key lookups go through the spotify_id/muse_username indexes,
+    a user's friends through the friendships primary key and username
+    search through the username_grams table. Vector search is a brute-force
+    scan over a cached matrix of every stored vector, which suits the small
+    deployments and local runs this store is meant for.
+
+    sqlite3 calls block, so every method runs on one dedicated thread rather
+    than the event loop. A single thread also keeps each method's statements
+    and transaction from interleaving with another's on the shared connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "muse.db"):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        # (uuids, spotify ids, vectors) of every profile with a vector; dropped on profile writes
+        self._vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("PRAGMA foreign_keys = ON")
+        return self._conn
+
+    @_off_loop
+    def connect(self):
+        self.conn
+
+    @_off_loop
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._vectors = None
+
+    @_off_loop
+    def ping(self):
+        self.conn.execute("SELECT 1").fetchone()
+
+    @_off_loop
+    def ensure_schema(self):
+        self.conn.executescript(SCHEMA)
+
+    def is_schema_error(self, error: Exception) -> bool:
+        return isinstance(error, sqlite3.OperationalError) and "no such table" in str(error)
+
+    def _transaction(self):
+        # isolation_level=None leaves transactions to us; the context manager commits or rolls back
+        conn = self.conn
+        conn.execute("BEGIN")
+        return conn
+
+    # Profiles
+
+    def _to_profiles(self, rows: List[sqlite3.Row], properties: Optional[Sequence[str]]) -> List[StoredProfile]:
+        wanted = set(properties) if properties is not None else set(COLUMNS)
+        profiles = []
+        for row in rows:
+            values = {}
+            for name, column in COLUMNS.items():
+                if name in wanted:
+                    values[name] = json.loads(row[column]) if name in JSON_PROPERTIES else row[column]
+            profiles.append(StoredProfile(uuid=UUID(row["uuid"]), properties=values))
+        return profiles
+
+    @_off_loop
+    def fetch_profiles(self, keys: List[Tuple[str, str]],
+                       properties: Optional[Sequence[str]] = None) -> List[StoredProfile]:
+        rows = []
+        for name in ("spotifyId", "museUsername"):
+            values = [value for key, value in keys if key == name]
+            for chunk in _chunks(values):
+                rows.extend(self.conn.execute(
+                    f"SELECT * FROM profiles WHERE {COLUMNS[name]} IN ({_placeholders(chunk)})", chunk
+                ))
+        unique = list({row["uuid"]: row for row in rows}.values())
+        return self._to_profiles(unique, properties)
+
+    def _write_profile(self, conn: sqlite3.Connection, uuid: str, properties: Dict[str, Any],
+                       vector: Optional[List[float]], replace: bool):
+        values = {
+            column: json.dumps(properties.get(name) or []) if name in JSON_PROPERTIES else properties.get(name)
+            for name, column in COLUMNS.items()
+        }
+        columns = ["uuid", *values, "vector"]
+        params = [uuid, *values.values(), _pack(vector)]
+        if replace:
+            updates = ", ".join(f"{column} = excluded.{column}" for column in columns[1:])
+            conn.execute(
+                f"INSERT INTO profiles ({', '.join(columns)}) VALUES ({_placeholders(columns)}) "
+                f"ON CONFLICT (uuid) DO UPDATE SET {updates}",
+                params,
+            )
+        else:
+            conn.execute(f"INSERT INTO profiles ({', '.join(columns)}) VALUES ({_placeholders(columns)})", params)
+        self._vectors = None
+        self._write_grams(conn, properties["spotifyId"], properties)
+
+    def _write_grams(self, conn: sqlite3.Connection, spotify_id: str, properties: Dict[str, Any]):
+        """Replace the username_grams rows if usernameGrams is given"""
+        if "usernameGrams" in properties:
+            conn.execute("DELETE FROM username_grams WHERE spotify_id = ?", (spotify_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO username_grams (gram, spotify_id) VALUES (?, ?)",
+                [(gram, spotify_id) for gram in properties["usernameGrams"] or []],
+            )
+
+    @_off_loop
+    def insert_profile(self, record: ProfileRecord) -> UUID:
+        try:
+            with self._transaction() as conn:
+                self._write_profile(conn, str(record.uuid), record.properties, record.vector, replace=False)
+        except sqlite3.IntegrityError as e:
+            raise ProfileExistsError(str(e)) from e
+        return UUID(str(record.uuid))
+
+    @_off_loop
+    def upsert_profiles(self, records: List[ProfileRecord]) -> Dict[int, str]:
+        errors = {}
+        with self._transaction() as conn:
+            for index, record in enumerate(records):
+                try:
+                    conn.execute("SAVEPOINT record")
+                    self._write_profile(conn, str(record.uuid), record.properties, record.vector, replace=True)
+                    conn.execute("RELEASE record")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO record")
+                    conn.execute("RELEASE record")
+                    errors[index] = str(e)
+        return errors
+
+    @_off_loop
+    def update_profile(self, uuid: UUID, properties: Dict[str, Any], vector: Optional[List[float]] = None):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT spotify_id FROM profiles WHERE uuid = ?", (str(uuid),)).fetchone()
+            if row is None:
+                raise Exception(f"Profile {uuid} not found")
+            changes = {
+                COLUMNS[name]: json.dumps(value or []) if name in JSON_PROPERTIES else value
+                for name, value in properties.items() if name in COLUMNS
+            }
+            if vector is not None:
+                changes["vector"] = _pack(vector)
+                self._vectors = None
+            if changes:
+                assignments = ", ".join(f"{column} = ?" for column in changes)
+                conn.execute(f"UPDATE profiles SET {assignments} WHERE uuid = ?", [*changes.values(), str(uuid)])
+            self._write_grams(conn, row["spotify_id"], properties)
+
+    @_off_loop
+    def delete_profile(self, uuid: UUID) -> bool:
+        self._vectors = None
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM profiles WHERE uuid = ?", (str(uuid),)).rowcount > 0
+
+    def _vector_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._vectors is None:
+            rows = self.conn.execute("SELECT uuid, spotify_id, vector FROM profiles WHERE vector IS NOT NULL").fetchall()
+            self._vectors = (
+                np.array([row["uuid"] for row in rows], dtype=object),
+                np.array([row["spotify_id"] for row in rows], dtype=object),
+                np.array([np.frombuffer(row["vector"], dtype=np.float32) for row in rows], dtype=np.float64),
+            )
+        return self._vectors
+
+    @_off_loop
+    def nearest_profiles(self, vector: List[float], exclude_spotify_id: Optional[str], limit: int,
+                         properties: Sequence[str]) -> List[Tuple[StoredProfile, float]]:
+        uuids, spotify_ids, vectors = self._vector_index()
+        candidates = np.flatnonzero(spotify_ids != exclude_spotify_id)
+        count = min(limit, len(candidates))
+        if count <= 0:
+            return []
+        # Stored vectors are unit length, so cosine distance is 1 - dot product
+        distances = (1.0 - vectors @ np.asarray(vector, dtype=np.float64))[candidates]
+        # Everything as close as the count-th nearest, so ties are broken by uuid
+        cutoff = distances[np.argpartition(distances, count - 1)[count - 1]]
+        closest = np.flatnonzero(distances <= cutoff)
+        nearest = sorted(zip(distances[closest].tolist(), uuids[candidates[closest]]))[:count]
+
+        ids = [uuid for _, uuid in nearest]
+        rows = self.conn.execute(f"SELECT * FROM profiles WHERE uuid IN ({_placeholders(ids)})", ids).fetchall()
+        by_uuid = {str(profile.uuid): profile for profile in self._to_profiles(rows, properties)}
+        return [(by_uuid[uuid], distance) for distance, uuid in nearest if uuid in by_uuid]
+
+    @_off_loop
+    def search_usernames(self, grams: List[str], limit: int, properties: Sequence[str]) -> List[StoredProfile]:
+        rows = self.conn.execute(
+            f"SELECT p.* FROM profiles p JOIN ("
+            f"  SELECT spotify_id FROM username_grams WHERE gram IN ({_placeholders(grams)})"
+            f"  GROUP BY spotify_id HAVING COUNT(*) = ?"
+            f") matched ON matched.spotify_id = p.spotify_id LIMIT ?",
+            [*grams, len(set(grams)), limit],
+        ).fetchall()
+        return self._to_profiles(rows, properties)
+
+    # Friendship edges
+
+    @_off_loop
+    def fetch_friendship(self, user_id: str, friend_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT * FROM friendships WHERE user_id = ? AND friend_id = ?", (user_id, friend_id)
+        ).fetchone()
+        return _edge(row) if row else None
+
+    @_off_loop
+    def fetch_friendships(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        rows = self.conn.execute("SELECT * FROM friendships WHERE user_id = ?", (user_id,))
+        return {row["friend_id"]: _edge(row) for row in rows}
+
+    @_off_loop
+    def fetch_friendship_page(self, user_id: str, after: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        # Walks the (user_id, friend_id) primary key from the cursor onwards
+        rows = self.conn.execute(
+            "SELECT * FROM friendships WHERE user_id = ? AND friend_id > ? ORDER BY friend_id LIMIT ?",
+            (user_id, after or "", limit),
+        )
+        return [_edge(row) for row in rows]
+
+    @_off_loop
+    def fetch_friend_ids(self, user_ids: List[str]) -> Dict[str, List[str]]:
+        adjacency: Dict[str, List[str]] = {}
+        for chunk in _chunks(user_ids):
+            for row in self.conn.execute(
+                f"SELECT user_id, friend_id FROM friendships WHERE user_id IN ({_placeholders(chunk)})", chunk
+            ):
+                adjacency.setdefault(row["user_id"], []).append(row["friend_id"])
+        return adjacency
+
+    @_off_loop
+    def save_friendships(self, edges: List[Dict[str, Any]]):
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO friendships "
+                "(user_id, friend_id, compatibility_score, shared_artists, shared_genres, taste_key) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (edge["userId"], edge["friendId"], edge.get("compatibilityScore"),
+                     json.dumps(edge.get("sharedArtists") or []), json.dumps(edge.get("sharedGenres") or []),
+                     edge.get("tasteKey"))
+                    for edge in edges
+                ],
+            )
+
+    @_off_loop
+    def refresh_friendships(self, edges: List[Dict[str, Any]]):
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE friendships SET compatibility_score = ?, shared_artists = ?, shared_genres = ?, taste_key = ? "
+                "WHERE user_id = ? AND friend_id = ?",
+                [
+                    (edge.get("compatibilityScore"), json.dumps(edge.get("sharedArtists") or []),
+                     json.dumps(edge.get("sharedGenres") or []), edge.get("tasteKey"),
+                     edge["userId"], edge["friendId"])
+                    for edge in edges
+                ],
+            )
+
+    @_off_loop
+    def delete_friendship(self, user_id: str, friend_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM friendships WHERE user_id = ? AND friend_id = ?", (user_id, friend_id))
@@ -0,0 +1,418 @@
+import weaviate
+from weaviate.classes.init import Auth
+from weaviate.classes.config import Configure, Property, DataType, Tokenization, VectorDistances
+from weaviate.classes.query import Filter, MetadataQuery, Sort
+from weaviate.classes.data import DataObject
+from weaviate.util import generate_uuid5
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+from uuid import UUID
+
+from app.metrics import track_upstream
+from app.profile_cache import StoredProfile
+from app.storage.base import DERIVED_PROPERTIES, LEGACY_PROPERTIES, ProfileExistsError, ProfileRecord, ProfileStore
+
+logger = logging.getLogger(__name__)
+
+# Objects read per query; larger result sets are paged
+PAGE_SIZE = 100
+
+def create_client() -> weaviate.WeaviateAsyncClient:
+    """Async client for the instance configured by WEAVIATE_URL, not yet connected"""
+    url = os.getenv("WEAVIATE_URL") or ""
+    if url.startswith("http://"):
+        # Plain-HTTP URLs point at a self-hosted instance, e.g. the bench/ container
+        parsed = urlparse(url)
+        return weaviate.use_async_with_local(
+            host=parsed.hostname,
+            port=parsed.port or 8080,
+            grpc_port=int(os.getenv("WEAVIATE_GRPC_PORT", "50051")),
+        )
+    return weaviate.use_async_with_weaviate_cloud(
+        cluster_url=url,
+        auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
+    )
+
+def connect_sync() -> weaviate.WeaviateClient:
+    """Connected blocking client for scripts, configured like create_client()"""
+    url = os.getenv("WEAVIATE_URL") or ""
+    if url.startswith("http://"):
+        parsed = urlparse(url)
+        return weaviate.connect_to_local(
+            host=parsed.hostname,
+            port=parsed.port or 8080,
+            grpc_port=int(os.getenv("WEAVIATE_GRPC_PORT", "50051")),
+        )
+    return weaviate.connect_to_weaviate_cloud(
+        cluster_url=url,
+        auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
+    )
+
+USER_PROFILE_PROPERTIES = [
+    Property(
+        name="spotifyId",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        description="Spotify user ID",
+    ),
+    Property(
+        name="displayName",
+        data_type=DataType.TEXT,
+        description="User's display name from Spotify",
+    ),
+    Property(
+        name="museUsername",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        description="User's unique username in Muse",
+    ),
+    Property(
+        name="topArtists",
+        data_type=DataType.TEXT_ARRAY,
+        description="User's top artists from Spotify",
+    ),
+    Property(
+        name="topGenres",
+        data_type=DataType.TEXT_ARRAY,
+        description="User's top genres from Spotify",
+    ),
+    Property(
+        name="recentTracks",
+        data_type=DataType.TEXT_ARRAY,
+        description="User's recently played tracks from Spotify",
+    ),
+    Property(
+        name="friends",
+        data_type=DataType.TEXT_ARRAY,
+        description="Legacy list of friend's museUsernames, superseded by Friendship edges",
+    ),
+    Property(
+        name="usernameGrams",
+        data_type=DataType.TEXT_ARRAY,
+        tokenization=Tokenization.FIELD,
+        description="Prefix and trigram tokens of museUsername for indexed search",
+    ),
+]
+
+FRIENDSHIP_PROPERTIES = [
+    Property(
+        name="userId",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        description="Spotify ID of the user the edge starts from",
+    ),
+    Property(
+        name="friendId",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        description="Spotify ID of the friend the edge points to",
+    ),
+    Property(
+        name="compatibilityScore",
+        data_type=DataType.NUMBER,
+        description="Compatibility score from the user's point of view",
+    ),
+    Property(
+        name="sharedArtists",
+        data_type=DataType.TEXT_ARRAY,
+        description="Top artists both users share",
+    ),
+    Property(
+        name="sharedGenres",
+        data_type=DataType.TEXT_ARRAY,
+        description="Top genres both users share",
+    ),
+    Property(
+        name="tasteKey",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        description="Fingerprint of both users' taste data the scores were computed from",
+    ),
+]
+
+# Collection name -> create() arguments
+COLLECTIONS = {
+    "UserProfile": dict(
+        description="Collection storing user profiles for Muse app",
+        properties=USER_PROFILE_PROPERTIES,
+        # Taste vectors are computed locally (app/embedding.py) and
+        # searched with HNSW for compatible-user discovery
+        vectorizer_config=Configure.Vectorizer.none(),
+        vector_index_config=Configure.VectorIndex.hnsw(distance_metric=VectorDistances.COSINE),
+    ),
+    "Friendship": dict(
+        description="Directed friendship edges with precomputed compatibility",
+        properties=FRIENDSHIP_PROPERTIES,
+        vectorizer_config=Configure.Vectorizer.none(),
+    ),
+}
+
+def ensure_schema_sync(client: weaviate.WeaviateClient):
+    """Blocking equivalent of WeaviateStore.ensure_schema, for scripts that write with connect_sync()"""
+    for name, config in COLLECTIONS.items():
+        if not client.collections.exists(name):
+            logger.info(f"Creating {name} collection...")
+            client.collections.create(name=name, **config)
+            continue
+        collection = client.collections.get(name)
+        existing = {prop.name for prop in collection.config.get().properties}
+        for prop in config["properties"]:
+            if prop.name not in existing:
+                logger.info(f"Adding {prop.name} to {name}")
+                collection.config.add_property(prop)
+
+def friendship_uuid(user_id: str, friend_id: str) -> str:
+    """Deterministic id of the edge from user_id to friend_id"""
+    return generate_uuid5(f"{user_id}->{friend_id}", "Friendship")
+
+def _is_not_found(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 404 or "not found" in str(error).lower()
+
+def _to_profile(obj: Any) -> StoredProfile:
+    properties = {
+        key: value for key, value in obj.properties.items()
+        if key not in DERIVED_PROPERTIES and key not in LEGACY_PROPERTIES
+    }
+    return StoredProfile(uuid=obj.uuid, properties=properties)
+
+class WeaviateStore(ProfileStore):
+    """Profiles and edges in the UserProfile and Friendship collections"""
+
+    name = "weaviate"
+
+    def __init__(self, client: Optional[weaviate.WeaviateAsyncClient] = None):
+        self.client = client or create_client()
+        self._connecting: Optional["asyncio.Task[None]"] = None
+
+    async def connect(self):
+        # Callers share one attempt and wait on it shielded, so a caller that
+        # gives up, like a timed-out readiness probe, cannot cancel it half way
+        if self._connecting is None:
+            if self.client.is_connected():
+                return
+            self._connecting = asyncio.ensure_future(self._connect())
+            self._connecting.add_done_callback(self._connect_finished)
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self):
+        try:
+            await self.client.connect()
+        except BaseException:
+            # The client flags itself connected before the connection is up, so
+            # a failed or cancelled attempt is closed to let the next one start over
+            await self.client.close()
+            raise
+
+    def _connect_finished(self, task: "asyncio.Task[None]"):
+        if self._connecting is task:
+            self._connecting = None
+        if not task.cancelled():
+            task.exception()
+
+    async def close(self):
+        if self._connecting is not None:
+            self._connecting.cancel()
+            await asyncio.gather(self._connecting, return_exceptions=True)
+        await self.client.close()
+
+    async def ping(self):
+        with track_upstream("weaviate", "is_ready"):
+            ready = await self.client.is_ready()
+        if not ready:
+            raise RuntimeError("Weaviate is not ready")
+
+    async def ensure_schema(self):
+        for name, config in COLLECTIONS.items():
+            with track_upstream("weaviate", f"{name}.exists"):
+                exists = await self.client.collections.exists(name)
+            if not exists:
+                logger.info(f"Creating {name} collection...")
+                with track_upstream("weaviate", f"{name}.create"):
+                    await self.client.collections.create(name=name, **config)
+                logger.info(f"{name} collection created successfully")
+                continue
+
+            # Add properties introduced after the collection was created
+            collection = self.client.collections.get(name)
+            with track_upstream("weaviate", f"{name}.config.get"):
+                existing = {prop.name for prop in (await collection.config.get()).properties}
+            for prop in config["properties"]:
+                if prop.name not in existing:
+                    logger.info(f"Adding {prop.name} to {name}")
+                    with track_upstream("weaviate", f"{name}.config.add_property"):
+                        await collection.config.add_property(prop)
+
+    def is_schema_error(self, error: Exception) -> bool:
+        message = str(error).lower()
+        return "class" in message and any(
+            phrase in message for phrase in ("not found", "does not exist", "could not find", "no such")
+        )
+
+    # Profiles
+
+    async def fetch_profiles(self, keys: List[Tuple[str, str]],
+                             properties: Optional[Sequence[str]] = None) -> List[StoredProfile]:
+        user_collection = self.client.collections.get("UserProfile")
+        filters = Filter.any_of([Filter.by_property(name).equal(value) for name, value in keys])
+
+        # Text filters match on tokens and can return near misses, so keep paging
+        # until Weaviate runs out of matches rather than stopping at len(keys)
+        profiles = []
+        offset = 0
+        while True:
+            with track_upstream("weaviate", "UserProfile.fetch_objects"):
+                result = await user_collection.query.fetch_objects(
+                    filters=filters,
+                    limit=PAGE_SIZE,
+                    offset=offset,
+                    return_properties=list(properties) if properties is not None else None,
+                )
+            profiles.extend(_to_profile(obj) for obj in result.objects)
+            if len(result.objects) < PAGE_SIZE:
+                return profiles
+            offset += PAGE_SIZE
+
+    async def insert_profile(self, record: ProfileRecord) -> UUID:
+        user_collection = self.client.collections.get("UserProfile")
+        try:
+            with track_upstream("weaviate", "UserProfile.insert"):
+                return await user_collection.data.insert(record.properties, uuid=record.uuid, vector=record.vector)
+        except Exception as e:
+            if "already exists" in str(e):
+                raise ProfileExistsError(str(e)) from e
+            raise
+
+    async def upsert_profiles(self, records: List[ProfileRecord]) -> Dict[int, str]:
+        user_collection = self.client.collections.get("UserProfile")
+        with track_upstream("weaviate", "UserProfile.insert_many"):
+            result = await user_collection.data.insert_many([
+                DataObject(properties=record.properties, uuid=record.uuid, vector=record.vector)
+                for record in records
+            ])
+        return {index: error.message for index, error in result.errors.items()}
+
+    async def update_profile(self, uuid: UUID, properties: Dict[str, Any], vector: Optional[List[float]] = None):
+        user_collection = self.client.collections.get("UserProfile")
+        with track_upstream("weaviate", "UserProfile.update"):
+            await user_collection.data.update(uuid=uuid, properties=properties, vector=vector)
+
+    async def delete_profile(self, uuid: UUID) -> bool:
+        user_collection = self.client.collections.get("UserProfile")
+        with track_upstream("weaviate", "UserProfile.delete_by_id"):
+            return await user_collection.data.delete_by_id(uuid)
+
+    async def nearest_profiles(self, vector: List[float], exclude_spotify_id: Optional[str], limit: int,
+                               properties: Sequence[str]) -> List[Tuple[StoredProfile, float]]:
+        user_collection = self.client.collections.get("UserProfile")
+        filters = None
+        if exclude_spotify_id:
+            filters = Filter.by_property("spotifyId").not_equal(exclude_spotify_id)
+        with track_upstream("weaviate", "UserProfile.near_vector"):
+            result = await user_collection.query.near_vector(
+                near_vector=vector,
+                limit=limit,
+                filters=filters,
+                return_properties=list(properties),
+                return_metadata=MetadataQuery(distance=True),
+            )
+        return [(_to_profile(obj), obj.metadata.distance) for obj in result.objects]
+
+    async def search_usernames(self, grams: List[str], limit: int, properties: Sequence[str]) -> List[StoredProfile]:
+        user_collection = self.client.collections.get("UserProfile")
+        with track_upstream("weaviate", "UserProfile.fetch_objects"):
+            result = await user_collection.query.fetch_objects(
+                filters=Filter.by_property("usernameGrams").contains_all(grams),
+                limit=limit,
+                return_properties=list(properties),
+            )
+        return [_to_profile(obj) for obj in result.objects]
+
+    # Friendship edges
+
+    async def fetch_friendship(self, user_id: str, friend_id: str) -> Optional[Dict[str, Any]]:
+        friendship_collection = self.client.collections.get("Friendship")
+        with track_upstream("weaviate", "Friendship.fetch_object_by_id"):
+            obj = await friendship_collection.query.fetch_object_by_id(friendship_uuid(user_id, friend_id))
+        return dict(obj.properties) if obj else None
+
+    async def fetch_friendships(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        friendship_collection = self.client.collections.get("Friendship")
+        edges = {}
+        offset = 0
+        while True:
+            with track_upstream("weaviate", "Friendship.fetch_objects"):
+                result = await friendship_collection.query.fetch_objects(
+                    filters=Filter.by_property("userId").equal(user_id),
+                    limit=PAGE_SIZE,
+                    offset=offset,
+                )
+            for obj in result.objects:
+                edges[obj.properties["friendId"]] = dict(obj.properties)
+            if len(result.objects) < PAGE_SIZE:
+                return edges
+            offset += PAGE_SIZE
+
+    async def fetch_friendship_page(self, user_id: str, after: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        friendship_collection = self.client.collections.get("Friendship")
+        filters = Filter.by_property("userId").equal(user_id)
+        if after is not None:
+            # Keyset pagination: cheap at any depth, unlike a growing offset
+            filters = filters & Filter.by_property("friendId").greater_than(after)
+        with track_upstream("weaviate", "Friendship.fetch_objects"):
+            result = await friendship_collection.query.fetch_objects(
+                filters=filters,
+                limit=limit,
+                sort=Sort.by_property("friendId", ascending=True),
+            )
+        return [dict(obj.properties) for obj in result.objects]
+
+    async def fetch_friend_ids(self, user_ids: List[str]) -> Dict[str, List[str]]:
+        friendship_collection = self.client.collections.get("Friendship")
+        adjacency: Dict[str, List[str]] = {}
+        offset = 0
+        while True:
+            with track_upstream("weaviate", "Friendship.fetch_objects"):
+                result = await friendship_collection.query.fetch_objects(
+                    filters=Filter.by_property("userId").contains_any(user_ids),
+                    limit=PAGE_SIZE,
+                    offset=offset,
+                    return_properties=["userId", "friendId"],
+                )
+            for obj in result.objects:
+                adjacency.setdefault(obj.properties["userId"], []).append(obj.properties["friendId"])
+            if len(result.objects) < PAGE_SIZE:
+                return adjacency
+            offset += PAGE_SIZE
+
+    async def save_friendships(self, edges: List[Dict[str, Any]]):
+        friendship_collection = self.client.collections.get("Friendship")
+        with track_upstream("weaviate", "Friendship.insert_many"):
+            result = await friendship_collection.data.insert_many([
+                DataObject(properties=edge, uuid=friendship_uuid(edge["userId"], edge["friendId"]))
+                for edge in edges
+            ])
+        if result.errors:
+            raise Exception(f"Failed to save {len(result.errors)} friendship edges: {list(result.errors.values())[0]}")
+
+    async def refresh_friendships(self, edges: List[Dict[str, Any]]):
+        friendship_collection = self.client.collections.get("Friendship")
+
+        async def refresh(edge: Dict[str, Any]):
+            # update() only patches existing objects, so an edge deleted since it was read is not recreated
+            with track_upstream("weaviate", "Friendship.update"):
+                await friendship_collection.data.update(
+                    uuid=friendship_uuid(edge["userId"], edge["friendId"]), properties=edge
+                )
+
+        results = await asyncio.gather(*[refresh(edge) for edge in edges], return_exceptions=True)
+        for error in results:
+            if isinstance(error, Exception) and not _is_not_found(error):
+                raise error
+
+    async def delete_friendship(self, user_id: str, friend_id: str):
+        friendship_collection = self.client.collections.get("Friendship")
+        with track_upstream("weaviate", "Friendship.delete_by_id"):
+            await friendship_collection.data.delete_by_id(friendship_uuid(user_id, friend_id))
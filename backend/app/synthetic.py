@@ -0,0 +1,120 @@
+import random
+from typing import Any, Dict, List
+
+# Listening scenes synthetic users are drawn from. Each user mostly listens
+# to one scene with some spill-over into others, which gives the taste
+# overlap between users a realistic spread for compatibility and discovery
+SCENES = {
+    "house": {
+        "artists": ["Fred again..", "Four Tet", "Jamie xx", "Bicep", "Bonobo", "Disclosure",
+                    "Peggy Gou", "Floating Points", "Overmono", "Caribou", "Kaytranada", "Skrillex"],
+        "genres": ["stutter house", "house", "electronic", "uk garage", "deep house", "techno"],
+    },
+    "classical": {
+        "artists": ["Ludovico Einaudi", "Max Richter", "Nils Frahm", "Ólafur Arnalds", "Hania Rani",
+                    "Yann Tiersen", "Johann Johannsson", "Philip Glass", "Arvo Pärt"],
+        "genres": ["classical", "neoclassical", "ambient", "compositional ambient", "minimalism"],
+    },
+    "metal": {
+        "artists": ["Metallica", "Iron Maiden", "Slayer", "Megadeth", "Black Sabbath", "Gojira",
+                    "Mastodon", "Pantera", "Judas Priest", "Opeth"],
+        "genres": ["metal", "heavy metal", "thrash metal", "rock", "classic rock", "progressive metal"],
+    },
+    "country": {
+        "artists": ["Luke Combs", "Morgan Wallen", "Chris Stapleton", "Luke Bryan", "Blake Shelton",
+                    "Zach Bryan", "Kacey Musgraves", "Tyler Childers", "Carrie Underwood"],
+        "genres": ["country", "contemporary country", "country road", "country pop", "modern country rock"],
+    },
+    "pop": {
+        "artists": ["Taylor Swift", "Dua Lipa", "Harry Styles", "Olivia Rodrigo", "Sabrina Carpenter",
+                    "Charli xcx", "The Weeknd", "Ariana Grande", "Chappell Roan", "Billie Eilish"],
+        "genres": ["pop", "dance pop", "art pop", "electropop", "post-teen pop"],
+    },
+    "hip hop": {
+        "artists": ["Kendrick Lamar", "Tyler, The Creator", "Drake", "J. Cole", "Travis Scott",
+                    "Doechii", "Little Simz", "Denzel Curry", "JID", "Earl Sweatshirt"],
+        "genres": ["hip hop", "rap", "conscious hip hop", "trap", "alternative hip hop"],
+    },
+    "indie": {
+        "artists": ["Phoebe Bridgers", "Arctic Monkeys", "Mitski", "The Strokes", "Big Thief",
+                    "Alvvays", "Boygenius", "Vampire Weekend", "Beach House", "Tame Impala"],
+        "genres": ["indie", "indie rock", "alternative", "dream pop", "bedroom pop", "psychedelic rock"],
+    },
+    "jazz": {
+        "artists": ["Kamasi Washington", "Robert Glasper", "Snarky Puppy", "Nubya Garcia",
+                    "Esperanza Spalding", "BADBADNOTGOOD", "Shabaka", "Makaya McCraven"],
+        "genres": ["jazz", "contemporary jazz", "jazz fusion", "nu jazz", "uk jazz"],
+    },
+}
+
+# How likely a user is to belong to each scene; a few scenes dominate
+SCENE_WEIGHTS = [5, 2, 2, 3, 6, 5, 4, 1]
+
+_FIRST_NAMES = ["Alex", "Sarah", "Mike", "Carol", "Jordan", "Priya", "Sam", "Lena", "Omar", "Yuki",
+                "Diego", "Nina", "Theo", "Maya", "Kofi", "Ines", "Ravi", "Zoe", "Felix", "Ama"]
+_TRACK_WORDS = ["Night", "Light", "Love", "Gold", "Echo", "River", "Fire", "Dream", "Static",
+                "Summer", "Ghost", "Heart", "Stars", "Glass", "Motion", "Blue", "Wild", "Home"]
+
+def _zipf_sample(rng: random.Random, items: List[str], k: int) -> List[str]:
+    """Pick k distinct items, favouring the front of the list like real popularity does"""
+    weights = [1.0 / (rank + 1) for rank in range(len(items))]
+    chosen: List[str] = []
+    while len(chosen) < min(k, len(items)):
+        item = rng.choices(items, weights=weights)[0]
+        if item not in chosen:
+            chosen.append(item)
+    return chosen
+
+def generate_users(count: int, seed: int = 0, mean_friends: float = 4.0) -> List[Dict[str, Any]]:
+    """Generate ``count`` synthetic UserProfile dicts with mutual friendships.
+
+    The output is deterministic for a given seed. Friends are museUsernames
+    and are mostly picked from users in the same scene.
+    """
+    rng = random.Random(seed)
+    scene_names = list(SCENES)
+    users = []
+    user_scenes = []
+    members: Dict[str, List[int]] = {name: [] for name in scene_names}
+
+    for index in range(count):
+        scene = rng.choices(scene_names, weights=SCENE_WEIGHTS)[0]
+        other = rng.choices(scene_names, weights=SCENE_WEIGHTS)[0]
+        # Around four of five top artists come from the user's main scene
+        main_count = rng.choice([3, 4, 4, 5])
+        artists = _zipf_sample(rng, SCENES[scene]["artists"], main_count)
+        artists += [artist for artist in _zipf_sample(rng, SCENES[other]["artists"], 5) if artist not in artists]
+        genres = _zipf_sample(rng, SCENES[scene]["genres"], 4)
+        genres += [genre for genre in _zipf_sample(rng, SCENES[other]["genres"], 3) if genre not in genres]
+
+        name = rng.choice(_FIRST_NAMES)
+        users.append({
+            "spotifyId": f"synthetic_{seed}_{index}",
+            "displayName": name,
+            "museUsername": f"{name.lower()}_{scene.replace(' ', '')}_{index}",
+            "topArtists": artists[:5],
+            "topGenres": genres[:5],
+            "recentTracks": [
+                f"{rng.choice(_TRACK_WORDS)} {rng.choice(_TRACK_WORDS)}" for _ in range(5)
+            ],
+            "friends": [],
+        })
+        user_scenes.append(scene)
+        members[scene].append(index)
+
+    # Each user starts a few friendships, most of them inside their own scene
+    friend_sets = [set() for _ in users]
+    for index in range(count):
+        scene = user_scenes[index]
+        for _ in range(int(rng.expovariate(2.0 / mean_friends))):
+            if rng.random() < 0.7 and len(members[scene]) > 1:
+                friend = rng.choice(members[scene])
+            else:
+                friend = rng.randrange(count)
+            if friend != index:
+                friend_sets[index].add(friend)
+                friend_sets[friend].add(index)
+
+    for index, user in enumerate(users):
+        user["friends"] = sorted(users[friend]["museUsername"] for friend in friend_sets[index])
+    return users
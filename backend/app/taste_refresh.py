@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from app.db import ensure_schema
+from app.embedding import profile_vector
+from app.repository import fetch_profile, update_profile
+from app.spotify import SpotifyError, SpotifySession, taste_properties
+from app.token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+# Spotify access tokens last an hour; a user idle for longer has no usable token
+TOKEN_LIFETIME = 3600
+
+@dataclass
+class ActiveUser:
+    access_token: str
+    last_seen: float
+    next_due: float
+
+class TasteRefresher:
+    """Background worker that keeps stored taste data in sync with Spotify.
+
+    The server holds no Spotify credentials of its own, so it refreshes
+    users whose access token it has seen in the last hour; the token cache
+    reports every token it resolves. Each cycle takes the users whose
+    profile is due, most recently active first, and refreshes up to
+    ``batch_size`` of them with at most ``concurrency`` at once. A 429
+    pauses the worker for as long as Spotify asks, and only fields that
+    changed are written, so unchanged profiles cost no storage write.
+    """
+
+    def __init__(self, interval: float = 21600, tick: float = 60, concurrency: int = 2,
+                 batch_size: int = 50, max_users: int = 10000):
+        self.interval = interval
+        self.tick = tick
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_users = max_users
+        self.refreshed = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._users: "OrderedDict[str, ActiveUser]" = OrderedDict()
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._listening = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def note_activity(self, access_token: str, user: Dict[str, Any]):
+        """Remember the newest token of an active user; new users are due at once"""
+        spotify_id = user.get("id")
+        if not spotify_id:
+            return
+        now = time.monotonic()
+        previous = self._users.pop(spotify_id, None)
+        self._users[spotify_id] = ActiveUser(access_token, now, previous.next_due if previous else now)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def mark_fresh(self, spotify_id: str):
+        """Record that a profile was just written from Spotify data"""
+        entry = self._users.get(spotify_id)
+        if entry is not None:
+            entry.next_due = time.monotonic() + self.interval
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """Users to refresh this cycle, most recently active first"""
+        now = time.monotonic() if now is None else now
+        for spotify_id in [key for key, entry in self._users.items() if now - entry.last_seen > TOKEN_LIFETIME]:
+            del self._users[spotify_id]
+        due = [(entry.last_seen, spotify_id) for spotify_id, entry in self._users.items() if entry.next_due <= now]
+        return [spotify_id for _, spotify_id in heapq.nlargest(self.batch_size, due)]
+
+    async def run_once(self) -> int:
+        """Refresh the users that are due, returning how many were attempted"""
+        if time.monotonic() < self._paused_until:
+            return 0
+        due = self.due()
+        if due:
+            # Storage connects lazily; the worker may run before any request has
+            await ensure_schema()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(spotify_id: str):
+            async with semaphore:
+                if time.monotonic() >= self._paused_until:
+                    await self.refresh_user(spotify_id)
+
+        await asyncio.gather(*[refresh(spotify_id) for spotify_id in due])
+        return len(due)
+
+    async def refresh_user(self, spotify_id: str):
+        """Re-read one user's taste from Spotify and write the fields that changed"""
+        entry = self._users.get(spotify_id)
+        if entry is None:
+            return
+        try:
+            async with SpotifySession(entry.access_token) as spotify:
+                top_artists, recent_tracks = await asyncio.gather(
+                    spotify.top_artists(limit=5, time_range="medium_term"),
+                    spotify.recently_played(limit=5),
+                )
+        except SpotifyError as e:
+            if e.status_code == 429:
+                self.rate_limited += 1
+                self._paused_until = time.monotonic() + (e.retry_after or self.tick)
+                logger.warning(f"Spotify rate limit hit, pausing taste refresh for {self._paused_until - time.monotonic():.0f}s")
+            elif e.status_code == 401 and self._users.get(spotify_id) is entry:
+                # Expired or revoked; the user is picked up again with their next token
+                del self._users[spotify_id]
+            else:
+                self.failed += 1
+                entry.next_due = time.monotonic() + self.tick * 10
+            return
+        entry.next_due = time.monotonic() + self.interval
+
+        try:
+            profile = await fetch_profile(spotify_id)
+            if profile is None:
+                return
+            taste = taste_properties(top_artists, recent_tracks)
+            changes = {name: value for name, value in taste.items() if profile.properties.get(name) != value}
+            if not changes:
+                self.unchanged += 1
+                return
+            vector = profile_vector({**profile.properties, **changes})
+            await update_profile(spotify_id, profile.uuid, changes, vector)
+            self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Failed to refresh taste for {spotify_id}: {e}")
+
+    def start(self):
+        """Start the worker on the running event loop, if refreshing is enabled"""
+        if not self.enabled or self._task is not None:
+            return
+        if not self._listening:
+            token_cache.add_listener(self.note_activity)
+            self._listening = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.warning(f"Taste refresh cycle failed: {e}")
+            await asyncio.sleep(self.tick)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "active_users": len(self._users),
+            "refreshed": self.refreshed,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
+
+taste_refresher = TasteRefresher(
+    interval=float(os.getenv("TASTE_REFRESH_INTERVAL", "21600")),
+    tick=float(os.getenv("TASTE_REFRESH_TICK", "60")),
+    concurrency=int(os.getenv("TASTE_REFRESH_CONCURRENCY", "2")),
+    batch_size=int(os.getenv("TASTE_REFRESH_BATCH", "50")),
+)
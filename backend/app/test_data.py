@@ -1,17 +1,12 @@
-import weaviate
-from weaviate.classes.init import Auth
-import os
+import sys
 from dotenv import load_dotenv
 
+from app.ingest_profiles import ingest, print_report
+from app.synthetic import generate_users
+
 # Load environment variables
 load_dotenv()
 
-# Weaviate client setup
-client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=os.getenv("WEAVIATE_URL"),
-    auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
-)
-
 # Test users data
 test_users = [
     {
@@ -128,29 +123,19 @@ test_users = [
     }
 ]
 
-def add_test_users():
-    user_collection = client.collections.get("UserProfile")
-    
-    for user in test_users:
-        try:
-            # Check if user already exists
-            existing = user_collection.query.fetch_objects(
-                filters=weaviate.classes.query.Filter.by_property("spotifyId").equal(user["spotifyId"])
-            )
-            
-            if not existing.objects:
-                user_collection.data.insert(user)
-                print(f"Added user: {user['displayName']} (@{user['museUsername']})")
-            else:
-                print(f"User already exists: {user['displayName']} (@{user['museUsername']})")
-                
-        except Exception as e:
-            print(f"Error adding user {user['displayName']}: {str(e)}")
+def add_test_users(users=test_users):
+    """Load users in batches; users already stored are overwritten rather than duplicated"""
+    print_report(ingest(users))
 
 if __name__ == "__main__":
-    add_test_users()
-    print("\nTest users you can add as friends:")
-    print("1. @alex_classical (similar music taste)")
-    print("2. @sarah_house (similar music taste)")
-    print("3. @metalhead_mike (different music taste)")
-    print("4. @country_carol (different music taste)") 
\ No newline at end of file
+    # Run from backend/ with `python -m app.test_data`, or `python -m app.test_data N`
+    # to load N synthetic users for load testing instead
+    if len(sys.argv) > 1:
+        add_test_users(generate_users(int(sys.argv[1])))
+    else:
+        add_test_users()
+        print("\nTest users you can add as friends:")
+        print("1. @alex_classical (similar music taste)")
+        print("2. @sarah_house (similar music taste)")
+        print("3. @metalhead_mike (different music taste)")
+        print("4. @country_carol (different music taste)")
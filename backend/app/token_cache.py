@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from fastapi import Header, HTTPException
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.spotify import SpotifySession, SpotifyError, spotify_http_error
+
+class TokenCache:
+    """Maps Spotify access tokens to the user they belong to.
+
+    Entries live for ``ttl`` seconds, or until the token itself expires when
+    its lifetime is known from the OAuth callback, whichever comes first.
+    The cache holds at most ``max_size`` tokens and evicts the least
+    recently used one beyond that.
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._token_expiry: "OrderedDict[str, float]" = OrderedDict()
+        self._pending: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """Call ``listener(access_token, user)`` whenever a token is resolved to its user"""
+        self._listeners.append(listener)
+
+    def get(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """Return the cached user for a token, counting the hit or miss"""
+        entry = self._entries.get(access_token)
+        if entry is not None:
+            user, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(access_token)
+                self.hits += 1
+                return user
+            del self._entries[access_token]
+        self.misses += 1
+        return None
+
+    def put(self, access_token: str, user: Dict[str, Any]):
+        expires_at = time.monotonic() + self.ttl
+        token_expiry = self._token_expiry.pop(access_token, None)
+        if token_expiry is not None:
+            expires_at = min(expires_at, token_expiry)
+        self._entries[access_token] = (user, expires_at)
+        self._entries.move_to_end(access_token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        for listener in self._listeners:
+            listener(access_token, user)
+
+    def set_expiry(self, access_token: str, expires_in: float):
+        """Record when a token expires so its entry never outlives it"""
+        token_expiry = time.monotonic() + expires_in
+        entry = self._entries.get(access_token)
+        if entry is not None:
+            self._entries[access_token] = (entry[0], min(entry[1], token_expiry))
+        else:
+            self._token_expiry[access_token] = token_expiry
+            while len(self._token_expiry) > self.max_size:
+                self._token_expiry.popitem(last=False)
+
+    def invalidate(self, access_token: str):
+        self._entries.pop(access_token, None)
+
+    async def fetch(self, access_token: str, load: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Load the user for a token upstream and cache it.
+
+        Concurrent fetches for the same token share one upstream call.
+        """
+        task = self._pending.get(access_token)
+        if task is None:
+            task = asyncio.ensure_future(load())
+            self._pending[access_token] = task
+            task.add_done_callback(lambda _: self._pending.pop(access_token, None))
+        user = await asyncio.shield(task)
+        self.put(access_token, user)
+        return user
+
+    async def resolve(self, access_token: str, load: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Return the cached user for a token, fetching it on a miss"""
+        user = self.get(access_token)
+        if user is None:
+            user = await self.fetch(access_token, load)
+        return user
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+token_cache = TokenCache(ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")))
+
+async def get_spotify_user(access_token: str = Header(..., alias="access-token")) -> Dict[str, Any]:
+    """FastAPI dependency that validates the access-token header and returns its Spotify user"""
+    if not access_token:
+        raise HTTPException(status_code=401, detail="No access token provided")
+
+    async with SpotifySession(access_token) as spotify:
+        try:
+            return await token_cache.resolve(access_token, spotify.current_user)
+        except SpotifyError as e:
+            if e.status_code == 429:
+                raise spotify_http_error(e)
+            raise HTTPException(status_code=401, detail="Invalid access token")
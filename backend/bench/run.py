@@ -0,0 +1,281 @@
+"""Endpoint benchmark: drives concurrent load at the API and reports latency and upstream calls.
+
+The app runs in-process under uvicorn against a replayed Spotify
+(bench/spotify_replay.py) and one of: the in-memory Weaviate fake, a local
+Weaviate container (bench/docker-compose.yml) or the SQLite store. Each
+scenario runs on its own, so the storage and Spotify calls made during it
+divided by its request count give the upstream cost of one request to
+that endpoint.
+
+Run from backend/:
+
+    python -m bench.run --users 2000 --requests 500 --concurrency 32
+    python -m bench.run --storage http://localhost:8080 --scenarios get_friends,add_friend
+    python -m bench.run --storage sqlite
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+import uvicorn
+
+from app.synthetic import generate_users
+from bench.spotify_replay import TOKEN_PREFIX, SpotifyReplay, load_cassette
+from bench.upstream import CountingStore, CountingWeaviate
+from bench.weaviate_fake import FakeWeaviate
+
+# Users written per bulk ingest request while seeding
+SEED_CHUNK = 1000
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def serve_in_thread(app: Any, port: int) -> uvicorn.Server:
+    """Run an ASGI app under uvicorn on a background thread and wait until it is up"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.01)
+    return server
+
+@dataclass
+class Dataset:
+    users: List[Dict[str, Any]]
+    by_username: Dict[str, Dict[str, Any]] = field(init=False)
+
+    def __post_init__(self):
+        self.by_username = {user["museUsername"]: user for user in self.users}
+
+    def pick(self, rng: random.Random) -> Dict[str, Any]:
+        return rng.choice(self.users)
+
+# A scenario turns (rng, dataset) into one request: (method, url, headers)
+Request = Tuple[str, str, Dict[str, str]]
+
+def _auth(user: Dict[str, Any]) -> Dict[str, str]:
+    return {"access-token": TOKEN_PREFIX + user["spotifyId"]}
+
+def get_friends(rng: random.Random, data: Dataset) -> Request:
+    user = data.pick(rng)
+    return "GET", f"/api/users/friends/{user['spotifyId']}", _auth(user)
+
+def add_friend(rng: random.Random, data: Dataset) -> Request:
+    # Pick a pair that are not friends yet and record the friendship so the
+    # next pick does not repeat it
+    while True:
+        user, friend = data.pick(rng), data.pick(rng)
+        if user is not friend and friend["museUsername"] not in user["friends"]:
+            break
+    user["friends"].append(friend["museUsername"])
+    friend["friends"].append(user["museUsername"])
+    return "POST", f"/api/users/friends/{user['spotifyId']}/{friend['museUsername']}", {}
+
+def vibe_analysis(rng: random.Random, data: Dataset) -> Request:
+    user = data.pick(rng)
+    return "GET", f"/api/music/vibe-analysis/{TOKEN_PREFIX}{user['spotifyId']}", {}
+
+def profile(rng: random.Random, data: Dataset) -> Request:
+    return "GET", "/api/users/profile", _auth(data.pick(rng))
+
+def search(rng: random.Random, data: Dataset) -> Request:
+    username = data.pick(rng)["museUsername"]
+    return "GET", f"/api/users/search?username={username[:rng.randint(1, 6)]}", {}
+
+def discover(rng: random.Random, data: Dataset) -> Request:
+    return "GET", f"/api/users/discover/{data.pick(rng)['spotifyId']}", {}
+
+def recommendations(rng: random.Random, data: Dataset) -> Request:
+    return "GET", f"/api/users/recommendations/{data.pick(rng)['spotifyId']}", {}
+
+def compatibility(rng: random.Random, data: Dataset) -> Request:
+    while True:
+        user = data.pick(rng)
+        if user["friends"]:
+            friend = data.by_username[rng.choice(user["friends"])]
+            return "GET", f"/api/users/{user['spotifyId']}/compatibility/{friend['spotifyId']}", {}
+
+SCENARIOS: Dict[str, Callable[[random.Random, Dataset], Request]] = {
+    "get_friends": get_friends,
+    "add_friend": add_friend,
+    "vibe_analysis": vibe_analysis,
+    "profile": profile,
+    "search": search,
+    "discover": discover,
+    "recommendations": recommendations,
+    "compatibility": compatibility,
+}
+DEFAULT_SCENARIOS = "get_friends,add_friend,vibe_analysis,profile,search,compatibility"
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def run_scenario(client: httpx.AsyncClient, name: str, data: Dataset, requests: int,
+                       concurrency: int, rng: random.Random) -> Dict[str, Any]:
+    """Send ``requests`` requests from ``concurrency`` workers and time each one"""
+    planned = [SCENARIOS[name](rng, data) for _ in range(requests)]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    queue = iter(planned)
+
+    async def worker():
+        for method, url, headers in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 400)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def _per_request(before: Counter, after: Counter, requests: int) -> Dict[str, float]:
+    return {
+        key: round((after[key] - before[key]) / requests, 2)
+        for key in sorted(after) if after[key] != before[key]
+    }
+
+async def benchmark(base_url: str, storage: Any, spotify: SpotifyReplay,
+                    args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    data = Dataset(generate_users(args.users, seed=args.seed))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        for start in range(0, len(data.users), SEED_CHUNK):
+            response = await client.post(
+                "/api/users/profiles/bulk",
+                json={"profiles": data.users[start:start + SEED_CHUNK]},
+                headers={"X-Muse-Admin": os.environ["INGEST_TOKEN"]},
+            )
+            response.raise_for_status()
+        print(f"Seeded {len(data.users)} users", file=sys.stderr)
+
+        results = {}
+        for name in args.scenarios.split(","):
+            if args.warmup:
+                await run_scenario(client, name, data, args.warmup, args.concurrency, rng)
+            storage_before, spotify_before = Counter(storage.calls), Counter(spotify.calls)
+            result = await run_scenario(client, name, data, args.requests, args.concurrency, rng)
+            storage_calls = _per_request(storage_before, storage.calls, args.requests)
+            spotify_calls = _per_request(spotify_before, spotify.calls, args.requests)
+            result["storage_calls_per_request"] = round(sum(storage_calls.values()), 2)
+            result["spotify_calls_per_request"] = round(sum(spotify_calls.values()), 2)
+            result["upstream_calls"] = {"storage": storage_calls, "spotify": spotify_calls}
+            results[name] = result
+            print(f"Finished {name}", file=sys.stderr)
+    return results
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    columns = ["requests", "errors", "throughput", "p50_ms", "p95_ms", "p99_ms",
+               "storage_calls_per_request", "spotify_calls_per_request"]
+    headers = ["scenario", "reqs", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "storage/req", "spotify/req"]
+    rows = [[name] + [str(result[column]) for column in columns] for name, result in results.items()]
+    widths = [max(len(row[i]) for row in [headers] + rows) for i in range(len(headers))]
+    for row in [headers] + rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+    for name, result in results.items():
+        calls = result["upstream_calls"]
+        breakdown = ", ".join(f"{key} {value}" for key, value in {**calls["storage"], **calls["spotify"]}.items())
+        print(f"{name}: {breakdown or 'no upstream calls'}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Muse API endpoints against local stand-ins")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users to seed")
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--storage", default="fake",
+                        help="'fake' (in-memory Weaviate), 'sqlite', or the URL of a local Weaviate such as http://localhost:8080")
+    parser.add_argument("--weaviate-latency", type=float, default=0.005, help="seconds per call to the fake")
+    parser.add_argument("--spotify-latency", type=float, default=0.05, help="seconds per replayed Spotify call")
+    parser.add_argument("--cassette", help="recorded Spotify cassette (default: synthetic responses)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write full results to this file")
+    args = parser.parse_args()
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    spotify = SpotifyReplay(load_cassette(args.cassette), latency=args.spotify_latency)
+    spotify_port = _free_port()
+    serve_in_thread(spotify, spotify_port)
+
+    # Configure the app before importing it: settings are read at import time
+    os.environ["SPOTIFY_API_URL"] = f"http://127.0.0.1:{spotify_port}/v1"
+    os.environ.setdefault("SPOTIFY_CLIENT_ID", "bench")
+    os.environ.setdefault("SPOTIFY_CLIENT_SECRET", "bench")
+    os.environ.setdefault("SPOTIFY_REDIRECT_URI", "http://localhost:3000/callback")
+    # Background refreshes would add Spotify calls no request made
+    os.environ["TASTE_REFRESH_INTERVAL"] = "0"
+    # The replay has no rate limit; measure the app, not the limiter's pacing
+    os.environ.setdefault("SPOTIFY_RATE_LIMIT", "100000")
+    os.environ.setdefault("SPOTIFY_BURST", "100000")
+    # Seeding goes through the admin-only bulk endpoint
+    os.environ.setdefault("INGEST_TOKEN", os.urandom(16).hex())
+    if args.storage == "sqlite":
+        os.environ["MUSE_STORAGE"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="muse-bench-"), "muse.db")
+    else:
+        os.environ["MUSE_STORAGE"] = "weaviate"
+        if args.storage != "fake":
+            os.environ["WEAVIATE_URL"] = args.storage
+    from app import db
+    from app.main import app
+    from app.storage.weaviate_store import WeaviateStore, create_client
+
+    if args.storage == "sqlite":
+        storage = CountingStore(db.get_store())
+        db._store = storage
+    else:
+        storage = CountingWeaviate(FakeWeaviate(latency=args.weaviate_latency) if args.storage == "fake" else create_client())
+        db._store = WeaviateStore(client=storage)
+
+    app_port = _free_port()
+    server = serve_in_thread(app, app_port)
+    try:
+        results = asyncio.run(benchmark(f"http://127.0.0.1:{app_port}", storage, spotify, args))
+    finally:
+        server.should_exit = True
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
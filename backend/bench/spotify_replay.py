@@ -0,0 +1,163 @@
+"""Recorded/replayed stand-in for the Spotify Web API.
+
+A cassette is a JSON file of recorded responses:
+
+    {"interactions": [{"method": "GET", "path": "/v1/me/top/artists",
+                       "query": {"limit": "50", "time_range": "medium_term"},
+                       "status": 200, "body": {...}}, ...]}
+
+The replay app answers a request with the interaction recorded for the
+same method, path and query. When only the query differs, it reuses the
+interaction for that path and trims ``items`` to the requested ``limit``.
+/me is answered for any bearer token: the recorded user is returned with
+its id replaced by the token minus a "bench-" prefix, so one cassette can
+stand in for any number of users.
+
+Record a cassette from a real account (run from backend/):
+
+    python -m bench.spotify_replay record --token <access token> --out bench/cassettes/me.json
+
+Serve one for an app started separately, with SPOTIFY_API_URL=http://127.0.0.1:8899/v1:
+
+    python -m bench.spotify_replay serve --port 8899 [--cassette FILE] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app.synthetic import SCENES
+
+TOKEN_PREFIX = "bench-"
+
+# Every Spotify request the backend makes; `record` captures these
+RECORDED_REQUESTS = [
+    ("/me", {}),
+    ("/me/top/artists", {"limit": "50", "time_range": "medium_term"}),
+    ("/me/top/artists", {"limit": "20", "time_range": "medium_term"}),
+    ("/me/top/artists", {"limit": "5", "time_range": "medium_term"}),
+    ("/me/player/recently-played", {"limit": "20"}),
+    ("/me/player/recently-played", {"limit": "5"}),
+]
+
+def _key(method: str, path: str, query: Dict[str, str]) -> Tuple:
+    return method.upper(), path, tuple(sorted(query.items()))
+
+def synthetic_cassette(seed: int = 0) -> Dict[str, Any]:
+    """A cassette with plausible responses, for runs without a recorded one"""
+    rng = random.Random(seed)
+    artists = [
+        {"name": name, "id": f"artist{index}", "genres": rng.sample(scene["genres"], 2), "popularity": rng.randint(40, 95)}
+        for index, (name, scene) in enumerate(
+            (artist, scene) for scene in SCENES.values() for artist in scene["artists"]
+        )
+    ]
+    rng.shuffle(artists)
+    tracks = [
+        {"track": {"name": f"Track {index}", "id": f"track{index}", "artists": [{"name": artists[index]["name"]}]},
+         "played_at": f"2024-05-01T12:{index:02d}:00.000Z"}
+        for index in range(50)
+    ]
+    return {"interactions": [
+        {"method": "GET", "path": "/v1/me", "query": {}, "status": 200,
+         "body": {"id": "bench-user", "display_name": "Bench User", "country": "GB", "product": "premium"}},
+        {"method": "GET", "path": "/v1/me/top/artists", "query": {"limit": "50", "time_range": "medium_term"},
+         "status": 200, "body": {"items": artists[:50], "total": len(artists), "limit": 50, "offset": 0}},
+        {"method": "GET", "path": "/v1/me/player/recently-played", "query": {"limit": "50"},
+         "status": 200, "body": {"items": tracks, "limit": 50}},
+    ]}
+
+class SpotifyReplay:
+    """ASGI app replaying a cassette, counting calls per "METHOD /path" in ``calls``"""
+
+    def __init__(self, cassette: Dict[str, Any], latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._exact: Dict[Tuple, Dict[str, Any]] = {}
+        self._by_path: Dict[Tuple, Dict[str, Any]] = {}
+        for interaction in cassette["interactions"]:
+            method, path = interaction["method"], interaction["path"]
+            self._exact[_key(method, path, interaction.get("query") or {})] = interaction
+            self._by_path.setdefault((method.upper(), path), interaction)
+        self.app = Starlette(routes=[Route("/{path:path}", self.handle, methods=["GET", "POST", "PUT", "DELETE"])])
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    async def handle(self, request: Request) -> JSONResponse:
+        path = request.url.path
+        self.calls[f"{request.method} {path}"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not token:
+            return JSONResponse({"error": {"status": 401, "message": "No token provided"}}, status_code=401)
+
+        query = dict(request.query_params)
+        interaction = self._exact.get(_key(request.method, path, query)) or self._by_path.get((request.method, path))
+        if interaction is None:
+            return JSONResponse({"error": {"status": 404, "message": "Not recorded"}}, status_code=404)
+
+        body = json.loads(json.dumps(interaction["body"]))
+        if path.endswith("/me"):
+            user_id = token.removeprefix(TOKEN_PREFIX)
+            body.update(id=user_id, display_name=user_id)
+        elif "limit" in query and isinstance(body.get("items"), list):
+            body["items"] = body["items"][:int(query["limit"])]
+            body["limit"] = int(query["limit"])
+        return JSONResponse(body, status_code=interaction["status"])
+
+def load_cassette(path: Optional[str]) -> Dict[str, Any]:
+    if not path:
+        return synthetic_cassette()
+    with open(path) as f:
+        return json.load(f)
+
+def record(token: str, out: str, api_url: str):
+    """Capture RECORDED_REQUESTS from the real API into a cassette"""
+    interactions: List[Dict[str, Any]] = []
+    prefix = httpx.URL(api_url).path.rstrip("/")
+    with httpx.Client(base_url=api_url, headers={"Authorization": f"Bearer {token}"}, timeout=10.0) as client:
+        for path, query in RECORDED_REQUESTS:
+            response = client.get(path, params=query)
+            print(f"{response.status_code} GET {path} {query}")
+            interactions.append({
+                "method": "GET",
+                "path": prefix + path,
+                "query": query,
+                "status": response.status_code,
+                "body": response.json(),
+            })
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"interactions": interactions}, f, indent=2)
+    print(f"Wrote {len(interactions)} interactions to {out}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or replay Spotify Web API responses")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="record a cassette from the real API")
+    record_parser.add_argument("--token", required=True, help="a valid Spotify access token")
+    record_parser.add_argument("--out", required=True)
+    record_parser.add_argument("--api-url", default=os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1"))
+    serve_parser = commands.add_parser("serve", help="serve a cassette over HTTP")
+    serve_parser.add_argument("--cassette", help="cassette file (default: synthetic responses)")
+    serve_parser.add_argument("--port", type=int, default=8899)
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.token, args.out, args.api_url)
+    else:
+        import uvicorn
+        uvicorn.run(SpotifyReplay(load_cassette(args.cassette), args.latency), host="127.0.0.1", port=args.port)
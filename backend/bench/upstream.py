@@ -0,0 +1,67 @@
+"""Upstream call counting for benchmark runs"""
+from collections import Counter
+from typing import Any
+
+class _CountingMethods:
+    """Wraps one API namespace (query, data, config) and counts each method call"""
+
+    def __init__(self, target: Any, prefix: str, calls: Counter):
+        self._target = target
+        self._prefix = prefix
+        self._calls = calls
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        key = f"{self._prefix}.{name}"
+        calls = self._calls
+
+        def counted(*args, **kwargs):
+            calls[key] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+class _CountingCollection:
+    def __init__(self, collection: Any, name: str, calls: Counter):
+        self._collection = collection
+        self.query = _CountingMethods(collection.query, f"{name}.query", calls)
+        self.data = _CountingMethods(collection.data, f"{name}.data", calls)
+        self.config = _CountingMethods(collection.config, f"{name}.config", calls)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+class _CountingCollections:
+    def __init__(self, collections: Any, calls: Counter):
+        self._collections = collections
+        self._methods = _CountingMethods(collections, "collections", calls)
+        self._calls = calls
+
+    def get(self, name: str) -> _CountingCollection:
+        return _CountingCollection(self._collections.get(name), name, self._calls)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._methods, name)
+
+class CountingWeaviate:
+    """Async Weaviate client wrapper that counts every collection call in ``calls``.
+
+    Works around the real client and bench.weaviate_fake alike, so call
+    counts mean the same thing whichever backend a run uses.
+    """
+
+    def __init__(self, client: Any):
+        self._client = client
+        self.calls: Counter = Counter()
+        self.collections = _CountingCollections(client.collections, self.calls)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+class CountingStore(_CountingMethods):
+    """ProfileStore wrapper that counts every store method call in ``calls``"""
+
+    def __init__(self, store: Any):
+        self.calls: Counter = Counter()
+        super().__init__(store, store.name, self.calls)
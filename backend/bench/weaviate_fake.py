@@ -0,0 +1,223 @@
+"""In-memory stand-in for the async Weaviate client.
+
+Implements the parts of the collections API the app uses, with exact-match
+inverted indexes so lookups stay cheap at benchmark sizes. Every query and
+write sleeps for ``latency`` seconds, like a round trip would. Calls are
+counted by wrapping the client in bench.upstream.CountingWeaviate, the same
+way as for a real instance.
+"""
+import asyncio
+import math
+import uuid as uuidlib
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set
+
+def _values(value: Any) -> List[Any]:
+    return value if isinstance(value, list) else [value]
+
+class FakeCollection:
+    def __init__(self, client: "FakeWeaviate", name: str, properties: List[Any] = ()):
+        self.client = client
+        self.name = name
+        self.properties = list(properties)
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.index: Dict[str, Dict[Any, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        self.query = SimpleNamespace(
+            fetch_objects=self.fetch_objects,
+            fetch_object_by_id=self.fetch_object_by_id,
+            near_vector=self.near_vector,
+        )
+        self.data = SimpleNamespace(
+            insert=self.insert,
+            insert_many=self.insert_many,
+            update=self.update,
+            replace=self.replace,
+            delete_by_id=self.delete_by_id,
+            delete_many=self.delete_many,
+        )
+        self.config = SimpleNamespace(get=self.get_config, add_property=self.add_property)
+
+    async def _round_trip(self):
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+
+    # Storage and indexes
+
+    def _store(self, uuid: str, properties: Dict[str, Any], vector: Optional[List[float]]):
+        self._unstore(uuid)
+        self.objects[uuid] = {"uuid": uuidlib.UUID(uuid), "properties": dict(properties), "vector": vector}
+        for name, value in properties.items():
+            for item in _values(value):
+                self.index[name][item].add(uuid)
+
+    def _unstore(self, uuid: str) -> bool:
+        obj = self.objects.pop(uuid, None)
+        if obj is None:
+            return False
+        for name, value in obj["properties"].items():
+            for item in _values(value):
+                self.index[name][item].discard(uuid)
+        return True
+
+    def _match(self, filters: Any) -> Set[str]:
+        """Ids of objects matching a weaviate.classes.query.Filter"""
+        if filters is None:
+            return set(self.objects)
+        kind = type(filters).__name__
+        if kind == "_FilterOr":
+            return set().union(*(self._match(f) for f in filters.filters))
+        if kind == "_FilterAnd":
+            matched = [self._match(f) for f in filters.filters]
+            return set.intersection(*matched) if matched else set(self.objects)
+
+        index = self.index[filters.target]
+        operator = filters.operator.value
+        if operator == "Equal":
+            return set(index.get(filters.value, ()))
+        if operator == "NotEqual":
+            return set(self.objects) - index.get(filters.value, set())
+        if operator == "ContainsAny":
+            return set().union(*(index.get(value, set()) for value in filters.value))
+        if operator == "ContainsAll":
+            matched = [index.get(value, set()) for value in filters.value]
+            return set.intersection(*matched) if matched else set()
+        if operator == "GreaterThan":
+            return set().union(*(uuids for value, uuids in index.items() if value > filters.value))
+        raise NotImplementedError(f"Filter operator {operator} is not supported by the fake")
+
+    def _result(self, uuid: str, properties: Optional[List[str]], include_vector: bool = False):
+        obj = self.objects[uuid]
+        values = obj["properties"]
+        if properties is not None:
+            values = {name: values[name] for name in properties if name in values}
+        return SimpleNamespace(
+            uuid=obj["uuid"],
+            properties=dict(values),
+            vector={"default": obj["vector"]} if include_vector and obj["vector"] else {},
+            metadata=SimpleNamespace(distance=None),
+        )
+
+    # Queries
+
+    async def fetch_objects(self, filters=None, limit=None, offset=None, return_properties=None,
+                            include_vector=False, sort=None, **kwargs):
+        await self._round_trip()
+        ids = sorted(self._match(filters))
+        for order in reversed(sort.sorts if sort is not None else []):
+            ids.sort(key=lambda uuid: self.objects[uuid]["properties"].get(order.prop), reverse=not order.ascending)
+        ids = ids[(offset or 0):]
+        if limit:
+            ids = ids[:limit]
+        return SimpleNamespace(objects=[self._result(uuid, return_properties, include_vector) for uuid in ids])
+
+    async def fetch_object_by_id(self, uuid, return_properties=None, include_vector=False, **kwargs):
+        await self._round_trip()
+        if str(uuid) not in self.objects:
+            return None
+        return self._result(str(uuid), return_properties, include_vector)
+
+    async def near_vector(self, near_vector, limit=10, filters=None, return_properties=None, **kwargs):
+        await self._round_trip()
+        norm = math.sqrt(sum(value * value for value in near_vector)) or 1.0
+        scored = []
+        for uuid in self._match(filters):
+            vector = self.objects[uuid]["vector"]
+            if vector:
+                similarity = sum(a * b for a, b in zip(near_vector, vector)) / norm
+                scored.append((1.0 - similarity, uuid))
+        scored.sort()
+        results = []
+        for distance, uuid in scored[:limit]:
+            result = self._result(uuid, return_properties)
+            result.metadata.distance = distance
+            results.append(result)
+        return SimpleNamespace(objects=results)
+
+    # Writes
+
+    async def insert(self, properties, uuid=None, vector=None, **kwargs):
+        await self._round_trip()
+        uuid = str(uuid or uuidlib.uuid4())
+        if uuid in self.objects:
+            raise Exception(f"id '{uuid}' already exists")
+        self._store(uuid, properties, vector)
+        return uuidlib.UUID(uuid)
+
+    async def insert_many(self, objects):
+        await self._round_trip()
+        uuids = {}
+        for position, obj in enumerate(objects):
+            uuid = str(obj.uuid or uuidlib.uuid4())
+            self._store(uuid, obj.properties, obj.vector)
+            uuids[position] = uuidlib.UUID(uuid)
+        return SimpleNamespace(errors={}, has_errors=False, uuids=uuids)
+
+    async def update(self, uuid, properties=None, vector=None, **kwargs):
+        await self._round_trip()
+        obj = self.objects.get(str(uuid))
+        if obj is None:
+            raise Exception(f"Object {uuid} not found")
+        self._store(str(uuid), {**obj["properties"], **(properties or {})}, vector or obj["vector"])
+
+    async def replace(self, uuid, properties, vector=None, **kwargs):
+        await self._round_trip()
+        self._store(str(uuid), properties, vector)
+
+    async def delete_by_id(self, uuid):
+        await self._round_trip()
+        return self._unstore(str(uuid))
+
+    async def delete_many(self, where, **kwargs):
+        await self._round_trip()
+        ids = self._match(where)
+        for uuid in ids:
+            self._unstore(uuid)
+        return SimpleNamespace(successful=len(ids), failed=0, matches=len(ids))
+
+    # Schema
+
+    async def get_config(self):
+        await self._round_trip()
+        return SimpleNamespace(properties=list(self.properties))
+
+    async def add_property(self, prop):
+        await self._round_trip()
+        self.properties.append(prop)
+
+class FakeCollections:
+    def __init__(self, client: "FakeWeaviate"):
+        self.client = client
+
+    async def exists(self, name: str) -> bool:
+        return name in self.client.collections_by_name
+
+    async def create(self, name: str, properties: List[Any] = (), **kwargs) -> FakeCollection:
+        collection = FakeCollection(self.client, name, properties)
+        self.client.collections_by_name[name] = collection
+        return collection
+
+    def get(self, name: str) -> FakeCollection:
+        if name not in self.client.collections_by_name:
+            self.client.collections_by_name[name] = FakeCollection(self.client, name)
+        return self.client.collections_by_name[name]
+
+class FakeWeaviate:
+    """Drop-in for the object returned by weaviate.use_async_with_weaviate_cloud"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.collections_by_name: Dict[str, FakeCollection] = {}
+        self.collections = FakeCollections(self)
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def is_ready(self) -> bool:
+        return True
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
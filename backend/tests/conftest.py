@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+import pytest
+
+class Clock:
+    """Stand-in for the time module whose monotonic clock only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+def _clear_caches():
+    from app.profile_cache import profile_cache
+    from app.recommendations import recommendation_cache
+    from app.search import search_cache
+    profile_cache.clear()
+    search_cache.clear()
+    recommendation_cache.clear()
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A fresh SQLite store in a temp file, installed as the app's storage, with empty caches"""
+    from app import db
+    from app.storage.sqlite_store import SQLiteStore
+
+    sqlite_store = SQLiteStore(str(tmp_path / "muse.db"))
+    asyncio.run(sqlite_store.ensure_schema())
+    monkeypatch.setattr(db, "_store", sqlite_store)
+    monkeypatch.setattr(db, "_schema_ready", False)
+    _clear_caches()
+    yield sqlite_store
+    asyncio.run(sqlite_store.close())
+    _clear_caches()
+
+@pytest.fixture
+def api(store):
+    """Async HTTP client calling the app in-process, backed by the temp SQLite store"""
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
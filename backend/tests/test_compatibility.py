@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from app.compatibility import TasteMatrix, compatibility_score, item_weights, shared_items
+
+def reference_score(user_artists, user_genres, friend_artists, friend_genres) -> float:
+    """The per-pair score users.py computed before app/compatibility.py replaced it"""
+    common_artists = set(user_artists) & set(friend_artists)
+    artist_score = len(common_artists) / max(len(user_artists), 1) * 50
+    common_genres = set(user_genres) & set(friend_genres)
+    genre_score = len(common_genres) / max(len(user_genres), 1) * 50
+    return round(artist_score + genre_score, 2)
+
+def profile(artists, genres) -> dict:
+    return {"topArtists": artists, "topGenres": genres}
+
+def random_items(rng: random.Random, prefix: str, pool: int) -> list:
+    # Small pools so lists overlap often; sampling with replacement gives duplicates
+    return [f"{prefix}{rng.randrange(pool)}" for _ in range(rng.randrange(8))]
+
+def random_profiles(seed: int, count: int) -> list:
+    rng = random.Random(seed)
+    return [profile(random_items(rng, "artist", 12), random_items(rng, "genre", 6)) for _ in range(count)]
+
+def reference(user: dict, friend: dict) -> float:
+    return reference_score(user["topArtists"], user["topGenres"], friend["topArtists"], friend["topGenres"])
+
+@pytest.mark.parametrize("user, friend", [
+    (profile([], []), profile([], [])),
+    (profile([], []), profile(["a"], ["rock"])),
+    (profile(["a"], ["rock"]), profile([], [])),
+    (profile(["a", "b"], ["rock", "pop"]), profile(["a", "b"], ["rock", "pop"])),
+    (profile(["a", "a", "b"], ["rock"]), profile(["a"], ["rock", "rock"])),
+    (profile(["a", "b", "c"], ["rock", "pop", "jazz"]), profile(["c", "d"], ["jazz"])),
+    (profile(["a", "a", "a"], []), profile(["a", "b"], ["rock"])),
+    ({"topArtists": None}, profile(["a"], [])),
+])
+def test_score_matches_reference_on_edge_cases(user, friend):
+    expected = reference_score(user.get("topArtists") or [], user.get("topGenres") or [],
+                               friend.get("topArtists") or [], friend.get("topGenres") or [])
+    assert compatibility_score(user, friend) == expected
+
+def test_score_one_matches_reference_on_random_profiles():
+    users = random_profiles(seed=1, count=200)
+    candidates = random_profiles(seed=2, count=300)
+    matrix = TasteMatrix(candidates)
+    for user in users:
+        assert matrix.score_one(user) == [reference(user, candidate) for candidate in candidates]
+
+def test_score_many_matches_score_one():
+    users = random_profiles(seed=3, count=50)
+    candidates = random_profiles(seed=4, count=80)
+    matrix = TasteMatrix(candidates)
+    scores = matrix.score_many(users)
+    assert scores.shape == (50, 80)
+    for row, user in zip(scores.tolist(), users):
+        assert row == matrix.score_one(user)
+
+def test_empty_inputs():
+    assert TasteMatrix([]).score_one(profile(["a"], ["rock"])) == []
+    assert TasteMatrix([profile(["a"], [])]).score_many([]).shape == (0, 1)
+
+def test_rank_weighting_favours_top_items():
+    user = profile(["a", "b", "c", "d"], [])
+    first = compatibility_score(user, profile(["a"], []), weighting="rank")
+    last = compatibility_score(user, profile(["d"], []), weighting="rank")
+    assert first > last > 0
+    assert compatibility_score(user, user, weighting="rank") == 50.0
+
+def test_item_weights():
+    assert item_weights(3).tolist() == [1.0, 1.0, 1.0]
+    assert item_weights(3, "rank").tolist() == [1.0, 0.5, 1 / 3]
+    with pytest.raises(ValueError):
+        item_weights(3, "unknown")
+
+def test_shared_items_keeps_user_order_without_duplicates():
+    assert shared_items(["c", "a", "c", "b"], ["a", "b", "c"]) == ["c", "a", "b"]
+    assert shared_items(None, ["a"]) == []
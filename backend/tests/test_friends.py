@@ -0,0 +1,64 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from app.repository import ingest_profiles
+from app.token_cache import token_cache
+
+FRIEND_COUNT = 25
+
+def profile(spotify_id: str) -> dict:
+    return {"spotifyId": spotify_id, "displayName": spotify_id.title(), "museUsername": spotify_id,
+            "topArtists": ["a", "b"], "topGenres": ["rock"], "recentTracks": []}
+
+@pytest.fixture
+def friends(store):
+    """Spotify ids of the friends of user 'me', seeded in random order"""
+    friend_ids = [f"friend{n:02d}" for n in range(FRIEND_COUNT)]
+    random.Random(0).shuffle(friend_ids)
+    report = asyncio.run(ingest_profiles([profile("me"), profile("stranger")] + [profile(f) for f in friend_ids]))
+    assert not report.errors
+    asyncio.run(store.save_friendships(
+        [{"userId": "me", "friendId": friend_id} for friend_id in friend_ids]
+        + [{"userId": "stranger", "friendId": "me"}]
+    ))
+    token_cache.put("friends-token", {"id": "me"})
+    yield friend_ids
+    token_cache.invalidate("friends-token")
+
+def get_friends(params: dict) -> httpx.Response:
+    from app.main import app
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/api/users/friends/me", params=params, headers={"access-token": "friends-token"})
+    return asyncio.run(call())
+
+def test_walking_the_cursor_returns_every_friend_once(friends):
+    seen = []
+    pages = 0
+    params = {"limit": 7}
+    while True:
+        response = get_friends(params)
+        assert response.status_code == 200
+        pages += 1
+        seen.extend(friend["spotifyId"] for friend in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 7, "cursor": cursor}
+
+    assert pages == 4
+    assert seen == sorted(friends)
+
+def test_a_full_last_page_has_no_cursor(friends):
+    response = get_friends({"limit": FRIEND_COUNT})
+    assert len(response.json()) == FRIEND_COUNT
+    assert "X-Next-Cursor" not in response.headers
+
+@pytest.mark.parametrize("cursor", ["!!!", "abc="])
+def test_malformed_cursors_are_rejected(friends, cursor):
+    response = get_friends({"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
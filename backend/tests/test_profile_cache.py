@@ -0,0 +1,80 @@
+from uuid import uuid4
+
+import pytest
+
+from app import profile_cache as profile_cache_module
+from app.profile_cache import ProfileCache, StoredProfile
+
+@pytest.fixture
+def cache(clock, monkeypatch) -> ProfileCache:
+    monkeypatch.setattr(profile_cache_module, "time", clock)
+    return ProfileCache(max_size=2, ttl=60)
+
+def stored(spotify_id: str, username: str = None, **properties) -> StoredProfile:
+    return StoredProfile(uuid=uuid4(), properties={
+        "spotifyId": spotify_id, "museUsername": username or spotify_id, **properties
+    })
+
+def test_lookup_by_id_and_username(cache):
+    profile = stored("u1", "alice")
+    cache.put(profile)
+    assert cache.get("u1").uuid == profile.uuid
+    assert cache.get_by_username("alice").uuid == profile.uuid
+    assert cache.get_by_username("bob") is None
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put(stored("u1"))
+    clock.advance(60)
+    assert cache.get("u1") is None
+    assert cache.get_by_username("u1") is None
+
+def test_least_recently_used_profile_is_evicted(cache):
+    cache.put(stored("a"))
+    cache.put(stored("b"))
+    cache.get("a")
+    cache.put(stored("c"))
+    assert cache.get("b") is None
+    assert cache.get_by_username("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_readers_get_copies(cache):
+    cache.put(stored("u1", topArtists=["a"]))
+    cache.get("u1").properties["topArtists"].append("b")
+    assert cache.get("u1").properties["topArtists"] == ["a"]
+
+def test_read_older_than_a_write_is_not_cached(cache):
+    version = cache.snapshot()
+    cache.invalidate("u1")
+    cache.put(stored("u1", "old-name"), version)
+    assert cache.get("u1") is None
+    assert cache.stats()["stale_fills"] == 1
+
+    version = cache.snapshot()
+    cache.put(stored("u1", "new-name"), version)
+    assert cache.get("u1").properties["museUsername"] == "new-name"
+
+def test_update_moves_the_username_index(cache):
+    cache.put(stored("u1", "alice"))
+    cache.update("u1", {"museUsername": "alicia"})
+    assert cache.get_by_username("alice") is None
+    assert cache.get_by_username("alicia").properties["spotifyId"] == "u1"
+
+def test_forgotten_writes_still_reject_older_reads(cache):
+    version = cache.snapshot()
+    # More writes than the cache remembers individually
+    for index in range(10):
+        cache.invalidate(f"other{index}")
+    cache.put(stored("other0"), version)
+    assert cache.get("other0") is None
+
+def test_clear_rejects_reads_started_before_it(cache):
+    version = cache.snapshot()
+    cache.clear()
+    cache.put(stored("u1"), version)
+    assert cache.get("u1") is None
+
+def test_disabled_cache_stores_nothing():
+    cache = ProfileCache(max_size=0)
+    cache.put(stored("u1"))
+    assert cache.get("u1") is None
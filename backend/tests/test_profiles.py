@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import spotify
+from app.repository import fetch_profile, insert_profile
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def new_user(spotify_id: str) -> dict:
+    return {
+        "spotifyId": spotify_id, "displayName": spotify_id.title(), "museUsername": spotify_id,
+        "topArtists": ["a", "b"], "topGenres": ["rock"], "recentTracks": ["t"],
+    }
+
+@pytest.fixture
+def spotify_me(monkeypatch):
+    """Spotify stand-in answering every token as the user 'newcomer', slowly enough for requests to overlap"""
+    async def handle(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.01)
+        if request.url.path.endswith("/me"):
+            return httpx.Response(200, json={"id": "newcomer", "display_name": "Newcomer"})
+        return httpx.Response(200, json={"items": []})
+
+    client = httpx.AsyncClient(base_url="https://spotify.test/v1", transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(spotify, "_http_client", client)
+    monkeypatch.setattr(spotify, "spotify_api", spotify.SpotifyAPI(rate=1000, burst=100))
+
+def test_concurrent_inserts_of_one_user_both_return_the_profile(store):
+    async def scenario():
+        return await asyncio.gather(insert_profile(new_user("u1")), insert_profile(new_user("u1")))
+
+    first, second = run(scenario())
+    assert first.uuid == second.uuid
+    assert second.properties["spotifyId"] == "u1"
+
+def test_concurrent_first_logins_both_succeed(api, spotify_me):
+    async def scenario():
+        async with api:
+            return await asyncio.gather(*(
+                api.get("/api/users/profile", headers={"access-token": f"first-login-{index}"})
+                for index in range(2)
+            ))
+
+    responses = run(scenario())
+    assert [response.status_code for response in responses] == [200, 200]
+    assert {response.json()["spotifyId"] for response in responses} == {"newcomer"}
+
+def test_post_profile_creates_then_updates(api):
+    profile = new_user("u1")
+
+    async def scenario():
+        async with api:
+            created = await api.post("/api/users/profile", json=profile)
+            updated = await api.post("/api/users/profile", json={**profile, "displayName": "Renamed"})
+            return created, updated
+
+    created, updated = run(scenario())
+    assert (created.status_code, updated.status_code) == (200, 200)
+    stored = run(fetch_profile("u1"))
+    assert stored.properties["displayName"] == "Renamed"
+
+def bulk(headers=None):
+    from app.main import app
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as api:
+            return await api.post("/api/users/profiles/bulk", json={"profiles": [new_user("u1")]}, headers=headers or {})
+    return run(scenario())
+
+def test_bulk_endpoint_is_off_without_a_token(store):
+    assert bulk({"X-Muse-Admin": ""}).status_code == 404
+
+def test_bulk_endpoint_needs_the_admin_token(store, monkeypatch):
+    from app.routers import users
+    monkeypatch.setattr(users, "INGEST_TOKEN", "secret")
+    assert bulk().status_code == 403
+    assert bulk({"X-Muse-Admin": "wrong"}).status_code == 403
+    response = bulk({"X-Muse-Admin": "secret"})
+    assert response.status_code == 200
+    assert response.json()["written"] == 1
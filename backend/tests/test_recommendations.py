@@ -0,0 +1,47 @@
+import pytest
+
+from app import recommendations
+from app.recommendations import RecommendationCache, recommendation_score
+
+@pytest.fixture
+def cache(clock, monkeypatch) -> RecommendationCache:
+    monkeypatch.setattr(recommendations, "time", clock)
+    return RecommendationCache(max_size=3, ttl=300)
+
+def put(cache: RecommendationCache, spotify_id: str, friend_ids, results=None):
+    cache.put(spotify_id, friend_ids, results or [{"spotifyId": "x"}], cache.snapshot())
+
+def test_mutual_friends_outweigh_small_taste_differences():
+    assert recommendation_score(2, 40.0) > recommendation_score(1, 45.0)
+    assert recommendation_score(1, 50.0) == 60.0
+
+def test_edge_change_drops_both_ends_and_users_reaching_through_them(cache):
+    put(cache, "alice", ["bob"])
+    put(cache, "carol", ["dave"])
+    put(cache, "erin", ["frank"])
+    cache.invalidate_edge("bob", "dave")
+    assert cache.get("alice") is None
+    assert cache.get("carol") is None
+    assert cache.get("erin") is not None
+    assert cache.stats()["invalidations"] == 2
+
+def test_results_from_a_traversal_overlapping_a_change_are_not_cached(cache):
+    version = cache.snapshot()
+    cache.invalidate_edge("bob", "dave")
+    cache.put("alice", ["bob"], [], version)
+    assert cache.get("alice") is None
+
+def test_entries_expire_and_are_bounded(cache, clock):
+    for user in ("a", "b", "c", "d"):
+        put(cache, user, ["friend"])
+    assert cache.get("a") is None
+    assert cache.get("d") is not None
+    clock.advance(300)
+    assert cache.get("d") is None
+
+def test_evicted_entries_are_forgotten_by_the_friend_index(cache):
+    for user in ("a", "b", "c", "d"):
+        put(cache, user, [f"friend-{user}"])
+    assert "friend-a" not in cache._through
+    cache.clear()
+    assert cache._through == {}
@@ -0,0 +1,95 @@
+import asyncio
+import random
+
+import httpx
+import pytest
+
+from app import search as search_module
+from app.repository import ingest_profiles
+from app.search import MAX_CANDIDATES, SearchCache, matches, query_grams, rank_key, username_grams
+
+def candidate(username: str) -> dict:
+    return {"museUsername": username}
+
+@pytest.fixture
+def cache(clock, monkeypatch) -> SearchCache:
+    monkeypatch.setattr(search_module, "time", clock)
+    return SearchCache(max_size=3, ttl=30)
+
+def test_every_match_is_found_through_the_index():
+    rng = random.Random(0)
+    alphabet = "abc_."
+    for _ in range(2000):
+        username = "".join(rng.choice(alphabet) for _ in range(rng.randrange(1, 10)))
+        term = "".join(rng.choice("abc") for _ in range(rng.randrange(1, 5)))
+        if matches(term, username):
+            assert set(query_grams(term)) <= set(username_grams(username)), (term, username)
+
+def test_short_terms_match_name_and_segment_prefixes():
+    assert matches("jo", "john")
+    assert matches("sm", "john_smith")
+    assert not matches("oh", "john")
+    assert matches("ohn", "john")
+
+def test_rank_prefers_exact_then_prefix_then_segment():
+    names = ["xjohnx", "bob_john", "johnny", "john"]
+    assert sorted(names, key=lambda name: rank_key("john", name)) == ["john", "johnny", "bob_john", "xjohnx"]
+
+def test_complete_results_answer_longer_terms(cache):
+    cache.put("abc", [candidate("abcd"), candidate("xabcx"), candidate("abce")], complete=True)
+    assert cache.get("abcd") == ([candidate("abcd")], True)
+    assert cache.stats()["hits"] == 1
+
+def test_incomplete_results_only_answer_their_own_term(cache):
+    cache.put("abc", [candidate("abcd")], complete=False)
+    assert cache.get("abc") == ([candidate("abcd")], False)
+    assert cache.get("abcd") is None
+
+def test_prefix_terms_do_not_answer_substring_terms(cache):
+    # "ab" only matched name and segment prefixes, so "xabc" was never a candidate for it
+    cache.put("ab", [candidate("abc")], complete=True)
+    assert cache.get("abc") is None
+
+def test_entries_expire_and_are_bounded(cache, clock):
+    for term in ("a", "b", "c", "d"):
+        cache.put(term, [], complete=True)
+    assert cache.get("a") is None
+    assert cache.get("d") == ([], True)
+    clock.advance(30)
+    assert cache.get("d") is None
+    assert cache.stats()["size"] == 2
+
+def seed_users(usernames):
+    profiles = [
+        {"spotifyId": f"id-{username}", "displayName": username, "museUsername": username,
+         "topArtists": [], "topGenres": [], "topTracks": []}
+        for username in usernames
+    ]
+    report = asyncio.run(ingest_profiles(profiles))
+    assert not report.errors
+
+def search(params):
+    from app.main import app
+    async def call():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/api/users/search", params=params)
+    return asyncio.run(call())
+
+def test_exact_match_ranks_first_among_more_than_max_candidates(store):
+    seed_users([f"sam_{n:04d}" for n in range(MAX_CANDIDATES + 100)] + ["sam"])
+    response = search({"username": "sam"})
+    assert response.status_code == 200
+    assert response.json()[0]["museUsername"] == "sam"
+    assert response.headers["X-Search-Truncated"] == "true"
+
+def test_prefix_matches_are_not_crowded_out_by_substring_matches(store):
+    seed_users([f"x{n:04d}sam" for n in range(MAX_CANDIDATES + 100)] + ["samwise", "bob_sam"])
+    response = search({"username": "sam", "limit": 3})
+    assert [user["museUsername"] for user in response.json()[:2]] == ["samwise", "bob_sam"]
+    assert response.headers["X-Search-Truncated"] == "true"
+
+def test_complete_results_are_not_marked_truncated(store):
+    seed_users(["sam", "samwise", "xsamx"])
+    response = search({"username": "sam"})
+    assert [user["museUsername"] for user in response.json()] == ["sam", "samwise", "xsamx"]
+    assert "X-Search-Truncated" not in response.headers
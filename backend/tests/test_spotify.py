@@ -0,0 +1,176 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import spotify
+from app.spotify import SpotifyAPI, SpotifyError, SpotifySession, TokenBucket, spotify_http_error
+
+@pytest.fixture
+def bucket(clock, monkeypatch) -> TokenBucket:
+    monkeypatch.setattr(spotify, "time", clock)
+    return TokenBucket(rate=10, burst=2)
+
+def test_bucket_allows_a_burst_then_spaces_calls(bucket, clock):
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    # Three tokens come back in 0.3 s, repaying the two borrowed and leaving one
+    clock.advance(0.3)
+    assert bucket.reserve() == pytest.approx(0, abs=1e-9)
+    assert bucket.reserve() == pytest.approx(0.1)
+
+def test_bucket_refills_up_to_its_burst(bucket, clock):
+    bucket.reserve()
+    clock.advance(60)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, pytest.approx(0.1)]
+
+def test_pause_delays_every_caller(bucket, clock):
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5)
+    clock.advance(5)
+    assert bucket.reserve() == 0
+
+def test_cancel_returns_the_token(bucket):
+    bucket.reserve()
+    bucket.reserve()
+    bucket.cancel()
+    assert bucket.reserve() == 0
+
+def test_http_errors():
+    limited = spotify_http_error(SpotifyError(429, "slow down", retry_after=7.4))
+    assert limited.status_code == 429
+    assert limited.headers == {"Retry-After": "7"}
+    assert spotify_http_error(SpotifyError(401, "expired")).status_code == 401
+    assert spotify_http_error(SpotifyError(404, "missing")).status_code == 400
+
+class Upstream:
+    """Spotify stand-in serving scripted responses through httpx.MockTransport"""
+
+    def __init__(self, *responses: httpx.Response):
+        self.responses = list(responses)
+        self.requests = []
+        self.release = asyncio.Event()
+        self.hold = False
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.hold:
+            await self.release.wait()
+        if self.responses:
+            return self.responses.pop(0)
+        return httpx.Response(200, json={"path": request.url.path})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url="https://spotify.test/v1", transport=httpx.MockTransport(self.handle))
+
+@pytest.fixture
+def fast_sleep(monkeypatch):
+    """Record asyncio.sleep calls without waiting, so retry back-off is instant"""
+    slept = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(seconds, *args, **kwargs):
+        slept.append(seconds)
+        await real_sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return slept
+
+def test_identical_concurrent_calls_share_one_request():
+    async def run():
+        upstream = Upstream()
+        upstream.hold = True
+        api = SpotifyAPI(rate=1000, burst=100)
+        async with upstream.client() as client:
+            calls = [asyncio.ensure_future(api.get("token", "/me", {"limit": 5}, client)) for _ in range(5)]
+            other = asyncio.ensure_future(api.get("other-token", "/me", {"limit": 5}, client))
+            await asyncio.sleep(0.01)
+            upstream.release.set()
+            results = await asyncio.gather(*calls, other)
+        return upstream, api, results
+
+    upstream, api, results = asyncio.run(run())
+    assert len(upstream.requests) == 2
+    assert all(result == {"path": "/v1/me"} for result in results)
+    assert api.coalesced == 4
+    assert api.stats()["in_flight"] == 0
+
+def test_cancelled_caller_does_not_cancel_the_shared_request():
+    async def run():
+        upstream = Upstream()
+        upstream.hold = True
+        api = SpotifyAPI(rate=1000, burst=100)
+        async with upstream.client() as client:
+            first = asyncio.ensure_future(api.get("token", "/me", {}, client))
+            second = asyncio.ensure_future(api.get("token", "/me", {}, client))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            upstream.release.set()
+            result = await second
+        return upstream, first, result
+
+    upstream, first, result = asyncio.run(run())
+    assert first.cancelled()
+    assert result == {"path": "/v1/me"}
+    assert len(upstream.requests) == 1
+
+def test_short_rate_limit_is_retried(fast_sleep):
+    async def run():
+        upstream = Upstream(httpx.Response(429, headers={"Retry-After": "2"}, json={"error": {"message": "slow"}}))
+        api = SpotifyAPI(rate=1000, burst=100, max_wait=5)
+        async with upstream.client() as client:
+            return upstream, await api.get("token", "/me", {}, client)
+
+    upstream, result = asyncio.run(run())
+    assert result == {"path": "/v1/me"}
+    assert len(upstream.requests) == 2
+    assert max(fast_sleep) == pytest.approx(2, abs=0.1)
+
+def test_long_rate_limit_fails_fast_and_pauses_later_calls(fast_sleep):
+    async def run():
+        upstream = Upstream(httpx.Response(429, headers={"Retry-After": "60"}, json={"error": {"message": "slow"}}))
+        api = SpotifyAPI(rate=1000, burst=100, max_wait=5)
+        async with upstream.client() as client:
+            with pytest.raises(SpotifyError) as first:
+                await api.get("token", "/me", {}, client)
+            # The pause applies to everyone, so the next call fails before reaching Spotify
+            with pytest.raises(SpotifyError) as second:
+                await api.get("token", "/me/top/artists", {}, client)
+        return upstream, first.value, second.value
+
+    upstream, first, second = asyncio.run(run())
+    assert (first.status_code, first.retry_after) == (429, 60)
+    assert second.status_code == 429
+    assert second.retry_after > 5
+    assert len(upstream.requests) == 1
+    assert fast_sleep == []
+
+def test_other_errors_are_not_retried():
+    async def run():
+        upstream = Upstream(httpx.Response(401, json={"error": {"message": "The access token expired"}}))
+        api = SpotifyAPI(rate=1000, burst=100)
+        async with upstream.client() as client:
+            with pytest.raises(SpotifyError) as error:
+                await api.get("token", "/me", {}, client)
+        return upstream, error.value
+
+    upstream, error = asyncio.run(run())
+    assert (error.status_code, str(error)) == (401, "The access token expired")
+    assert len(upstream.requests) == 1
+
+def test_session_sends_each_call_once(monkeypatch):
+    async def run():
+        upstream = Upstream()
+        monkeypatch.setattr(spotify, "spotify_api", SpotifyAPI(rate=1000, burst=100))
+        async with upstream.client() as client:
+            async with SpotifySession("token", client) as session:
+                first = await session.top_artists(limit=5)
+                again = await session.top_artists(limit=5)
+                await session.recently_played(limit=5)
+        return upstream, first, again
+
+    upstream, first, again = asyncio.run(run())
+    assert first is again
+    assert [request.url.path for request in upstream.requests] == ["/v1/me/top/artists", "/v1/me/player/recently-played"]
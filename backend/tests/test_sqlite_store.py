@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from uuid import UUID
+
+import pytest
+
+from app.search import query_grams, username_grams
+from app.storage.base import ProfileExistsError, ProfileRecord
+from app.storage.sqlite_store import SQLiteStore, _off_loop
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def uuid(n: int) -> UUID:
+    return UUID(int=n)
+
+def record(n: int, username: str, vector=None) -> ProfileRecord:
+    return ProfileRecord(uuid=uuid(n), vector=vector, properties={
+        "spotifyId": f"id-{username}", "displayName": username.title(), "museUsername": username,
+        "topArtists": ["a"], "topGenres": ["rock"], "recentTracks": [],
+        "usernameGrams": username_grams(username),
+    })
+
+def edge(user_id: str, friend_id: str, score: float = 50.0) -> dict:
+    return {"userId": user_id, "friendId": friend_id, "compatibilityScore": score,
+            "sharedArtists": ["a"], "sharedGenres": [], "tasteKey": "k"}
+
+def usernames(profiles) -> list:
+    return [profile.properties["museUsername"] for profile in profiles]
+
+def test_insert_rejects_an_existing_user(store):
+    run(store.insert_profile(record(1, "alice")))
+    with pytest.raises(ProfileExistsError):
+        run(store.insert_profile(record(2, "alice")))
+
+    profiles = run(store.fetch_profiles([("spotifyId", "id-alice")]))
+    assert [profile.uuid for profile in profiles] == [uuid(1)]
+    assert profiles[0].properties["topArtists"] == ["a"]
+
+def test_upsert_reports_failures_per_record_and_keeps_the_rest(store):
+    run(store.insert_profile(record(1, "alice")))
+    renamed = record(1, "alice")
+    renamed.properties["displayName"] = "Renamed"
+    # A new object id for an existing spotifyId breaks the unique constraint
+    errors = run(store.upsert_profiles([renamed, record(2, "alice"), record(3, "bob")]))
+
+    assert list(errors) == [1]
+    assert "UNIQUE" in errors[1]
+    profiles = run(store.fetch_profiles([("spotifyId", "id-alice"), ("spotifyId", "id-bob")]))
+    assert {profile.uuid: profile.properties["displayName"] for profile in profiles} == {
+        uuid(1): "Renamed", uuid(3): "Bob"
+    }
+
+def test_update_changes_properties_and_search_tokens(store):
+    run(store.insert_profile(record(1, "alice")))
+    run(store.update_profile(uuid(1), {"museUsername": "zed", "usernameGrams": username_grams("zed")}))
+
+    assert run(store.search_usernames(query_grams("ali"), 10, ["museUsername"])) == []
+    assert usernames(run(store.search_usernames(query_grams("zed"), 10, ["museUsername"]))) == ["zed"]
+    with pytest.raises(Exception):
+        run(store.update_profile(uuid(9), {"displayName": "Nobody"}))
+
+def test_search_requires_every_gram(store):
+    for n, username in enumerate(["johnny", "john_smith", "jonah", "xjohn"]):
+        run(store.insert_profile(record(n, username)))
+
+    def search(term):
+        return sorted(usernames(run(store.search_usernames(query_grams(term), 10, ["museUsername"]))))
+
+    assert search("john") == ["john_smith", "johnny", "xjohn"]
+    assert search("jo") == ["john_smith", "johnny", "jonah"]
+    assert search("sm") == ["john_smith"]
+    # "xjo" and "jon" are each indexed for some user, but never the same one
+    assert search("xjon") == []
+    assert len(run(store.search_usernames(query_grams("jo"), 2, ["museUsername"]))) == 2
+
+def test_nearest_profiles_are_ordered_by_distance_then_uuid(store):
+    run(store.upsert_profiles([
+        record(1, "me", [1.0, 0.0]),
+        record(4, "far", [0.0, 1.0]),
+        record(3, "tied_b", [0.6, 0.8]),
+        record(2, "tied_a", [0.6, 0.8]),
+        record(5, "close", [0.8, 0.6]),
+    ]))
+
+    nearest = run(store.nearest_profiles([1.0, 0.0], "id-me", 3, ["museUsername"]))
+    assert usernames(profile for profile, _ in nearest) == ["close", "tied_a", "tied_b"]
+    assert [distance for _, distance in nearest] == pytest.approx([0.2, 0.4, 0.4])
+
+    # The cutoff falls between the tied profiles, and the smaller uuid wins
+    nearest = run(store.nearest_profiles([1.0, 0.0], "id-me", 2, ["museUsername"]))
+    assert usernames(profile for profile, _ in nearest) == ["close", "tied_a"]
+
+def test_nearest_profiles_see_writes(store):
+    run(store.insert_profile(record(1, "me", [1.0, 0.0])))
+    assert run(store.nearest_profiles([1.0, 0.0], "id-me", 5, ["museUsername"])) == []
+    run(store.insert_profile(record(2, "new", [0.0, 1.0])))
+    nearest = run(store.nearest_profiles([1.0, 0.0], "id-me", 5, ["museUsername"]))
+    assert usernames(profile for profile, _ in nearest) == ["new"]
+
+def test_friendship_pages_follow_friend_id_order(store):
+    friend_ids = [f"f{n:02d}" for n in (7, 2, 9, 0, 4, 1, 8, 3, 6, 5)]
+    run(store.save_friendships([edge("u", friend_id) for friend_id in friend_ids] + [edge("other", "f00")]))
+
+    pages = []
+    after = None
+    while True:
+        page = run(store.fetch_friendship_page("u", after, 4))
+        if not page:
+            break
+        pages.append([edge["friendId"] for edge in page])
+        after = page[-1]["friendId"]
+
+    assert pages == [["f00", "f01", "f02", "f03"], ["f04", "f05", "f06", "f07"], ["f08", "f09"]]
+
+def test_refresh_does_not_resurrect_a_deleted_edge(store):
+    run(store.save_friendships([edge("u", "a"), edge("u", "b")]))
+    run(store.delete_friendship("u", "a"))
+    run(store.refresh_friendships([edge("u", "a", 90.0), edge("u", "b", 90.0)]))
+
+    assert run(store.fetch_friendship("u", "a")) is None
+    assert run(store.fetch_friendship("u", "b"))["compatibilityScore"] == 90.0
+
+def test_methods_run_one_at_a_time_off_the_event_loop(tmp_path):
+    class RecordingStore(SQLiteStore):
+        active = 0
+        most_active = 0
+        threads = set()
+
+        @_off_loop
+        def slow(self):
+            type(self).active += 1
+            type(self).most_active = max(self.most_active, self.active)
+            self.threads.add(threading.current_thread().name)
+            time.sleep(0.02)
+            type(self).active -= 1
+
+    store = RecordingStore(str(tmp_path / "muse.db"))
+
+    async def scenario():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.gather(*(store.slow() for _ in range(5)))
+        ticker.cancel()
+        await store.close()
+        return ticks
+
+    ticks = run(scenario())
+    assert RecordingStore.most_active == 1
+    assert len(RecordingStore.threads) == 1
+    assert next(iter(RecordingStore.threads)).startswith("sqlite")
+    # The loop kept running while the database thread slept
+    assert ticks > 10
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app import token_cache as token_cache_module
+from app.token_cache import TokenCache
+
+@pytest.fixture
+def cache(clock, monkeypatch) -> TokenCache:
+    monkeypatch.setattr(token_cache_module, "time", clock)
+    return TokenCache(ttl=300, max_size=2)
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put("token", {"id": "u1"})
+    clock.advance(299)
+    assert cache.get("token") == {"id": "u1"}
+    clock.advance(1)
+    assert cache.get("token") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entries_never_outlive_the_token(cache, clock):
+    cache.set_expiry("early", 10)
+    cache.put("early", {"id": "u1"})
+    cache.put("late", {"id": "u2"})
+    cache.set_expiry("late", 20)
+    clock.advance(10)
+    assert cache.get("early") is None
+    assert cache.get("late") == {"id": "u2"}
+    clock.advance(10)
+    assert cache.get("late") is None
+
+def test_least_recently_used_token_is_evicted(cache):
+    cache.put("a", {"id": "a"})
+    cache.put("b", {"id": "b"})
+    cache.get("a")
+    cache.put("c", {"id": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"id": "a"}
+    assert cache.get("c") == {"id": "c"}
+
+def test_invalidate_and_listeners(cache):
+    seen = []
+    cache.add_listener(lambda token, user: seen.append((token, user["id"])))
+    cache.put("token", {"id": "u1"})
+    cache.invalidate("token")
+    assert cache.get("token") is None
+    assert seen == [("token", "u1")]
+
+def test_concurrent_fetches_share_one_load(cache):
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return {"id": "u1"}
+
+    async def run():
+        return await asyncio.gather(*(cache.fetch("token", load) for _ in range(5)))
+
+    assert asyncio.run(run()) == [{"id": "u1"}] * 5
+    assert calls == 1
+    assert cache.get("token") == {"id": "u1"}
+
+def test_failed_fetch_is_not_cached(cache):
+    async def load():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.resolve("token", load))
+    assert cache.get("token") is None
@@ -0,0 +1,82 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import spotify
+from app import token_cache as token_cache_module
+from app.routers import music
+from app.routers.music import VibeCache, compute_etag
+from app.token_cache import token_cache
+
+@pytest.fixture
+def cache(clock, monkeypatch) -> VibeCache:
+    monkeypatch.setattr(music, "time", clock)
+    return VibeCache(ttl=600, max_size=2)
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.put("u1", {"vibe": 1}, '"etag"')
+    clock.advance(599)
+    assert cache.get("u1") == ({"vibe": 1}, '"etag"')
+    clock.advance(1)
+    assert cache.get("u1") is None
+
+def test_least_recently_used_user_is_evicted(cache):
+    cache.put("a", {}, '"a"')
+    cache.put("b", {}, '"b"')
+    cache.get("a")
+    cache.put("c", {}, '"c"')
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+def test_etag_depends_only_on_content():
+    assert compute_etag({"a": 1, "b": [2]}) == compute_etag({"b": [2], "a": 1})
+    assert compute_etag({"a": 1}) != compute_etag({"a": 2})
+
+@pytest.fixture
+def client(cache, monkeypatch) -> TestClient:
+    monkeypatch.setattr(music, "vibe_cache", cache)
+    token_cache.put("cached-token", {"id": "u1"})
+    app = FastAPI()
+    app.include_router(music.router, prefix="/api/music")
+    yield TestClient(app)
+    token_cache.invalidate("cached-token")
+
+def test_cached_analysis_is_served_without_spotify(client, cache):
+    payload = {"topArtists": [], "topGenres": [], "recentTracks": []}
+    cache.put("u1", payload, compute_etag(payload))
+
+    response = client.get("/api/music/vibe-analysis/cached-token")
+    assert response.status_code == 200
+    assert response.json() == payload
+    etag = response.headers["ETag"]
+    assert etag == compute_etag(payload)
+
+    response = client.get("/api/music/vibe-analysis/cached-token", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_cached_analysis_outlives_the_token_cache(client, cache, clock, monkeypatch):
+    requested = []
+    def handle(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        if request.url.path.endswith("/me"):
+            return httpx.Response(200, json={"id": "u2"})
+        return httpx.Response(200, json={"items": []})
+
+    monkeypatch.setattr(token_cache_module, "time", clock)
+    monkeypatch.setattr(spotify, "_http_client", httpx.AsyncClient(
+        base_url="https://spotify.test/v1", transport=httpx.MockTransport(handle)))
+    monkeypatch.setattr(spotify, "spotify_api", spotify.SpotifyAPI(rate=1000, burst=100))
+
+    first = client.get("/api/music/vibe-analysis/fresh-token")
+    assert first.status_code == 200
+    assert sorted(requested) == ["/v1/me", "/v1/me/player/recently-played", "/v1/me/top/artists"]
+
+    # The token's user has expired from the token cache, but not its analysis
+    clock.advance(token_cache.ttl)
+    requested.clear()
+    second = client.get("/api/music/vibe-analysis/fresh-token")
+    assert second.json() == first.json()
+    assert requested == ["/v1/me"]
+    token_cache.invalidate("fresh-token")
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app.storage.weaviate_store import WeaviateStore
+
+class HangingClient:
+    """Async client stand-in that, like weaviate's, flags itself connected before the connection is up"""
+
+    def __init__(self):
+        self.connected = False
+        self.connects = 0
+        self.closes = 0
+        self.connection_up = asyncio.Event()
+        self.fail = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    async def connect(self):
+        self.connects += 1
+        self.connected = True
+        await self.connection_up.wait()
+        if self.fail:
+            raise ConnectionError("connection refused")
+
+    async def close(self):
+        self.closes += 1
+        self.connected = False
+
+def test_timed_out_caller_does_not_cancel_the_connect():
+    async def run():
+        client = HangingClient()
+        store = WeaviateStore(client)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.connect(), 0.01)
+        # Later callers wait on the same attempt instead of trusting the flag
+        waiting = asyncio.ensure_future(store.connect())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        client.connection_up.set()
+        await waiting
+        await store.connect()
+        return client
+
+    client = asyncio.run(run())
+    assert client.connects == 1
+    assert client.closes == 0
+
+def test_failed_connect_is_closed_and_retried():
+    async def run():
+        client = HangingClient()
+        client.fail = True
+        client.connection_up.set()
+        store = WeaviateStore(client)
+        with pytest.raises(ConnectionError):
+            await store.connect()
+        assert not client.is_connected()
+        client.fail = False
+        await store.connect()
+        return client
+
+    client = asyncio.run(run())
+    assert client.connects == 2
+    assert client.closes == 1
+
+def test_close_cancels_a_connect_partway_through():
+    async def run():
+        client = HangingClient()
+        store = WeaviateStore(client)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(store.connect(), 0.01)
+        assert client.is_connected()
+        await store.close()
+        assert not client.is_connected()
+        # The half-open attempt is gone, so the next connect starts over
+        client.connection_up.set()
+        await store.connect()
+        return client
+
+    client = asyncio.run(run())
+    assert client.connects == 2
+    assert client.is_connected()
@@ -28,14 +28,22 @@ export default function Friends() {
   const loadFriends = async () => {
     if (!profile || !accessToken) return;
     try {
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/users/friends/${profile.spotifyId}`, {
-        headers: {
-          'access-token': accessToken
-        }
-      });
-      if (!response.ok) throw new Error('Failed to fetch friends');
-      const data = await response.json();
-      setFriends(data);
+      let loaded: Friend[] = [];
+      let cursor: string | null = null;
+      do {
+        const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response: Response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/users/friends/${profile.spotifyId}${query}`, {
+          headers: {
+            'access-token': accessToken
+          }
+        });
+        if (!response.ok) throw new Error('Failed to fetch friends');
+        const page: Friend[] = await response.json();
+        // Show each page as it arrives instead of waiting for the whole list
+        loaded = [...loaded, ...page];
+        setFriends(loaded);
+        cursor = response.headers.get('X-Next-Cursor');
+      } while (cursor);
     } catch (error) {
       console.error('Error loading friends:', error);
       setError('Failed to load friends. Please try again later.');